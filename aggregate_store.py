@@ -0,0 +1,420 @@
+"""
+Bucketed Statistics Aggregates
+Per-game statistics aggregates kept per calendar month, so a refresh only
+recomputes the months that received new or changed draws.
+
+Layout (one file per game_type, '/' replaced by '-'):
+
+    pcso_aggregates/
+        6-58.npz    months, rows, signature and every stats_engine aggregate
+                    array stacked along a leading month axis
+
+A refresh after a write is told the (game_type, date) keys the write
+changed and the store version it started from. Only the months of those
+keys are aggregated again, and the frequency indexes, co-occurrence
+matrices and static shards are told the same keys, so none of them reads
+or hashes the rest of the history. REFRESHED_FILE records the store
+version every output was last brought up to; when it is not the version
+the write started from (an earlier refresh failed, or the outputs are
+new), or no keys are given, the refresh checks everything instead.
+
+For that full check each bucket stores a signature of its rows in the
+column store: the row count and wrapping 64-bit sums of the row digests,
+days, jackpot bits and winners, recomputed for the whole column store in
+one vectorized pass; only buckets whose signature differs are aggregated
+again. Totals and date ranges are sums over bucket slices; only the
+partial months at the edges of a range are read from the raw columns.
+"""
+import json
+import os
+import time
+
+import numpy as np
+
+import metrics
+from column_store import ColumnStore, date_to_day, game_dir_name, row_digests, store_version
+from cooccurrence import COOCCURRENCE_DIR, CooccurrenceStore
+from draw_events import publish_changes
+from frequency_index import FREQUENCY_DIR, FrequencyStore
+from refresh_lock import refresh_lock
+from static_export import EXPORT_DIR, export_static
+from stats_engine import (ARRAY_KEYS, STATS_FILE, empty_aggregate, game_aggregate,
+                          merge_aggregates, render_statistics, write_statistics)
+
+AGGREGATE_DIR = "pcso_aggregates"
+
+# Bumped when the meaning of a stored aggregate changes; older files rebuild
+AGGREGATE_FORMAT = 3
+
+# Store version that every refresh_statistics output was last brought up to
+REFRESHED_FILE = "refreshed.json"
+
+# Odd multiplier mixing a row digest before its day is added
+_MIX = np.uint64(0x9E3779B97F4A7C15)
+
+
+def day_months(days):
+    """Months since 1970-01 for an array of days since 1970-01-01"""
+    return np.asarray(days, dtype='datetime64[D]').astype('datetime64[M]').astype(np.int32)
+
+
+def month_start_day(month):
+    """First day (days since 1970-01-01) of a month since 1970-01"""
+    return int(np.datetime64(int(month), 'M').astype('datetime64[D]').astype(np.int64))
+
+
+def _row_signatures(columns, lo, hi):
+    """uint64 rows x 5 of the row count, digest, day, jackpot bits and winners"""
+    days = np.asarray(columns.days[lo:hi]).astype(np.int64).view(np.uint64)
+    return np.column_stack((
+        np.ones(len(days), np.uint64),
+        row_digests(columns.numbers[lo:hi]) * _MIX + days,
+        days,
+        np.ascontiguousarray(columns.jackpot[lo:hi], dtype=np.float64).view(np.uint64),
+        np.asarray(columns.winners[lo:hi]).astype(np.int64).view(np.uint64)
+    ))
+
+
+def _signatures(columns):
+    """
+    (months, row bounds, signature matrix) of the month buckets of a game.
+    The sums wrap around, so they are exact for any history.
+    """
+    days = np.asarray(columns.days)
+    if not len(days):
+        return np.zeros(0, np.int32), np.zeros(1, np.int64), np.zeros((0, 5), np.uint64)
+
+    months = day_months(days)
+    starts = np.flatnonzero(np.diff(months)) + 1
+    bounds = np.concatenate(([0], starts, [len(days)])).astype(np.int64)
+    signature = np.add.reduceat(_row_signatures(columns, 0, len(days)), bounds[:-1], axis=0)
+    return months[bounds[:-1]], bounds, signature
+
+
+def changed_days(keys):
+    """{game_type: sorted unique days} of (game_type, date) keys"""
+    days = {}
+    for game_type, date in keys:
+        days.setdefault(game_type, []).append(date_to_day(date))
+    return {game_type: np.unique(np.array(values, dtype=np.int32)) for game_type, values in days.items()}
+
+
+class GameBuckets:
+    """
+    The month buckets of one game, stacked into arrays
+    """
+
+    def __init__(self, game_type, width, arrays=None):
+        self.game_type = game_type
+        self.width = width
+        if arrays is None:
+            template = empty_aggregate(game_type, width)
+            arrays = {key: np.zeros((0,) + template[key].shape, np.int64) for key in ARRAY_KEYS}
+            arrays.update(
+                months=np.zeros(0, np.int32),
+                signature=np.zeros((0, 5), np.uint64),
+                count=np.zeros(0, np.int64),
+                jackpot_sum=np.zeros(0, np.float64),
+                winners_sum=np.zeros(0, np.int64),
+                first_day=np.zeros(0, np.int32),
+                last_day=np.zeros(0, np.int32)
+            )
+        self.arrays = arrays
+
+    @property
+    def months(self):
+        return self.arrays["months"]
+
+    def __len__(self):
+        return len(self.months)
+
+    def _aggregate(self, rows):
+        """Sum of the buckets in a slice (or index array) of bucket positions"""
+        arrays = self.arrays
+        aggregate = empty_aggregate(self.game_type, self.width)
+        for key in ARRAY_KEYS:
+            aggregate[key] = arrays[key][rows].sum(axis=0)
+
+        count = arrays["count"][rows]
+        aggregate["count"] = int(count.sum())
+        aggregate["jackpot_sum"] = float(arrays["jackpot_sum"][rows].sum())
+        aggregate["winners_sum"] = int(arrays["winners_sum"][rows].sum())
+
+        first = arrays["first_day"][rows]
+        last = arrays["last_day"][rows]
+        if len(first):
+            aggregate["first_day"] = int(first.min())
+            aggregate["last_day"] = int(last.max())
+        return aggregate
+
+    def total(self):
+        return self._aggregate(slice(None))
+
+    def months_between(self, first_month, last_month):
+        """Aggregate of the buckets from first_month to last_month inclusive"""
+        lo = int(np.searchsorted(self.months, first_month, 'left'))
+        hi = int(np.searchsorted(self.months, last_month, 'right'))
+        return self._aggregate(slice(lo, max(lo, hi)))
+
+    def refresh(self, columns, days=None):
+        """
+        Bring the buckets in line with a game's columns. With days, the
+        days of every draw written since the last refresh, only their
+        months are aggregated again; otherwise every bucket's signature is
+        compared with the columns.
+
+        Returns the number of buckets that were aggregated again.
+        """
+        if days is None:
+            months, bounds, signature = _signatures(columns)
+
+            # Buckets whose month and signature are unchanged are kept as they are
+            known = {int(m): i for i, m in enumerate(self.months)}
+            stale = [
+                i for i, month in enumerate(months)
+                if int(month) not in known or not np.array_equal(signature[i], self.arrays["signature"][known[int(month)]])
+            ]
+            stale_months = months[stale]
+            lo, hi = bounds[stale], bounds[np.array(stale, dtype=np.int64) + 1]
+            removed = np.setdiff1d(self.months, months)
+        else:
+            candidates = np.unique(day_months(days))
+            starts = np.array([month_start_day(m) for m in candidates], dtype=np.int64)
+            ends = np.array([month_start_day(m + 1) for m in candidates], dtype=np.int64)
+            column_days = np.asarray(columns.days)
+            lo = np.searchsorted(column_days, starts, 'left')
+            hi = np.searchsorted(column_days, ends, 'left')
+            present = hi > lo
+            stale_months, lo, hi = candidates[present], lo[present], hi[present]
+            removed = np.intersect1d(self.months, candidates[~present])
+
+        aggregates = [
+            game_aggregate(self.game_type, columns.numbers[a:b], columns.days[a:b],
+                           columns.jackpot[a:b], columns.winners[a:b])
+            for a, b in zip(lo.tolist(), hi.tolist())
+        ]
+        signatures = [_row_signatures(columns, a, b).sum(axis=0, dtype=np.uint64)
+                      for a, b in zip(lo.tolist(), hi.tolist())]
+        self._replace(np.asarray(stale_months, dtype=np.int32), aggregates, signatures, removed)
+        return len(aggregates)
+
+    def _replace(self, months, aggregates, signatures, removed):
+        """Put the aggregates of months in place and drop the removed months"""
+        keep = ~np.isin(self.months, np.concatenate((months, removed)))
+        merged = np.concatenate((self.months[keep], months))
+        order = np.argsort(merged, kind='stable')
+
+        arrays = {"months": merged[order].astype(np.int32)}
+        new = {"signature": np.array(signatures, dtype=np.uint64)}
+        for key in ARRAY_KEYS + ("count", "jackpot_sum", "winners_sum", "first_day", "last_day"):
+            new[key] = np.array([aggregate[key] for aggregate in aggregates])
+        for key, values in new.items():
+            old = self.arrays[key]
+            values = values.reshape((len(months),) + old.shape[1:]).astype(old.dtype)
+            arrays[key] = np.concatenate((old[keep], values))[order]
+        self.arrays = arrays
+
+    def save(self, filename):
+        tmp_filename = f"{filename}.{os.getpid()}.tmp"
+        with open(tmp_filename, 'wb') as f:
+            np.savez(f, width=self.width, format=AGGREGATE_FORMAT, **self.arrays)
+        os.replace(tmp_filename, filename)
+
+    @classmethod
+    def load(cls, game_type, filename):
+        with np.load(filename) as data:
+            if "format" not in data.files or int(data["format"]) != AGGREGATE_FORMAT:
+                raise ValueError("written by another version")
+            arrays = {key: data[key] for key in data.files if key not in ("width", "format")}
+            return cls(game_type, int(data["width"]), arrays)
+
+
+class AggregateStore:
+    """
+    Month-bucket aggregates for every game in the column store
+    """
+
+    def __init__(self, directory=AGGREGATE_DIR, store=None):
+        self.directory = directory
+        self.store = store or ColumnStore()
+        self._games = {}
+
+    def _filename(self, game_type):
+        return os.path.join(self.directory, game_dir_name(game_type) + ".npz")
+
+    def buckets(self, game_type):
+        """
+        The buckets of one game, loaded from disk or built on first use
+        """
+        if game_type not in self._games:
+            columns = self.store.load(game_type)
+            width = columns.numbers.shape[1]
+            filename = self._filename(game_type)
+
+            buckets = None
+            if os.path.exists(filename):
+                try:
+                    buckets = GameBuckets.load(game_type, filename)
+                except (OSError, ValueError, KeyError) as e:
+                    print(f"Ignoring unreadable aggregates {filename}: {e}")
+            if buckets is None or buckets.width != width:
+                buckets = GameBuckets(game_type, width)
+            self._games[game_type] = buckets
+        return self._games[game_type]
+
+    def refresh(self, changed=None):
+        """
+        Update the buckets of every game from the column store and save the
+        games that changed. changed is {game_type: days} of the draws
+        written since the last refresh, or None to check every bucket.
+        Returns {game_type: buckets aggregated again}.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        updated = {}
+        game_types = self.store.game_types()
+
+        for game_type in game_types:
+            if changed is not None and game_type not in changed and os.path.exists(self._filename(game_type)):
+                updated[game_type] = 0
+                continue
+            buckets = self.buckets(game_type)
+            days = changed.get(game_type) if changed is not None else None
+            if days is not None and not len(buckets):
+                # Buckets that are new or were unreadable are built in full
+                days = None
+            stale = buckets.refresh(self.store.load(game_type), days)
+            if stale or not os.path.exists(self._filename(game_type)):
+                buckets.save(self._filename(game_type))
+            updated[game_type] = stale
+
+        # Games that left the store lose their aggregates
+        for name in os.listdir(self.directory):
+            if name.endswith(".npz") and name[:-4] not in {game_dir_name(g) for g in game_types}:
+                os.remove(os.path.join(self.directory, name))
+        self._games = {g: b for g, b in self._games.items() if g in game_types}
+
+        return updated
+
+    def query(self, game_type, from_date=None, to_date=None):
+        """
+        Aggregate of a game's draws in [from_date, to_date] (YYYY-MM-DD, optional).
+
+        Whole months come from the buckets; draws in partial months at either
+        end are aggregated from the raw columns.
+        """
+        buckets = self.buckets(game_type)
+        if from_date is None and to_date is None:
+            return buckets.total()
+
+        columns = self.store.load(game_type)
+        from_day = date_to_day(from_date) if from_date else None
+        to_day = date_to_day(to_date) if to_date else None
+
+        first_month = int(day_months([from_day])[0]) if from_day is not None else None
+        if first_month is not None and month_start_day(first_month) != from_day:
+            first_month += 1
+        last_month = int(day_months([to_day])[0]) if to_day is not None else None
+        if last_month is not None and month_start_day(last_month + 1) != to_day + 1:
+            last_month -= 1
+
+        if first_month is not None and last_month is not None and first_month > last_month:
+            return self._raw(columns, from_day, to_day)
+
+        lo_month = first_month if first_month is not None else np.iinfo(np.int32).min
+        hi_month = last_month if last_month is not None else np.iinfo(np.int32).max
+        aggregate = buckets.months_between(lo_month, hi_month)
+
+        if first_month is not None:
+            aggregate = merge_aggregates(self._raw(columns, from_day, month_start_day(first_month) - 1), aggregate)
+        if last_month is not None:
+            aggregate = merge_aggregates(aggregate, self._raw(columns, month_start_day(last_month + 1), to_day))
+        return aggregate
+
+    def _raw(self, columns, from_day, to_day):
+        days = columns.days
+        lo = 0 if from_day is None else int(np.searchsorted(days, from_day, 'left'))
+        hi = len(days) if to_day is None else int(np.searchsorted(days, to_day, 'right'))
+        hi = max(lo, hi)
+        return game_aggregate(columns.game_type, columns.numbers[lo:hi], days[lo:hi],
+                              columns.jackpot[lo:hi], columns.winners[lo:hi])
+
+    def statistics(self, from_date=None, to_date=None):
+        """
+        The pcso_statistics.json document, optionally for a date range
+        """
+        aggregates = {}
+        names = {}
+        for game_type in self.store.game_types():
+            aggregates[game_type] = self.query(game_type, from_date, to_date)
+            names[game_type] = self.store.load(game_type).game_name
+        return render_statistics(aggregates, names)
+
+
+def _refreshed_version(directory):
+    try:
+        with open(os.path.join(directory, REFRESHED_FILE), 'r') as f:
+            return json.load(f)["version"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def _set_refreshed_version(directory, version):
+    filename = os.path.join(directory, REFRESHED_FILE)
+    tmp_filename = f"{filename}.{os.getpid()}.tmp"
+    with open(tmp_filename, 'w') as f:
+        json.dump({"version": version}, f)
+    os.replace(tmp_filename, filename)
+
+
+def refresh_statistics(store=None, directory=AGGREGATE_DIR, filename=STATS_FILE,
+                       frequency_directory=FREQUENCY_DIR, cooccurrence_directory=COOCCURRENCE_DIR,
+                       export_directory=EXPORT_DIR, changed=None, since=None):
+    """
+    Update the month buckets, the prefix-sum frequency indexes, the
+    co-occurrence matrices and the static shards from the column store,
+    rewrite the statistics file from the buckets and log the changed draws
+    for /api/stream.
+
+    changed is the (game_type, date) keys of the draws a write changed,
+    starting from store version since; only those draws are processed
+    when the outputs were last refreshed to that version. Without them
+    everything is checked.
+    Returns {game_type: buckets aggregated again}.
+    """
+    with refresh_lock():
+        store = store or ColumnStore()
+        if changed is not None and (since is None or _refreshed_version(directory) != since):
+            changed = None
+        by_game = changed_days(changed) if changed is not None else None
+
+        aggregates = AggregateStore(directory, store)
+        with metrics.timer('pcso_phase_seconds', phase='aggregates'):
+            updated = aggregates.refresh(by_game)
+        with metrics.timer('pcso_phase_seconds', phase='statistics_file'):
+            write_statistics(aggregates.statistics(), filename)
+        metrics.inc('pcso_bytes_written_total', os.path.getsize(filename), output='statistics_file')
+        with metrics.timer('pcso_phase_seconds', phase='frequency_index'):
+            FrequencyStore(frequency_directory, store).refresh(by_game)
+        with metrics.timer('pcso_phase_seconds', phase='cooccurrence'):
+            CooccurrenceStore(cooccurrence_directory, store).refresh(by_game)
+        with metrics.timer('pcso_phase_seconds', phase='static_export'):
+            export = export_static(store, export_directory, by_game)
+        metrics.inc('pcso_bytes_written_total', export["written_bytes"], output='static_export')
+        version = store_version(store.directory)
+        with metrics.timer('pcso_phase_seconds', phase='events'):
+            publish_changes(export, version, export_directory)
+        _set_refreshed_version(directory, version)
+    return updated
+
+
+def main():
+    started = time.perf_counter()
+    updated = refresh_statistics()
+    elapsed = time.perf_counter() - started
+    for game_type, stale in sorted(updated.items()):
+        print(f"  {game_type}: {stale} month buckets updated")
+    print(f"Statistics saved to {STATS_FILE} in {elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Dashboard Analytics
+The numbers behind the dashboard's eight analysis charts (hot numbers,
+even/odd, range distribution, consecutive numbers, sum range, last digit,
+gaps and hot vs cold) for a (game, from, to) query.
+
+Everything is derived from one stats_engine aggregate of the selected rows
+of the column store, plus one extra bincount for the low-mid-high patterns.
+Results are memoized in an LRU cache keyed on the query and the store
+version, and the cache is emptied when a refresh publishes a new version.
+"""
+import numpy as np
+
+from draw_index import QueryCache
+from draw_record import is_lotto_game
+from stats_engine import game_aggregate, max_number, render_game
+
+HOT_NUMBERS = 15
+HOT_COLD = 10
+TOP_NUMBERS = 10
+
+CACHE_SIZE = 256
+
+
+def _selected_numbers(index, game_type, from_date, to_date):
+    """
+    (max number, draws x 6 matrix) of the lotto draws a query selects.
+    With no game, all 6/xx games are combined like the dashboard does.
+    """
+    if game_type:
+        if not is_lotto_game(game_type):
+            raise ValueError("Analytics are only available for the 6/xx lotto games")
+        game_types = [game_type] if game_type in index.games else []
+    else:
+        game_types = [g for g in index.game_types if is_lotto_game(g)]
+
+    blocks = [np.asarray(index.games[g].between(from_date, to_date).numbers) for g in game_types]
+    blocks = [block for block in blocks if len(block)]
+    top = max((max_number(g) for g in game_types), default=max_number(game_type or "6/58"))
+    if not blocks:
+        return top, np.zeros((0, 6), np.uint8)
+    width = max(block.shape[1] for block in blocks)
+    blocks = [block for block in blocks if block.shape[1] == width]
+    return top, np.concatenate(blocks)
+
+
+def _ranked(freq, low, top):
+    """(number, count) pairs, most frequent first; ties by number"""
+    numbers = np.arange(low, top + 1)
+    counts = freq[low:top + 1]
+    order = np.lexsort((numbers, -counts))
+    return [(int(numbers[i]), int(counts[i])) for i in order]
+
+
+def compute_analytics(top, numbers):
+    """
+    Chart data for a draws x k matrix of lotto numbers from 1 to top
+    """
+    pseudo_game = f"6/{top}"
+    aggregate = game_aggregate(pseudo_game, numbers)
+    entry = render_game(pseudo_game, None, aggregate)
+    freq = aggregate["number_freq"]
+    width = numbers.shape[1]
+    third = top // 3
+
+    ranked = _ranked(freq, 1, top)
+    drawn = [pair for pair in ranked if pair[1]]
+
+    # Per-draw low-mid-high pattern, encoded as low * (width + 1) + mid
+    valid = numbers[(numbers <= top).all(axis=1)]
+    low = (valid <= third).sum(axis=1)
+    mid = ((valid > third) & (valid <= 2 * third)).sum(axis=1)
+    patterns = np.bincount(low * (width + 1) + mid, minlength=(width + 1) ** 2)
+    range_patterns = {}
+    for code in np.argsort(-patterns, kind='stable'):
+        if not patterns[code]:
+            break
+        lows, mids = divmod(int(code), width + 1)
+        range_patterns[f"{lows}-{mids}-{width - lows - mids}"] = int(patterns[code])
+
+    gaps = aggregate["gap_hist"]
+    gap_total = int(gaps.sum())
+
+    return {
+        "draws": aggregate["count"],
+        "max_number": top,
+        "hot_numbers": drawn[:HOT_NUMBERS],
+        "even_odd": entry["even_odd"],
+        "range_distribution": dict(
+            entry["range_distribution"],
+            bounds={"low": [1, third], "mid": [third + 1, 2 * third], "high": [2 * third + 1, top]},
+            patterns=range_patterns
+        ),
+        "consecutive": entry["consecutive"],
+        "sum_range": entry["sum"],
+        "last_digit": entry["last_digit"],
+        "gaps": {
+            "frequency": entry["gap_frequency"],
+            "average": round(float((np.arange(len(gaps)) * gaps).sum()) / gap_total, 2) if gap_total else None
+        },
+        "hot_cold": {
+            "hot": ranked[:HOT_COLD],
+            "cold": ranked[-HOT_COLD:][::-1]
+        },
+        "top_numbers": [number for number, _ in drawn[:TOP_NUMBERS]]
+    }
+
+
+def _analytics(index, game_type=None, from_date=None, to_date=None):
+    return compute_analytics(*_selected_numbers(index, game_type, from_date, to_date))
+
+
+analytics_cache = QueryCache(_analytics, CACHE_SIZE)
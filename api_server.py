@@ -1,56 +1,497 @@
-from flask import Flask, jsonify
+from flask import Flask, Response, abort, g, jsonify, redirect, request, send_file
 from flask_cors import CORS
-import subprocess
+from werkzeug.utils import safe_join
+import gzip
+import hashlib
+import json
 import os
+import re
+import time
+
+import metrics
+from refresh_jobs import RefreshQueue
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 app = Flask(__name__)
 CORS(app)
+# Port of the event stream server, set by serve.py
+app.config['STREAM_PORT'] = 5001
+
+refresh_queue = RefreshQueue()
+
+# Responses smaller than this are sent uncompressed
+MIN_COMPRESS_BYTES = 1024
+
+# Files of the static site served next to the API
+STATIC_FILES = ("dashboard.html", "index.html", "pcso_lotto_data.json", "pcso_statistics.json")
+DATA_DIR = "pcso_data"
+
+# Shard names carry their content hash, so they never change
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+# Tells the dashboard to call the API on its own origin
+API_BASE_META = b'<meta name="api-base" content="">'
+
+
+def _etag(*parts):
+    return hashlib.sha1(json.dumps(parts).encode('utf-8')).hexdigest()[:20]
+
+
+def _cached_json(payload, etag):
+    """
+    JSON response with an ETag, compressed like _compressed_json.
+    A matching If-None-Match gets an empty 304.
+    """
+    headers = {
+        'ETag': f'"{etag}"',
+        'Cache-Control': 'no-cache'
+    }
+    if etag in request.if_none_match:
+        return Response(status=304, headers=dict(headers, Vary='Accept-Encoding'))
+    return _compressed_json(payload, headers)
+
+
+def _compressed_json(payload, headers=None):
+    """
+    JSON response, compressed with brotli or gzip when the client accepts it
+    """
+    headers = dict(headers or {}, Vary='Accept-Encoding')
+    body = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    accepted = request.accept_encodings
+    if len(body) >= MIN_COMPRESS_BYTES:
+        if brotli is not None and accepted['br']:
+            body = brotli.compress(body, quality=5)
+            headers['Content-Encoding'] = 'br'
+        elif accepted['gzip']:
+            body = gzip.compress(body, compresslevel=6)
+            headers['Content-Encoding'] = 'gzip'
+
+    return Response(body, mimetype='application/json', headers=headers)
+
+
+def _draw_index():
+    # NumPy and the store are loaded by the first query, not at startup
+    from draw_index import current_index
+    return current_index()
+
+
+def _int_arg(name, default):
+    value = request.args.get(name, '')
+    if not value:
+        return default
+    if not value.isdigit() or int(value) < 1:
+        raise ValueError(f"{name} must be a positive integer")
+    return int(value)
+
+@app.before_request
+def start_timer():
+    g.started = time.perf_counter()
+
+@app.after_request
+def record_latency(response):
+    # Streams are timed until their headers are sent
+    started = g.get('started')
+    if started is not None:
+        metrics.observe('pcso_api_request_seconds', time.perf_counter() - started,
+                        endpoint=request.endpoint or 'unknown', status=f"{response.status_code // 100}xx")
+    return response
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics_text():
+    """
+    Pipeline and API metrics of every server worker and pipeline run, in
+    the Prometheus text format
+    """
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/api/update-data', methods=['POST'])
 def update_data():
+    """
+    Start a background refresh and return its job id right away.
+    Concurrent triggers share the running job. With profile=1 a new job
+    runs under cProfile.
+    """
+    job, created = refresh_queue.submit(force=request.args.get('force') == '1',
+                                        profile=request.args.get('profile') == '1')
+    return jsonify({
+        'success': True,
+        'job_id': job.id,
+        'created': created,
+        'job': job.to_dict()
+    }), 202
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = refresh_queue.get(job_id)
+    if job is None:
+        return jsonify({
+            'success': False,
+            'error': f'Unknown job: {job_id}'
+        }), 404
+    return jsonify({
+        'success': True,
+        'job': job.to_dict()
+    })
+
+@app.route('/api/draws', methods=['GET'])
+def draws():
+    """
+    One page of draws, newest first, filtered by game and date range
+    """
+    game = request.args.get('game') or None
+    if game == 'all':
+        game = None
+    from_date = request.args.get('from') or None
+    to_date = request.args.get('to') or None
+
     try:
-        # Run fetch_pcso_data.py
-        print("Running fetch_pcso_data.py...")
-        result1 = subprocess.run(['python', 'fetch_pcso_data.py'], 
-                                capture_output=True, 
-                                text=True, 
-                                timeout=60)
-        
-        # Run import_csv.py
-        print("Running import_csv.py...")
-        result2 = subprocess.run(['python', 'import_csv.py'], 
-                                capture_output=True, 
-                                text=True, 
-                                timeout=60)
-        
-        # Check if files exist
-        data_exists = os.path.exists('pcso_lotto_data.json')
-        stats_exists = os.path.exists('pcso_statistics.json')
-        
+        page = _int_arg('page', 1)
+        per_page = _int_arg('per_page', 15)
+        index = _draw_index()
+        if index is None:
+            return jsonify({
+                'success': False,
+                'error': 'No draw data yet, run a data update first'
+            }), 503
+
+        etag = _etag('draws', index.version, game, from_date, to_date, page, per_page)
+        if etag in request.if_none_match:
+            return _cached_json(None, etag)
+
+        result = index.page(game, from_date, to_date, page=page, per_page=per_page)
+    except ValueError as e:
         return jsonify({
-            'success': True,
-            'message': 'Data updated successfully',
-            'files_created': {
-                'pcso_lotto_data.json': data_exists,
-                'pcso_statistics.json': stats_exists
-            },
-            'fetch_output': result1.stdout,
-            'import_output': result2.stdout
-        })
-    except subprocess.TimeoutExpired:
+            'success': False,
+            'error': str(e)
+        }), 400
+
+    return _cached_json({
+        'success': True,
+        'game': game or 'all',
+        'from': from_date,
+        'to': to_date,
+        'page': result['page'],
+        'per_page': result['per_page'],
+        'total': result['total'],
+        'pages': result['pages'],
+        'version': index.version,
+        'results': result['results']
+    }, etag)
+
+@app.route('/api/frequency', methods=['GET'])
+def frequency():
+    """
+    Number frequencies over a date range, most frequent first
+    """
+    game = request.args.get('game') or None
+    if game == 'all':
+        game = None
+    from_date = request.args.get('from') or None
+    to_date = request.args.get('to') or None
+
+    try:
+        index = _draw_index()
+        if index is None:
+            return jsonify({
+                'success': False,
+                'error': 'No draw data yet, run a data update first'
+            }), 503
+
+        etag = _etag('frequency', index.version, game, from_date, to_date)
+        if etag in request.if_none_match:
+            return _cached_json(None, etag)
+
+        counts, draws = index.number_frequency(game, from_date, to_date)
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+    ranked = sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+    return _cached_json({
+        'success': True,
+        'game': game or 'all',
+        'from': from_date,
+        'to': to_date,
+        'draws': draws,
+        'frequency': [[number, count] for number, count in ranked if count],
+        'version': index.version
+    }, etag)
+
+@app.route('/api/analytics', methods=['GET'])
+def analytics():
+    """
+    Data for all of the dashboard's analysis charts for one query
+    """
+    game = request.args.get('game') or None
+    if game == 'all':
+        game = None
+    from_date = request.args.get('from') or None
+    to_date = request.args.get('to') or None
+
+    try:
+        index = _draw_index()
+        if index is None:
+            return jsonify({
+                'success': False,
+                'error': 'No draw data yet, run a data update first'
+            }), 503
+
+        etag = _etag('analytics', index.version, game, from_date, to_date)
+        if etag in request.if_none_match:
+            return _cached_json(None, etag)
+
+        from analytics import analytics_cache
+        result = analytics_cache.get(index, game, from_date, to_date)
+    except ValueError as e:
         return jsonify({
             'success': False,
-            'error': 'Script execution timed out'
-        }), 500
-    except Exception as e:
+            'error': str(e)
+        }), 400
+
+    return _cached_json(dict(result, success=True, game=game or 'all', version=index.version), etag)
+
+@app.route('/api/rolling', methods=['GET'])
+def rolling():
+    """
+    Rolling-window frequency series of chosen numbers:
+    ?numbers=3,17,42&window=30&step=1 plus the usual game/from/to filters
+    """
+    game = request.args.get('game') or None
+    if game == 'all':
+        game = None
+    from_date = request.args.get('from') or None
+    to_date = request.args.get('to') or None
+
+    try:
+        numbers = tuple(int(n) for n in request.args.get('numbers', '').split(',') if n.strip())
+        window = _int_arg('window', 30)
+        step = _int_arg('step', 1)
+
+        index = _draw_index()
+        if index is None:
+            return jsonify({
+                'success': False,
+                'error': 'No draw data yet, run a data update first'
+            }), 503
+
+        etag = _etag('rolling', index.version, game, from_date, to_date, numbers, window, step)
+        if etag in request.if_none_match:
+            return _cached_json(None, etag)
+
+        from rolling import rolling_cache
+        result = rolling_cache.get(index, game, from_date, to_date, numbers, window, step)
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+    return _cached_json(dict(result, success=True, game=game or 'all', version=index.version), etag)
+
+@app.route('/api/cooccurrence', methods=['GET'])
+def cooccurrence():
+    """
+    Top-k lookups in a game's transition and co-occurrence matrices:
+    ?game=6/58&kind=transitions|pairs|triples&numbers=7,12&k=10
+    """
+    game = request.args.get('game') or None
+    kind = request.args.get('kind', 'pairs')
+
+    try:
+        if not game or game == 'all':
+            raise ValueError("game must be one 6/xx lotto game")
+        numbers = tuple(int(n) for n in request.args.get('numbers', '').split(',') if n.strip())
+        k = min(_int_arg('k', 10), 100)
+
+        index = _draw_index()
+        if index is None:
+            return jsonify({
+                'success': False,
+                'error': 'No draw data yet, run a data update first'
+            }), 503
+
+        etag = _etag('cooccurrence', index.version, game, kind, numbers, k)
+        if etag in request.if_none_match:
+            return _cached_json(None, etag)
+
+        result = index.cooccurrence.query(game, kind, numbers, k)
+    except ValueError as e:
         return jsonify({
             'success': False,
             'error': str(e)
-        }), 500
+        }), 400
+
+    return _cached_json({
+        'success': True,
+        'game': game,
+        'kind': kind,
+        'k': k,
+        'draws': len(index.cooccurrence.game(game)),
+        'version': index.version,
+        'results': result
+    }, etag)
+
+@app.route('/api/significance', methods=['GET'])
+def significance():
+    """
+    Empirical p-values and 95% bands of a game's statistics against the
+    Monte Carlo null model, over the most recent draws of the range that
+    fill one of the model's history lengths. Returns 202 while that model
+    is being simulated in the background.
+    """
+    game = request.args.get('game') or None
+    from_date = request.args.get('from') or None
+    to_date = request.args.get('to') or None
+
+    try:
+        if not game or game == 'all':
+            raise ValueError("game must be one game type")
+
+        index = _draw_index()
+        if index is None:
+            return jsonify({
+                'success': False,
+                'error': 'No draw data yet, run a data update first'
+            }), 503
+        if game not in index.games:
+            raise ValueError(f"No draws for {game}")
+
+        etag = _etag('significance', index.version, game, from_date, to_date)
+        if etag in request.if_none_match:
+            return _cached_json(None, etag)
+
+        from null_model import null_models
+        numbers = index.games[game].between(from_date, to_date).numbers
+        result = null_models.significance(game, numbers, wait=False)
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+    if result is None:
+        response = jsonify({
+            'success': True,
+            'pending': True,
+            'message': 'The null model for this range is being simulated, try again shortly'
+        })
+        response.headers['Retry-After'] = '5'
+        return response, 202
+
+    return _cached_json(dict(result, success=True, game=game, version=index.version), etag)
+
+@app.route('/api/tickets/check', methods=['POST'])
+def check_tickets():
+    """
+    Check a batch of tickets against every draw of a game.
+    Body: {"game": "6/58", "tickets": [[1, 2, 3, 4, 5, 6], ...], "min_matches": 4}
+    """
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        body = {}
+    game = body.get('game')
+    tickets = body.get('tickets')
+
+    try:
+        if not isinstance(tickets, list):
+            raise ValueError("tickets must be a list of number lists")
+        min_matches = int(body.get('min_matches', 4))
+
+        index = _draw_index()
+        if index is None:
+            return jsonify({
+                'success': False,
+                'error': 'No draw data yet, run a data update first'
+            }), 503
+
+        from ticket_index import check_tickets as check
+        result = check(index, game, tickets, min_matches)
+    except (TypeError, ValueError) as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+    return _compressed_json(dict(result, success=True, game=game, version=index.version))
+
+@app.route('/api/stream', methods=['GET'])
+def stream():
+    """
+    Server-sent events: "draws" with the draws and aggregate deltas of every
+    data change, "reload" when a change is too large to send as a delta.
+    The streams are served by draw_events.StreamServer on its own port, so
+    this redirects there; reconnects resume after the Last-Event-ID.
+    """
+    from urllib.parse import urlencode
+    host = re.sub(r':\d+$', '', request.host)
+    url = f"{request.scheme}://{host}:{app.config['STREAM_PORT']}/api/stream"
+    last_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    if last_id:
+        url += '?' + urlencode({'last_event_id': last_id})
+    return redirect(url, code=307)
+
+def _revalidated(response):
+    # Every use checks the ETag, so a new export shows up on the next load
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/')
+def dashboard():
+    """The dashboard, set up to use this server's API"""
+    with open('dashboard.html', 'rb') as f:
+        body = f.read().replace(b'<head>', b'<head>\n    ' + API_BASE_META, 1)
+    response = Response(body, mimetype='text/html')
+    response.set_etag(hashlib.sha1(body).hexdigest()[:20])
+    return _revalidated(response.make_conditional(request))
+
+@app.route('/<filename>')
+def static_file(filename):
+    if filename == 'dashboard.html':
+        return dashboard()
+    if filename not in STATIC_FILES or not os.path.exists(filename):
+        abort(404)
+    return _revalidated(send_file(os.path.abspath(filename), conditional=True, etag=True))
+
+@app.route(f'/{DATA_DIR}/<filename>')
+def data_file(filename):
+    """
+    Exported shards, precompressed variant first, and their manifest
+    """
+    path = safe_join(DATA_DIR, filename)
+    if path is None or not filename.endswith(('.json', '.gz', '.br')) or not os.path.exists(path):
+        abort(404)
+    if filename == 'manifest.json':
+        return _revalidated(send_file(os.path.abspath(path), conditional=True, etag=True))
+
+    encoding = None
+    if filename.endswith('.json'):
+        accepted = request.accept_encodings
+        for name, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if accepted[name] and os.path.exists(path + suffix):
+                encoding, path = name, path + suffix
+                break
+    mimetype = 'application/json' if encoding or filename.endswith('.json') else None
+    response = send_file(os.path.abspath(path), mimetype=mimetype, conditional=True, etag=True)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    if filename.endswith('.json'):
+        response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = IMMUTABLE
+    return response
 
 @app.route('/api/health', methods=['GET'])
 def health():
     return jsonify({'status': 'ok'})
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    # The reloader runs the app in a child process; that one serves the streams
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        from draw_events import stream_server
+        stream_server.start(port=app.config['STREAM_PORT'])
+    app.run(host='0.0.0.0', port=5000, debug=True, threaded=True)
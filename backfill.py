@@ -0,0 +1,278 @@
+"""
+PCSO Backfill Engine
+Fetches a long date range as many small month or quarter windows.
+
+Windows are fetched concurrently by a bounded thread pool. All requests to
+one host share a token-bucket rate limit, failed windows are retried with
+exponential backoff, and every finished window is appended to a checkpoint
+file so an interrupted run can resume where it stopped.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, datetime, timedelta
+from urllib.parse import urlparse
+
+from fetch_pcso_data import PCSODataFetcher, PCSO_SEARCH_URL
+from response_cache import ResponseCache
+
+CHECKPOINT_FILE = "pcso_backfill.checkpoint.jsonl"
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: `rate` tokens per second, up to `capacity`
+    """
+
+    def __init__(self, rate, capacity=1):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Block until a token is available and take it
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def host_rate_limiter(url, rate, capacity=1):
+    """
+    Return the token bucket shared by every request to the host of url
+    """
+    host = urlparse(url).netloc
+    with _buckets_lock:
+        if host not in _buckets:
+            _buckets[host] = TokenBucket(rate, capacity)
+        return _buckets[host]
+
+
+def split_windows(start, end, unit="month"):
+    """
+    Split [start, end] into calendar month or quarter windows.
+
+    Returns a list of (first_day, last_day) date pairs; the first and last
+    windows are clipped to the requested range.
+    """
+    if unit not in ("month", "quarter"):
+        raise ValueError(f"Unknown window unit: {unit}")
+    months = 1 if unit == "month" else 3
+
+    windows = []
+    # Align the first window to the start of its month or quarter
+    month = start.month - (start.month - 1) % months
+    window_start = date(start.year, month, 1)
+
+    while window_start <= end:
+        next_month = window_start.month + months
+        next_start = date(window_start.year + (next_month - 1) // 12, (next_month - 1) % 12 + 1, 1)
+
+        windows.append((max(window_start, start), min(next_start - timedelta(days=1), end)))
+        window_start = next_start
+
+    return windows
+
+
+def window_key(window):
+    return f"{window[0].isoformat()}:{window[1].isoformat()}"
+
+
+class BackfillCheckpoint:
+    """
+    Append-only record of finished windows and their results.
+
+    Each line holds one window. A line cut short by a crash is ignored on
+    load, so that window is simply fetched again.
+    """
+
+    def __init__(self, filename=CHECKPOINT_FILE):
+        self.filename = filename
+        self.lock = threading.Lock()
+
+    def load(self):
+        """
+        Return {window_key: results} for every completed window
+        """
+        completed = {}
+        if not os.path.exists(self.filename):
+            return completed
+
+        with open(self.filename, 'r') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                completed[entry["window"]] = entry["results"]
+        return completed
+
+    def record(self, window, results):
+        line = json.dumps({"window": window_key(window), "results": results}, separators=(',', ':'))
+        with self.lock:
+            with open(self.filename, 'a') as f:
+                f.write(line + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def clear(self):
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+
+
+class BackfillEngine:
+    """
+    Fetch date windows concurrently with rate limiting, retries and resume
+    """
+
+    def __init__(self, base_url=None, workers=4, rate=0.5, burst=2,
+                 retries=4, backoff=2.0, checkpoint=None, cache=None):
+        self.base_url = base_url or PCSO_SEARCH_URL
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.rate_limiter = host_rate_limiter(self.base_url, rate, burst)
+        self.checkpoint = checkpoint if checkpoint is not None else BackfillCheckpoint()
+        # Shared by all workers; None uses the default on-disk response cache
+        self.cache = ResponseCache() if cache is None else (cache or None)
+        self._local = threading.local()
+
+    def _fetcher(self):
+        # requests.Session is not thread-safe, so each worker keeps its own
+        # fetcher and reuses its session and ViewState across windows
+        if not hasattr(self._local, "fetcher"):
+            self._local.fetcher = PCSODataFetcher(
+                base_url=self.base_url, rate_limiter=self.rate_limiter, cache=self.cache or False
+            )
+        return self._local.fetcher
+
+    def fetch_window(self, window):
+        """
+        Fetch one window, retrying with exponential backoff and jitter
+        """
+        start_str = window[0].strftime('%m/%d/%Y')
+        end_str = window[1].strftime('%m/%d/%Y')
+
+        for attempt in range(self.retries + 1):
+            try:
+                return self._fetcher().search_window(start_str, end_str)
+            except Exception as e:
+                if attempt == self.retries:
+                    raise
+                delay = self.backoff * (2 ** attempt) * (0.5 + random.random())
+                print(f"Window {window_key(window)} failed ({e}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+    def run(self, start, end, unit="month"):
+        """
+        Fetch every window between start and end.
+
+        Returns (results, failed_windows). Windows found in the checkpoint
+        are not fetched again.
+        """
+        windows = split_windows(start, end, unit)
+        completed = self.checkpoint.load()
+
+        results = []
+        pending = []
+        for window in windows:
+            key = window_key(window)
+            if key in completed:
+                results.extend(completed[key])
+            else:
+                pending.append(window)
+
+        print(f"Backfill: {len(windows)} {unit} windows, "
+              f"{len(windows) - len(pending)} already done, {len(pending)} to fetch")
+
+        failed = []
+        started = time.monotonic()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = {pool.submit(self.fetch_window, window): window for window in pending}
+
+            for done, future in enumerate(as_completed(futures), 1):
+                window = futures[future]
+                try:
+                    window_results = future.result()
+                except Exception as e:
+                    print(f"Window {window_key(window)} failed permanently: {e}")
+                    failed.append(window)
+                    continue
+
+                self.checkpoint.record(window, window_results)
+                results.extend(window_results)
+                print(f"[{done}/{len(pending)}] {window_key(window)}: {len(window_results)} results")
+
+        elapsed = time.monotonic() - started
+        fetched = len(pending) - len(failed)
+        if fetched:
+            print(f"Fetched {fetched} windows in {elapsed:.1f}s ({fetched / elapsed:.2f} windows/s)")
+
+        return results, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill PCSO results in concurrent date windows")
+    parser.add_argument('--days', type=int, default=3650, help="days of history to fetch (default: 3650)")
+    parser.add_argument('--unit', choices=['month', 'quarter'], default='month')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--rate', type=float, default=0.5, help="requests per second per host")
+    parser.add_argument('--burst', type=int, default=2, help="token bucket capacity")
+    parser.add_argument('--retries', type=int, default=4)
+    parser.add_argument('--base-url', default=None, help="search page URL, e.g. a replay server")
+    parser.add_argument('--checkpoint', default=CHECKPOINT_FILE)
+    parser.add_argument('--restart', action='store_true', help="ignore and clear an existing checkpoint")
+    parser.add_argument('--no-cache', action='store_true', help="do not read or write the response cache")
+    args = parser.parse_args()
+
+    checkpoint = BackfillCheckpoint(args.checkpoint)
+    if args.restart:
+        checkpoint.clear()
+
+    end = date.today()
+    start = end - timedelta(days=args.days)
+
+    engine = BackfillEngine(
+        base_url=args.base_url, workers=args.workers, rate=args.rate,
+        burst=args.burst, retries=args.retries, checkpoint=checkpoint,
+        cache=False if args.no_cache else None
+    )
+    results, failed = engine.run(start, end, unit=args.unit)
+
+    # The database merges them with the stored draws by (game_type, date)
+    fetcher = PCSODataFetcher()
+    fetcher.save_to_json(fetcher.merge_results([], results))
+
+    if failed:
+        print(f"\n{len(failed)} windows failed, run again to resume:")
+        for window in failed:
+            print(f"  {window_key(window)}")
+        sys.exit(1)
+
+    checkpoint.clear()
+    print(f"\nBackfill complete at {datetime.now().isoformat()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Walk-Forward Backtest
+Scores the prediction strategies against every historical draw of the 6/xx
+games.
+
+For each game the draws are replayed in date order: every strategy predicts
+draw i from draws 0..i-1 only, the prediction is scored by how many of its
+numbers were drawn, and draw i is then added to the strategy's PriorDraws.
+Each (game, strategy) pair runs as its own task in a process pool with a
+numpy Generator seeded from the run seed, the game and the strategy, so a
+run is reproducible whatever the worker count or scheduling.
+
+Results are written to pcso_backtest.json with the match distribution of
+every game and strategy and the mean a random ticket would get
+(6 * 6 / max_number).
+"""
+import argparse
+import json
+import os
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from column_store import STORE_DIR, ColumnStore
+from draw_record import is_lotto_game
+from stats_engine import max_number
+from strategies import PICKS, STRATEGIES, PriorDraws
+
+BACKTEST_FILE = "pcso_backtest.json"
+DEFAULT_SEED = 2024
+
+# Draws every strategy sees before its first scored prediction
+MIN_HISTORY = 20
+
+
+def _rng(seed, game_type, strategy):
+    key = zlib.crc32(f"{game_type}:{strategy}".encode('utf-8'))
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(key,)))
+
+
+def backtest_game(game_type, numbers, strategy, seed=DEFAULT_SEED, min_history=MIN_HISTORY):
+    """
+    Walk-forward score of one strategy over a game's draws (draws x 6, date order)
+    """
+    numbers = np.asarray(numbers)
+    top = max_number(game_type)
+    predict = STRATEGIES[strategy]
+    rng = _rng(seed, game_type, strategy)
+    started = time.perf_counter()
+
+    prior = PriorDraws(top, capacity=max(len(numbers), 1))
+    drawn = np.zeros(top + 2, bool)
+    matches = np.zeros(PICKS + 1, np.int64)
+
+    for row in numbers.tolist():
+        if prior.count >= min_history:
+            drawn[:] = False
+            drawn[np.minimum(row, top + 1)] = True
+            drawn[top + 1] = False
+            matches[int(drawn[predict(prior, rng)].sum())] += 1
+        prior.add(row)
+
+    predictions = int(matches.sum())
+    expected = PICKS * PICKS / top
+    mean = float((np.arange(PICKS + 1) * matches).sum()) / predictions if predictions else None
+    return {
+        "game_type": game_type,
+        "strategy": strategy,
+        "draws": len(numbers),
+        "predictions": predictions,
+        "match_counts": matches.tolist(),
+        "mean_matches": round(mean, 4) if mean is not None else None,
+        "random_mean": round(expected, 4),
+        "lift": round(mean / expected, 4) if mean is not None else None,
+        "three_plus_rate": round(float(matches[3:].sum()) / predictions, 5) if predictions else None,
+        "seconds": round(time.perf_counter() - started, 3)
+    }
+
+
+def _run_task(directory, game_type, strategy, seed, min_history):
+    columns = ColumnStore(directory).load(game_type)
+    return backtest_game(game_type, np.asarray(columns.numbers), strategy, seed, min_history)
+
+
+def run_backtest(directory=STORE_DIR, game_types=None, strategies=None, seed=DEFAULT_SEED,
+                 workers=None, min_history=MIN_HISTORY):
+    """
+    Backtest strategies on the 6/xx games of the column store in parallel.
+    Returns a list of result dicts, one per (game, strategy).
+    """
+    # Every worker reads the same published build, even if a refresh swaps it meanwhile
+    build = os.path.realpath(directory)
+    store = ColumnStore(build)
+    game_types = game_types or [g for g in store.game_types() if is_lotto_game(g)]
+    strategies = strategies or list(STRATEGIES)
+
+    unknown = [s for s in strategies if s not in STRATEGIES]
+    if unknown:
+        raise ValueError(f"Unknown strategies: {', '.join(unknown)}")
+    missing = [g for g in game_types if g not in store.game_types() or not is_lotto_game(g)]
+    if missing:
+        raise ValueError(f"No 6/xx draws for: {', '.join(missing)}")
+
+    tasks = [(build, g, s, seed, min_history) for g in game_types for s in strategies]
+    workers = workers or min(len(tasks), os.cpu_count() or 1)
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(_run_task, *zip(*tasks)))
+    return [_run_task(*task) for task in tasks]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Walk-forward backtest of the prediction strategies")
+    parser.add_argument('--games', nargs='*', help="game types, e.g. 6/58 6/42 (default: every 6/xx game)")
+    parser.add_argument('--strategies', nargs='*', choices=list(STRATEGIES))
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--workers', type=int, default=None, help="processes (default: one per CPU)")
+    parser.add_argument('--min-history', type=int, default=MIN_HISTORY)
+    parser.add_argument('--store', default=STORE_DIR)
+    parser.add_argument('--output', default=BACKTEST_FILE)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    results = run_backtest(args.store, args.games, args.strategies, args.seed,
+                           args.workers, args.min_history)
+    elapsed = time.perf_counter() - started
+
+    print(f"{'game':<6} {'strategy':<10} {'draws':>7} {'mean':>7} {'random':>7} {'lift':>6} {'3+ rate':>8}")
+    for result in results:
+        print(f"{result['game_type']:<6} {result['strategy']:<10} {result['predictions']:>7} "
+              f"{result['mean_matches'] or 0:>7.3f} {result['random_mean']:>7.3f} "
+              f"{result['lift'] or 0:>6.3f} {result['three_plus_rate'] or 0:>8.4f}")
+
+    with open(args.output, 'w') as f:
+        json.dump({
+            "generated_at": time.strftime('%Y-%m-%dT%H:%M:%S'),
+            "seed": args.seed,
+            "min_history": args.min_history,
+            "results": results
+        }, f, indent=2)
+    print(f"\nBacktested {len(results)} game/strategy pairs in {elapsed:.1f}s, saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,406 @@
+"""
+Pipeline Benchmarks
+Times the whole pipeline on seeded synthetic histories of every game,
+fully offline:
+
+    generate         synthetic_history for the scale
+    csv_import       import_csv_files of the history into an empty tree:
+                     parsing, database, JSON export, column store,
+                     statistics, indexes and static export, per phase
+    csv_append_day   import_csv_files of one more day in append mode
+    fetch_save_day   PCSODataFetcher.save_to_json of the next day's draws,
+                     the path of the daily fetch
+    html_parse       the recorded results page fixture, repeated up to the
+                     scale's number of draws (at most PARSE_MAX_ROWS)
+    statistics       rebuilding every statistics output from the store
+    store_load       opening the store and building the draw index
+    preload          everything serve.py loads before forking its workers
+    api              API endpoints through the Flask test client: the first
+                     request and the median and 95th percentile of the rest
+
+Each scale runs in its own temporary directory. The timings are appended
+to HISTORY_FILE under the current git commit and compared with the newest
+run of another commit on the same machine, so a regression shows up next
+to the change that caused it.
+
+Usage: python bench.py [--scales 1y,10y,100y] [--stress] [--seed N] [--requests N]
+                       [--history FILE] [--no-save] [--keep]
+"""
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+
+import numpy as np
+
+import metrics
+from bench_parser import FIXTURE, scale_fixture
+from column_store import STORE_DIR, day_to_date
+from synthetic_history import SEED, history, write_csv
+
+# Years of history per scale; stress is about two million draws
+SCALES = {"1y": 1, "10y": 10, "100y": 100, "stress": 1000}
+DEFAULT_SCALES = ("1y", "10y", "100y")
+
+HISTORY_FILE = "bench_history.json"
+
+# Rows of the scaled results page; a real page never gets near this
+PARSE_MAX_ROWS = 500_000
+
+# API requests per endpoint and tickets per ticket check
+REQUESTS = 50
+TICKETS = 100
+
+# Timings this much slower than the baseline, and by more than
+# MIN_REGRESSION_SECONDS, are reported as regressions
+REGRESSION_RATIO = 1.25
+MIN_REGRESSION_SECONDS = 0.005
+
+
+def _quiet():
+    """Keep the pipeline's progress output out of the report"""
+    return contextlib.redirect_stdout(io.StringIO())
+
+
+def _timed(function, *args, **kwargs):
+    started = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+
+def _phase_totals():
+    return {
+        labels["phase"]: entry[-1]
+        for name, labels, entry in metrics.registry.snapshot()["histograms"]
+        if name == "pcso_phase_seconds"
+    }
+
+
+@contextlib.contextmanager
+def _phases(into):
+    """Fill `into` with the seconds each pipeline phase took in the block"""
+    before = _phase_totals()
+    yield
+    for phase, seconds in sorted(_phase_totals().items()):
+        if seconds > before.get(phase, 0.0):
+            into[phase] = seconds - before.get(phase, 0.0)
+
+
+def _split_last_day(games):
+    """The history without its last day, and the draws of that day"""
+    last = max(int(columns.days[-1]) for columns in games.values() if len(columns))
+    head, day = {}, {}
+    for game_type, columns in games.items():
+        cut = int(np.searchsorted(columns.days, last))
+        head[game_type] = columns.take(slice(0, cut))
+        day[game_type] = columns.take(slice(cut, len(columns)))
+    return head, day
+
+
+def bench_csv(csv_file, day_file):
+    from import_csv import import_csv_files
+
+    result = {}
+    for name, filename, mode in (("csv_import", csv_file, 'replace'), ("csv_append_day", day_file, 'append')):
+        phases = {}
+        with _phases(phases), _quiet():
+            _, seconds = _timed(import_csv_files, [filename], mode=mode, workers=1)
+        result[name] = {"seconds": seconds, "phases": phases}
+    return result
+
+
+def bench_fetch_save(day):
+    from fetch_pcso_data import PCSODataFetcher
+
+    results = [result for columns in day.values() for result in columns.results()]
+    fetcher = PCSODataFetcher(cache=False)
+    phases = {}
+    with _phases(phases), _quiet():
+        _, seconds = _timed(fetcher.save_to_json, results)
+    return {"seconds": seconds, "phases": phases}
+
+
+def bench_html_parse(fixture, draws):
+    from fetch_pcso_data import PCSODataFetcher
+    from results_parser import ResultRows
+
+    with open(fixture, 'r', encoding='utf-8') as f:
+        page = f.read()
+    fixture_rows = page.count('<tr><td>')
+    rows = min(draws, PARSE_MAX_ROWS)
+    content = scale_fixture(page, -(-rows // fixture_rows)).encode('utf-8')
+
+    fetcher = PCSODataFetcher(cache=False)
+    with _quiet():
+        results, seconds = _timed(lambda: fetcher._parse_rows(ResultRows(content)))
+    return {"rows": len(results), "bytes": len(content), "seconds": seconds}
+
+
+def bench_statistics():
+    from aggregate_store import AGGREGATE_DIR, refresh_statistics
+    from cooccurrence import COOCCURRENCE_DIR
+    from frequency_index import FREQUENCY_DIR
+    from static_export import EXPORT_DIR
+
+    # Without the previous outputs everything is computed again
+    for directory in (AGGREGATE_DIR, FREQUENCY_DIR, COOCCURRENCE_DIR, EXPORT_DIR):
+        shutil.rmtree(directory, ignore_errors=True)
+    phases = {}
+    with _phases(phases), _quiet():
+        _, seconds = _timed(refresh_statistics)
+    return {"seconds": seconds, "phases": phases}
+
+
+def bench_load():
+    from column_store import ColumnStore, store_version
+    from draw_index import DrawIndex
+    from serve import preload
+
+    build = os.path.realpath(STORE_DIR)
+    _, load_seconds = _timed(DrawIndex, ColumnStore(build), store_version())
+    _, preload_seconds = _timed(preload)
+    gc.unfreeze()
+    return {"store_load": load_seconds, "preload": preload_seconds}
+
+
+def api_queries(index, rng, count):
+    """
+    {endpoint: [(method, url, json body)]} of count requests each, with
+    seeded parameters so most requests miss the query caches
+    """
+    from draw_index import MAX_PER_PAGE
+
+    game = "6/58"
+    first, last = int(index.days[0]), int(index.days[-1])
+    pages = max(1, -(-index.count() // MAX_PER_PAGE))
+
+    def window():
+        start = int(rng.integers(first, max(first + 1, last - 365)))
+        return f"from={day_to_date(start)}&to={day_to_date(min(last, start + 365))}"
+
+    def numbers(k):
+        return ",".join(str(n) for n in sorted(rng.choice(np.arange(1, 59), k, replace=False)))
+
+    def tickets():
+        picks = np.argsort(rng.random((TICKETS, 58)), axis=1)[:, :6] + 1
+        return {"game": game, "tickets": picks.tolist(), "min_matches": 3}
+
+    endpoints = {
+        "draws_latest": lambda i: ('GET', f"/api/draws?game=all&page={i % 20 + 1}", None),
+        "draws_oldest": lambda i: ('GET', f"/api/draws?game=all&per_page={MAX_PER_PAGE}&page={max(1, pages - i)}", None),
+        "draws_range": lambda i: ('GET', f"/api/draws?game={game}&{window()}", None),
+        "frequency": lambda i: ('GET', f"/api/frequency?game={game}&{window()}", None),
+        "analytics": lambda i: ('GET', f"/api/analytics?game={game}&{window()}", None),
+        "rolling": lambda i: ('GET', f"/api/rolling?game={game}&numbers={numbers(3)}&window=30", None),
+        "cooccurrence": lambda i: ('GET', f"/api/cooccurrence?game={game}&kind=pairs&numbers={numbers(1)}", None),
+        "significance": lambda i: ('GET', f"/api/significance?game={game}&{window()}", None),
+        "tickets_check": lambda i: ('POST', "/api/tickets/check", tickets())
+    }
+    return {name: [query(i) for i in range(count)] for name, query in endpoints.items()}
+
+
+def bench_api(seed, count):
+    from api_server import app
+    from draw_index import current_index
+
+    client = app.test_client()
+    queries = api_queries(current_index(), np.random.default_rng(seed), count)
+
+    # The null models are simulated in the background on first use, as
+    # `null_model.py --precompute` does ahead of time in production
+    for method, url, body in queries["significance"]:
+        while client.open(url, method=method, json=body).status_code == 202:
+            time.sleep(0.1)
+
+    result = {}
+    for name, requests in queries.items():
+        timings = []
+        for method, url, body in requests:
+            started = time.perf_counter()
+            response = client.open(url, method=method, json=body)
+            response.get_data()
+            timings.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                raise RuntimeError(f"{method} {url} returned HTTP {response.status_code}")
+        rest = timings[1:] or timings
+        result[name] = {
+            "first": timings[0],
+            "p50": float(np.percentile(rest, 50)),
+            "p95": float(np.percentile(rest, 95))
+        }
+    return result
+
+
+def bench_scale(years, seed, fixture, requests, keep=False):
+    """Every benchmark on one synthetic history; returns the timings"""
+    games, generate_seconds = _timed(history, years, seed)
+    draws = sum(len(columns) for columns in games.values())
+    result = {"years": years, "draws": draws, "generate": generate_seconds}
+
+    directory = tempfile.mkdtemp(prefix=f"pcso_bench_{years}y_")
+    cwd = os.getcwd()
+    try:
+        # The last day is saved like a fetch, the day before appended as CSV
+        head, fetch_day = _split_last_day(games)
+        head, day = _split_last_day(head)
+        write_csv(head, os.path.join(directory, "history.csv"))
+        write_csv(day, os.path.join(directory, "day.csv"))
+
+        os.chdir(directory)
+        result.update(bench_csv("history.csv", "day.csv"))
+        result["fetch_save_day"] = bench_fetch_save(fetch_day)
+        result["html_parse"] = bench_html_parse(fixture, draws)
+        result["statistics"] = bench_statistics()
+        result.update(bench_load())
+        result["api"] = bench_api(seed, requests)
+    finally:
+        os.chdir(cwd)
+        if keep:
+            print(f"  data kept in {directory}")
+        else:
+            shutil.rmtree(directory, ignore_errors=True)
+    return result
+
+
+def git_commit():
+    """(commit, dirty) of the working tree, or (None, False) outside git"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+        status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None, False
+    return commit, bool(status.strip())
+
+
+def read_history(filename=HISTORY_FILE):
+    if not os.path.exists(filename):
+        return {"runs": []}
+    with open(filename, 'r') as f:
+        return json.load(f)
+
+
+def write_history(history, filename=HISTORY_FILE):
+    tmp_filename = f"{filename}.tmp"
+    with open(tmp_filename, 'w') as f:
+        json.dump(history, f, indent=2)
+    os.replace(tmp_filename, filename)
+
+
+def flatten(results, prefix=""):
+    """{"10y.api.frequency.p50": seconds, ...} of every timing in a run"""
+    flat = {}
+    for key, value in results.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, path + "."))
+        elif isinstance(value, float):
+            flat[path] = value
+    return flat
+
+
+def baseline_run(history, run):
+    """The newest run of another commit on the same machine and seed"""
+    for previous in reversed(history["runs"]):
+        if (previous["commit"] != run["commit"] and previous["seed"] == run["seed"]
+                and previous["machine"] == run["machine"]):
+            return previous
+    return None
+
+
+def regressions(run, baseline):
+    """(timing, baseline seconds, seconds) of every timing that got slower"""
+    before = flatten(baseline["scales"])
+    slower = []
+    for path, seconds in sorted(flatten(run["scales"]).items()):
+        old = before.get(path)
+        if old and seconds > old * REGRESSION_RATIO and seconds - old > MIN_REGRESSION_SECONDS:
+            slower.append((path, old, seconds))
+    return slower
+
+
+def print_scale(name, result):
+    print(f"\n{name}: {result['draws']:,} draws over {result['years']}y")
+    print(f"  {'generate':<16} {result['generate']:>9.3f}s")
+    for key in ("csv_import", "csv_append_day", "fetch_save_day", "statistics"):
+        phases = ", ".join(f"{phase} {seconds:.2f}" for phase, seconds in result[key]["phases"].items())
+        print(f"  {key:<16} {result[key]['seconds']:>9.3f}s  ({phases})")
+    parse = result["html_parse"]
+    print(f"  {'html_parse':<16} {parse['seconds']:>9.3f}s  ({parse['rows']:,} rows, "
+          f"{parse['rows'] / parse['seconds']:,.0f} rows/s)")
+    print(f"  {'store_load':<16} {result['store_load']:>9.3f}s")
+    print(f"  {'preload':<16} {result['preload']:>9.3f}s")
+    print(f"  {'endpoint':<16} {'first':>9} {'p50':>9} {'p95':>9}  (ms)")
+    for endpoint, timing in result["api"].items():
+        print(f"  {endpoint:<16} {timing['first'] * 1000:>9.2f} {timing['p50'] * 1000:>9.2f} {timing['p95'] * 1000:>9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline on synthetic histories")
+    parser.add_argument('--scales', default=",".join(DEFAULT_SCALES),
+                        help=f"comma-separated scales out of {', '.join(SCALES)}")
+    parser.add_argument('--stress', action='store_true', help="also run the stress scale")
+    parser.add_argument('--seed', type=int, default=SEED, help="synthetic history seed")
+    parser.add_argument('--requests', type=int, default=REQUESTS, help="requests per API endpoint")
+    parser.add_argument('--fixture', default=FIXTURE)
+    parser.add_argument('--history', default=HISTORY_FILE)
+    parser.add_argument('--no-save', action='store_true', help="do not add this run to the history")
+    parser.add_argument('--keep', action='store_true', help="keep the generated data directories")
+    args = parser.parse_args()
+
+    scales = [name.strip() for name in args.scales.split(",") if name.strip()]
+    if args.stress and "stress" not in scales:
+        scales.append("stress")
+    unknown = [name for name in scales if name not in SCALES]
+    if unknown:
+        parser.error(f"unknown scale: {', '.join(unknown)}")
+
+    # Benchmark timings stay out of the metrics files the server scrapes
+    metrics.registry.directory = None
+
+    commit, dirty = git_commit()
+    run = {
+        "commit": commit,
+        "dirty": dirty,
+        "time": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "seed": args.seed,
+        "machine": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "cpus": os.cpu_count()
+        },
+        "scales": {}
+    }
+    print(f"Benchmarking {commit[:12] if commit else 'unknown commit'}{' (dirty)' if dirty else ''}, seed {args.seed}")
+
+    fixture = os.path.abspath(args.fixture)
+    for name in scales:
+        run["scales"][name] = bench_scale(SCALES[name], args.seed, fixture, args.requests, args.keep)
+        print_scale(name, run["scales"][name])
+
+    runs = read_history(args.history)
+    baseline = baseline_run(runs, run)
+    if baseline is not None:
+        slower = regressions(run, baseline)
+        print(f"\nCompared with {(baseline['commit'] or 'unknown')[:12]} ({baseline['time']}):")
+        for path, old, seconds in slower:
+            print(f"  REGRESSION {path}: {old * 1000:.1f} ms -> {seconds * 1000:.1f} ms ({seconds / old:.2f}x)")
+        if not slower:
+            print("  no regressions")
+
+    if not args.no_save:
+        runs["runs"].append(run)
+        write_history(runs, args.history)
+        print(f"\nRun saved to {args.history}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Results Parser Benchmark
+Compares rows per second of the results_parser backends on a recorded
+results page fixture.
+
+Usage: python bench_parser.py [--fixture FILE] [--scale N] [--repeat N]
+
+--scale repeats the fixture rows N times inside one table to simulate a
+multi-year result page.
+"""
+import argparse
+import re
+import time
+
+from results_parser import available_backends, iter_result_rows
+
+FIXTURE = "fixtures/pcso_results_page.html"
+
+
+def scale_fixture(page, scale):
+    """
+    Repeat the data rows of the results table `scale` times
+    """
+    if scale <= 1:
+        return page
+
+    rows = re.findall(r'<tr><td>.*?</tr>\n?', page)
+    first = page.index(rows[0])
+    last = page.index(rows[-1]) + len(rows[-1])
+    return page[:first] + "".join(rows) * scale + page[last:]
+
+
+def bench_backend(content, backend, repeat):
+    """
+    Best-of-repeat time to parse every row; returns (rows, seconds)
+    """
+    best = None
+    rows = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        rows = sum(1 for _ in iter_result_rows(content, backend))
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return rows, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the results page parser backends")
+    parser.add_argument('--fixture', default=FIXTURE)
+    parser.add_argument('--scale', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    with open(args.fixture, 'r', encoding='utf-8') as f:
+        page = scale_fixture(f.read(), args.scale)
+    content = page.encode('utf-8')
+
+    print(f"Fixture: {args.fixture} x{args.scale} ({len(content) / 1024:.0f} KiB)")
+    print(f"{'backend':<8} {'rows':>8} {'seconds':>9} {'rows/s':>12}")
+
+    reference = None
+    for backend in available_backends():
+        rows, seconds = bench_backend(content, backend, args.repeat)
+        print(f"{backend:<8} {rows:>8} {seconds:>9.3f} {rows / seconds:>12,.0f}")
+
+        # Every backend must produce exactly the same rows
+        parsed = list(iter_result_rows(content, backend))
+        if reference is None:
+            reference = parsed
+        elif parsed != reference:
+            print(f"  WARNING: {backend} rows differ from {available_backends()[0]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,413 @@
+"""
+Columnar Draw Store
+Per-game NumPy column files, memory-mapped by readers.
+
+Layout (one directory per game_type, '/' replaced by '-'):
+
+    pcso_columns/
+        manifest.json
+        6-58/numbers.npy    uint8   draws x 6 (draws x k for the digit games)
+        6-58/days.npy       int32   days since 1970-01-01, sorted ascending
+        6-58/jackpot.npy    float64
+        6-58/winners.npy    int32
+
+Readers open the columns with np.load(mmap_mode='r'), so loading costs a
+few page faults instead of parsing JSON, and a date range is a searchsorted
+slice of the day column.
+
+Every write publishes a new build directory. append() builds it from the
+previous one: games without new draws are hard-linked and the new draws are
+concatenated to the columns of their game, so an incremental fetch never
+turns the history back into result dicts.
+
+The previous build stays on disk until the next publish, so a reader that
+read the manifest just before a swap can still load the games it lists;
+a ColumnStore loads columns from the build its manifest was read from.
+"""
+import hashlib
+import json
+import os
+import shutil
+import time
+from array import array
+from datetime import date
+from functools import lru_cache
+
+import numpy as np
+
+STORE_DIR = "pcso_columns"
+MANIFEST = "manifest.json"
+
+# Filler for rows that have fewer numbers than the widest row of their game
+NO_NUMBER = 255
+
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+@lru_cache(maxsize=16384)
+def date_to_day(date_str):
+    """YYYY-MM-DD to days since 1970-01-01"""
+    return date.fromisoformat(date_str).toordinal() - _EPOCH_ORDINAL
+
+
+def day_to_date(day):
+    """Days since 1970-01-01 to YYYY-MM-DD"""
+    return date.fromordinal(int(day) + _EPOCH_ORDINAL).isoformat()
+
+
+def game_dir_name(game_type):
+    return game_type.replace('/', '-')
+
+
+def row_digests(numbers):
+    """
+    uint64 digest of every row of a numbers column. Rows of up to eight
+    numbers are packed byte for byte, so distinct rows never share a
+    digest; wider rows get an 8-byte BLAKE2 digest.
+    """
+    numbers = np.ascontiguousarray(numbers, dtype=np.uint8)
+    rows, width = numbers.shape
+    if width <= 8:
+        packed = np.zeros((rows, 8), np.uint8)
+        packed[:, :width] = numbers
+        return packed.view('<u8').ravel().astype(np.uint64)
+    return np.array([int.from_bytes(hashlib.blake2b(row.tobytes(), digest_size=8).digest(), 'little')
+                     for row in numbers], dtype=np.uint64)
+
+
+class GameColumns:
+    """
+    The columns of one game, sorted by date
+    """
+
+    def __init__(self, game_type, game_name, numbers, days, jackpot, winners):
+        self.game_type = game_type
+        self.game_name = game_name
+        self.numbers = numbers
+        self.days = days
+        self.jackpot = jackpot
+        self.winners = winners
+
+    def __len__(self):
+        return len(self.days)
+
+    def date_slice(self, from_date=None, to_date=None):
+        """
+        Row slice covering [from_date, to_date], both YYYY-MM-DD and optional
+        """
+        lo = 0 if from_date is None else int(np.searchsorted(self.days, date_to_day(from_date), 'left'))
+        hi = len(self.days) if to_date is None else int(np.searchsorted(self.days, date_to_day(to_date), 'right'))
+        return slice(lo, max(lo, hi))
+
+    def between(self, from_date=None, to_date=None):
+        """
+        Zero-copy view of the rows in [from_date, to_date]
+        """
+        return self.take(self.date_slice(from_date, to_date))
+
+    def take(self, rows):
+        """
+        The rows at the given positions (an index array or slice)
+        """
+        return GameColumns(
+            self.game_type, self.game_name, self.numbers[rows],
+            self.days[rows], self.jackpot[rows], self.winners[rows]
+        )
+
+    def dates(self):
+        return [day_to_date(day) for day in self.days]
+
+    def results(self):
+        """
+        The rows as result dicts, in the pcso_lotto_data.json shape
+        """
+        results = []
+        for numbers, day, jackpot, winners in zip(self.numbers.tolist(), self.days.tolist(),
+                                                  self.jackpot.tolist(), self.winners.tolist()):
+            results.append({
+                "game": self.game_name,
+                "game_type": self.game_type,
+                "date": day_to_date(day),
+                "numbers": [n for n in numbers if n != NO_NUMBER],
+                "jackpot": jackpot,
+                "winners": winners
+            })
+        return results
+
+
+class _GameBuffer:
+    """Compact per-game accumulator used while writing the store"""
+
+    def __init__(self, game_name):
+        self.game_name = game_name
+        self.numbers = []
+        self.days = array('i')
+        self.jackpot = array('d')
+        self.winners = array('i')
+        self.width = 0
+
+    def add(self, result):
+        numbers = result["numbers"]
+        self.numbers.append(bytes(n if 0 <= n < NO_NUMBER else NO_NUMBER for n in numbers))
+        self.width = max(self.width, len(numbers))
+        self.days.append(date_to_day(result["date"]))
+        self.jackpot.append(result["jackpot"] or 0)
+        self.winners.append(result["winners"] or 0)
+
+    def columns(self):
+        """Columns sorted by date; ties keep their input order"""
+        days = np.frombuffer(self.days, dtype=np.int32) if len(self.days) else np.zeros(0, np.int32)
+        order = np.argsort(days, kind='stable')
+
+        if all(len(row) == self.width for row in self.numbers):
+            numbers = np.frombuffer(b''.join(self.numbers), dtype=np.uint8).reshape(-1, self.width)
+        else:
+            numbers = np.full((len(self.numbers), self.width), NO_NUMBER, dtype=np.uint8)
+            for i, row in enumerate(self.numbers):
+                numbers[i, :len(row)] = np.frombuffer(row, dtype=np.uint8)
+
+        return {
+            "numbers": numbers[order],
+            "days": days[order].astype(np.int32),
+            "jackpot": np.frombuffer(self.jackpot, dtype=np.float64)[order],
+            "winners": np.frombuffer(self.winners, dtype=np.int32)[order]
+        }
+
+
+def build_columns(results):
+    """
+    In-memory GameColumns per game type from an iterable of result dicts
+    """
+    buffers = {}
+    for result in results:
+        game_type = result["game_type"]
+        if game_type not in buffers:
+            buffers[game_type] = _GameBuffer(result["game"])
+        buffers[game_type].add(result)
+
+    return {
+        game_type: GameColumns(game_type, buffer.game_name, **buffer.columns())
+        for game_type, buffer in buffers.items()
+    }
+
+
+class ColumnStore:
+    """
+    Reader and writer for the columnar store
+    """
+
+    def __init__(self, directory=STORE_DIR):
+        self.directory = directory
+        self._manifest = None
+        self._build_dir = None
+        self._games = {}
+
+    def manifest(self):
+        if self._manifest is None:
+            # Pin the build behind the symlink, so load() reads the same one
+            build_dir = os.path.realpath(self.directory)
+            path = os.path.join(build_dir, MANIFEST)
+            if os.path.exists(path):
+                with open(path, 'r') as f:
+                    self._manifest = json.load(f)
+            else:
+                self._manifest = {"games": {}}
+            self._build_dir = build_dir
+        return self._manifest
+
+    def exists(self):
+        return os.path.exists(os.path.join(self.directory, MANIFEST))
+
+    def game_types(self):
+        return list(self.manifest()["games"])
+
+    def load(self, game_type):
+        """
+        Memory-map the columns of one game
+        """
+        if game_type not in self._games:
+            info = self.manifest()["games"][game_type]
+            game_dir = os.path.join(self._build_dir, info["dir"])
+
+            def column(name):
+                return np.load(os.path.join(game_dir, name + ".npy"), mmap_mode='r')
+
+            self._games[game_type] = GameColumns(
+                game_type, info["game_name"], column("numbers"),
+                column("days"), column("jackpot"), column("winners")
+            )
+        return self._games[game_type]
+
+    def load_all(self):
+        return {game_type: self.load(game_type) for game_type in self.game_types()}
+
+    def write(self, results):
+        """
+        Rebuild the store from an iterable of result dicts.
+
+        The new store is written to a fresh directory and published by
+        swapping a symlink, so readers never see a half-written game.
+        Readers that still have the old files mapped keep reading them.
+        """
+        games = build_columns(results)
+
+        # Each build gets its own directory; self.directory is a symlink to it
+        build_dir = f"{self.directory}.{time.time_ns()}"
+        os.makedirs(build_dir)
+
+        manifest = {"games": {}}
+        for game_type, columns in sorted(games.items()):
+            manifest["games"][game_type] = self._save_game(build_dir, columns)
+        return self._finish(build_dir, manifest)
+
+    def append(self, results):
+        """
+        Publish the store plus result dicts that are all newer than the last
+        stored draw of their game, rewriting only the games they belong to.
+        Returns the number of rows, or None without changing anything if a
+        result is not newer (or the store is missing) and write() is needed.
+        """
+        if not self.exists():
+            return None
+        # The build the new one starts from
+        source_dir = os.path.realpath(self.directory)
+        source = ColumnStore(source_dir)
+        games = build_columns(results)
+        current = source.manifest()["games"]
+        if not games:
+            return source.manifest()["total_rows"]
+        for game_type, columns in games.items():
+            if game_type in current:
+                stored = source.load(game_type)
+                if columns.days[0] <= stored.days[-1] or columns.numbers.shape[1] != stored.numbers.shape[1]:
+                    return None
+
+        build_dir = f"{self.directory}.{time.time_ns()}"
+        os.makedirs(build_dir)
+
+        manifest = {"games": {}}
+        for game_type in sorted(set(current) | set(games)):
+            if game_type not in games:
+                info = current[game_type]
+                os.makedirs(os.path.join(build_dir, info["dir"]))
+                for name in ("numbers", "days", "jackpot", "winners"):
+                    _link(os.path.join(source_dir, info["dir"], name + ".npy"),
+                          os.path.join(build_dir, info["dir"], name + ".npy"))
+                manifest["games"][game_type] = info
+                continue
+
+            columns = games[game_type]
+            if game_type in current:
+                stored = source.load(game_type)
+                columns = GameColumns(game_type, columns.game_name, *(
+                    np.concatenate([getattr(stored, name), getattr(columns, name)])
+                    for name in ("numbers", "days", "jackpot", "winners")
+                ))
+            manifest["games"][game_type] = self._save_game(build_dir, columns)
+        return self._finish(build_dir, manifest)
+
+    def _save_game(self, build_dir, columns):
+        """Write the columns of one game into a build; returns its manifest entry"""
+        game_dir = game_dir_name(columns.game_type)
+        os.makedirs(os.path.join(build_dir, game_dir))
+        for name in ("numbers", "days", "jackpot", "winners"):
+            np.save(os.path.join(build_dir, game_dir, name + ".npy"), getattr(columns, name))
+        return {
+            "dir": game_dir,
+            "game_name": columns.game_name,
+            "rows": len(columns),
+            "width": columns.numbers.shape[1],
+            "first_date": day_to_date(columns.days[0]),
+            "last_date": day_to_date(columns.days[-1])
+        }
+
+    def _finish(self, build_dir, manifest):
+        """Write the manifest of a build and publish it; returns the row count"""
+        total = sum(info["rows"] for info in manifest["games"].values())
+        manifest["total_rows"] = total
+        with open(os.path.join(build_dir, MANIFEST), 'w') as f:
+            json.dump(manifest, f, indent=2)
+
+        self._publish(build_dir)
+
+        self._manifest = None
+        self._build_dir = None
+        self._games = {}
+        return total
+
+    def _publish(self, build_dir):
+        """
+        Point the store at a finished build with an atomic symlink swap
+        """
+        previous = os.path.realpath(self.directory) if os.path.islink(self.directory) else None
+
+        link = self.directory + ".link"
+        if os.path.lexists(link):
+            os.remove(link)
+        os.symlink(os.path.basename(build_dir), link)
+
+        if os.path.isdir(self.directory) and not os.path.islink(self.directory):
+            # A plain directory cannot be replaced atomically by a symlink
+            shutil.rmtree(self.directory)
+        os.replace(link, self.directory)
+
+        # The previous build is kept for readers that pinned it; older ones go
+        parent = os.path.dirname(os.path.abspath(self.directory))
+        prefix = os.path.basename(self.directory) + "."
+        published = int(build_dir.rsplit('.', 1)[-1])
+        for name in os.listdir(parent):
+            suffix = name[len(prefix):]
+            path = os.path.join(parent, name)
+            if name.startswith(prefix) and suffix.isdigit() and int(suffix) < published and path != previous:
+                shutil.rmtree(path, ignore_errors=True)
+
+
+def _link(source, target):
+    """Share an unchanged column file between builds"""
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
+
+def store_version(directory=STORE_DIR):
+    """
+    Identifier of the published build of the store, or None if there is none.
+
+    Every write publishes a new build directory, so the version changes
+    exactly when the data does.
+    """
+    if os.path.islink(directory):
+        return os.path.basename(os.path.realpath(directory)).rsplit('.', 1)[-1]
+    manifest = os.path.join(directory, MANIFEST)
+    if os.path.exists(manifest):
+        return str(os.stat(manifest).st_mtime_ns)
+    return None
+
+
+def load_store(directory=STORE_DIR):
+    """
+    Open the columnar store, or return None if it has not been built yet
+    """
+    store = ColumnStore(directory)
+    return store if store.exists() else None
+
+
+def main():
+    import sys
+
+    data_file = sys.argv[1] if len(sys.argv) > 1 else "pcso_lotto_data.json"
+
+    started = time.perf_counter()
+    with open(data_file, 'r') as f:
+        results = json.load(f)["results"]
+    total = ColumnStore().write(results)
+    print(f"Wrote {total} draws to {STORE_DIR}/ in {time.perf_counter() - started:.2f}s")
+
+    started = time.perf_counter()
+    games = ColumnStore().load_all()
+    print(f"Memory-mapped {len(games)} games in {(time.perf_counter() - started) * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
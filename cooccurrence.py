@@ -0,0 +1,269 @@
+"""
+Transition and Co-occurrence Matrices
+Per-game draw-to-draw transition counts and within-draw pair and triple
+co-occurrence counts of the 6/xx lotto games.
+
+With X the draws x (max_number + 1) one-hot matrix of a game's draws in
+date order, all three are matrix products:
+
+    transitions[a, b]   = X[:-1].T @ X[1:]      a drawn, b drawn in the next draw
+    pairs[a, b]         = X.T @ X               a and b in the same draw
+    triples[a, b, c]    = X.T @ (X (x) X)       a, b and c in the same draw
+
+The diagonals of pairs hold the number frequencies. Triples are computed in
+blocks of rows so the row-wise outer products stay small.
+
+Layout (one file per game_type, '/' replaced by '-'):
+
+    pcso_cooccurrence/
+        6-58.npz    days, hashes, transitions, pairs, triples
+
+When a refresh only appends draws, the products of the new rows (and the
+transition from the last known draw into them) are added to the stored
+counts instead of recomputing them. Like the frequency index, a refresh
+told which draws changed skips the games without any and does not compare
+the stored draws when the changes all come after them.
+"""
+import os
+import threading
+
+import numpy as np
+
+from column_store import ColumnStore, game_dir_name, row_digests
+from draw_record import is_lotto_game
+from stats_engine import max_number, min_number
+
+COOCCURRENCE_DIR = "pcso_cooccurrence"
+TRIPLE_BLOCK_ROWS = 1024
+KINDS = ("transitions", "pairs", "triples")
+
+
+def one_hot(numbers, top):
+    """draws x (top + 1) float32 indicator matrix; numbers above top are dropped"""
+    numbers = np.asarray(numbers)
+    n = len(numbers)
+    matrix = np.zeros((n, top + 2), np.float32)
+    matrix[np.arange(n)[:, None], np.minimum(numbers, top + 1)] = 1
+    return matrix[:, :top + 1]
+
+
+def _products(onehot, previous=None):
+    """
+    (transitions, pairs, triples) of a block of one-hot rows; previous is the
+    one-hot row of the draw before the block, if any
+    """
+    size = onehot.shape[1]
+    chained = onehot if previous is None else np.vstack((previous, onehot))
+    transitions = (chained[:-1].T @ chained[1:]).astype(np.int32)
+    pairs = (onehot.T @ onehot).astype(np.int32)
+
+    triples = np.zeros((size, size * size), np.int32)
+    for start in range(0, len(onehot), TRIPLE_BLOCK_ROWS):
+        block = onehot[start:start + TRIPLE_BLOCK_ROWS]
+        outer = (block[:, :, None] * block[:, None, :]).reshape(len(block), size * size)
+        triples += (block.T @ outer).astype(np.int32)
+    return transitions, pairs, triples.reshape(size, size, size)
+
+
+def _ranked_cells(values, cells, k):
+    """The k largest values at cells (tuple of index arrays), ties by index"""
+    counts = values[cells]
+    order = np.lexsort(cells[::-1] + (-counts,))[:k]
+    return [[int(axis[i]) for axis in cells] + [int(counts[i])] for i in order if counts[i]]
+
+
+class GameMatrices:
+    """
+    Transition and co-occurrence counts of one game, aligned with its day column
+    """
+
+    def __init__(self, game_type, days, hashes, transitions, pairs, triples):
+        self.game_type = game_type
+        self.days = days
+        self.hashes = hashes
+        self.transitions = transitions
+        self.pairs = pairs
+        self.triples = triples
+
+    def __len__(self):
+        return len(self.days)
+
+    @property
+    def top(self):
+        return self.pairs.shape[0] - 1
+
+    @classmethod
+    def build(cls, columns):
+        top = max_number(columns.game_type)
+        transitions, pairs, triples = _products(one_hot(columns.numbers, top))
+        return cls(columns.game_type, np.array(columns.days, dtype=np.int32),
+                   row_digests(columns.numbers), transitions, pairs, triples)
+
+    def extend(self, columns, first_changed=None):
+        """
+        Bring the counts in line with a game's columns. first_changed is the
+        first day with a changed draw, if known (see FrequencyIndex.extend).
+        Returns True if only new rows were added, False if the counts had to
+        be rebuilt.
+        """
+        n = len(self.days)
+        days = np.asarray(columns.days)
+        same = len(days) >= n and self.top == max_number(columns.game_type)
+        if same and first_changed is not None and n and first_changed > self.days[-1]:
+            same = days[n - 1] == self.days[-1] and self.hashes.dtype == np.uint64
+        elif same:
+            same = np.array_equal(days[:n], self.days) and np.array_equal(row_digests(columns.numbers[:n]), self.hashes)
+
+        if same:
+            if len(days) > n:
+                previous = one_hot(columns.numbers[n - 1:n], self.top) if n else None
+                transitions, pairs, triples = _products(one_hot(columns.numbers[n:], self.top), previous)
+                self.transitions += transitions
+                self.pairs += pairs
+                self.triples += triples
+                self.days = np.array(days, dtype=np.int32)
+                self.hashes = np.concatenate((self.hashes, row_digests(columns.numbers[n:])))
+            return True
+
+        rebuilt = GameMatrices.build(columns)
+        self.days, self.hashes = rebuilt.days, rebuilt.hashes
+        self.transitions, self.pairs, self.triples = rebuilt.transitions, rebuilt.pairs, rebuilt.triples
+        return False
+
+    def top_transitions(self, numbers, k):
+        """{number: [[next number, count], ...]} of the k most frequent successors"""
+        low = min_number(self.game_type)
+        candidates = np.arange(low, self.top + 1)
+        result = {}
+        for number in numbers:
+            result[number] = _ranked_cells(self.transitions[number], (candidates,), k)
+        return result
+
+    def top_pairs(self, k, number=None):
+        """[[a, b, count], ...] of the k most frequent pairs, optionally containing number"""
+        low = min_number(self.game_type)
+        if number is not None:
+            partners = np.array([n for n in range(low, self.top + 1) if n != number])
+            return [[number] + cell for cell in _ranked_cells(self.pairs[number], (partners,), k)]
+        a, b = np.triu_indices(self.top + 1, 1)
+        keep = a >= low
+        return _ranked_cells(self.pairs, (a[keep], b[keep]), k)
+
+    def top_triples(self, k, number=None):
+        """[[a, b, c, count], ...] of the k most frequent triples, optionally containing number"""
+        low = min_number(self.game_type)
+        if number is not None:
+            b, c = np.triu_indices(self.top + 1, 1)
+            keep = (b >= low) & (b != number) & (c != number)
+            return [[number] + cell for cell in _ranked_cells(self.triples[number], (b[keep], c[keep]), k)]
+        grid = np.arange(self.top + 1)
+        a, b, c = np.nonzero((grid[:, None, None] < grid[None, :, None]) & (grid[None, :, None] < grid[None, None, :]))
+        keep = a >= low
+        return _ranked_cells(self.triples, (a[keep], b[keep], c[keep]), k)
+
+    def save(self, filename):
+        tmp_filename = f"{filename}.{os.getpid()}.tmp"
+        with open(tmp_filename, 'wb') as f:
+            np.savez(f, days=self.days, hashes=self.hashes, transitions=self.transitions,
+                     pairs=self.pairs, triples=self.triples)
+        os.replace(tmp_filename, filename)
+
+    @classmethod
+    def load(cls, game_type, filename):
+        with np.load(filename) as data:
+            matrices = cls(game_type, data["days"], data["hashes"], data["transitions"],
+                           data["pairs"], data["triples"])
+        if len(matrices.hashes) != len(matrices.days):
+            raise ValueError(f"{filename} is inconsistent")
+        return matrices
+
+
+class CooccurrenceStore:
+    """
+    Transition and co-occurrence counts for every 6/xx game in the column store
+    """
+
+    def __init__(self, directory=COOCCURRENCE_DIR, store=None):
+        self.directory = directory
+        self.store = store or ColumnStore()
+        self._games = {}
+        self._lock = threading.Lock()
+
+    def _filename(self, game_type):
+        return os.path.join(self.directory, game_dir_name(game_type) + ".npz")
+
+    def game_types(self):
+        return [g for g in self.store.game_types() if is_lotto_game(g)]
+
+    def game(self, game_type):
+        """
+        The matrices of one game, loaded from disk and brought up to date
+        with the column store on first use
+        """
+        with self._lock:
+            if game_type not in self._games:
+                columns = self.store.load(game_type)
+                try:
+                    matrices = GameMatrices.load(game_type, self._filename(game_type))
+                    matrices.extend(columns)
+                except (OSError, ValueError, KeyError):
+                    matrices = GameMatrices.build(columns)
+                self._games[game_type] = matrices
+            return self._games[game_type]
+
+    def refresh(self, changed=None):
+        """
+        Update and save the matrices of every game. changed is as for
+        FrequencyStore.refresh. Returns {game_type: 'appended' | 'rebuilt' |
+        'unchanged'}.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        outcome = {}
+        for game_type in self.game_types():
+            filename = self._filename(game_type)
+            if changed is not None and game_type not in changed and os.path.exists(filename):
+                outcome[game_type] = 'unchanged'
+                continue
+            columns = self.store.load(game_type)
+            first_changed = int(changed[game_type][0]) if changed is not None and game_type in changed else None
+            try:
+                matrices = GameMatrices.load(game_type, filename)
+                before = len(matrices)
+                appended = matrices.extend(columns, first_changed)
+            except (OSError, ValueError, KeyError):
+                matrices, before, appended = GameMatrices.build(columns), -1, False
+
+            if appended and before == len(matrices):
+                outcome[game_type] = 'unchanged'
+                continue
+            outcome[game_type] = 'appended' if appended else 'rebuilt'
+            matrices.save(filename)
+
+        with self._lock:
+            self._games = {}
+        return outcome
+
+    def query(self, game_type, kind, numbers=(), k=10):
+        """
+        Top-k lookup: successors of each of numbers for 'transitions', or the
+        most frequent pairs / triples (containing each of numbers, if given)
+        """
+        if not is_lotto_game(game_type):
+            raise ValueError("Co-occurrence matrices are only kept for the 6/xx lotto games")
+        if kind not in KINDS:
+            raise ValueError(f"kind must be one of {', '.join(KINDS)}")
+        if game_type not in self.game_types():
+            raise ValueError(f"No draws for {game_type}")
+
+        matrices = self.game(game_type)
+        if any(n < min_number(game_type) or n > matrices.top for n in numbers):
+            raise ValueError(f"Numbers must be between {min_number(game_type)} and {matrices.top}")
+
+        if kind == "transitions":
+            if not numbers:
+                raise ValueError("transitions need numbers")
+            return matrices.top_transitions(numbers, k)
+        ranked = matrices.top_pairs if kind == "pairs" else matrices.top_triples
+        if numbers:
+            return {number: ranked(k, number) for number in numbers}
+        return ranked(k)
@@ -0,0 +1,328 @@
+"""
+SQLite Draw Database
+Primary store for draw results, with pcso_lotto_data.json kept as an export
+for the dashboard.
+
+The database runs in WAL mode, so readers never block on a writer and
+always see the last committed state. Draws are unique per
+(game_type, date); bulk writes are executemany upserts inside a single
+transaction that only touch rows whose values actually changed.
+
+A full JSON export is written under a temporary name and renamed into
+place. The export keeps its metadata after the results, so draws that
+sort after its last draw (the usual incremental fetch) are appended by
+copying the file (a kernel copy, no JSON encoding), rewriting only the
+tail of the copy and renaming it into place; the meta table remembers
+where the tail starts.
+"""
+import json
+import os
+import shutil
+import sqlite3
+from datetime import datetime
+
+DB_FILE = "pcso_lotto.db"
+JSON_FILE = "pcso_lotto_data.json"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS draws (
+    id INTEGER PRIMARY KEY,
+    game TEXT NOT NULL,
+    game_type TEXT NOT NULL,
+    date TEXT NOT NULL,
+    numbers TEXT NOT NULL,
+    jackpot REAL NOT NULL DEFAULT 0,
+    winners INTEGER NOT NULL DEFAULT 0
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_draws_game_type_date ON draws (game_type, date);
+CREATE INDEX IF NOT EXISTS idx_draws_date ON draws (date);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+_COLUMNS = "game, game_type, date, numbers, jackpot, winners"
+
+# Newer values win; unchanged rows are left alone so they cost no writes
+_UPSERT = f"""
+INSERT INTO draws ({_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (game_type, date) DO UPDATE SET
+    game = excluded.game,
+    numbers = excluded.numbers,
+    jackpot = excluded.jackpot,
+    winners = excluded.winners
+WHERE draws.game IS NOT excluded.game
+   OR draws.numbers IS NOT excluded.numbers
+   OR draws.jackpot IS NOT excluded.jackpot
+   OR draws.winners IS NOT excluded.winners
+"""
+
+# Existing rows win
+_INSERT_NEW = f"INSERT OR IGNORE INTO draws ({_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?)"
+
+
+def _row(result):
+    return (
+        result["game"],
+        result["game_type"],
+        result["date"],
+        json.dumps(list(result["numbers"]), separators=(',', ':')),
+        float(result["jackpot"] or 0),
+        int(result["winners"] or 0)
+    )
+
+
+def _result(row):
+    game, game_type, date, numbers, jackpot, winners = row
+    return {
+        "game": game,
+        "game_type": game_type,
+        "date": date,
+        "numbers": json.loads(numbers),
+        "jackpot": jackpot,
+        "winners": winners
+    }
+
+
+def _batches(results, batch_size):
+    batch = []
+    for result in results:
+        batch.append(_row(result))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class DrawDatabase:
+    """
+    SQLite-backed draw store
+    """
+
+    def __init__(self, path=DB_FILE):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def write(self, results, mode='merge', batch_size=5000, source=None):
+        """
+        Write results in one transaction and return the number of rows changed.
+
+        mode is 'merge' (new values replace existing draws), 'append' (existing
+        draws are kept) or 'replace' (the table is emptied first).
+        """
+        statement = _INSERT_NEW if mode == 'append' else _UPSERT
+        before = self.conn.total_changes
+
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            if mode == 'replace':
+                self.conn.execute("DELETE FROM draws")
+            deleted = self.conn.total_changes - before
+
+            for batch in _batches(results, batch_size):
+                self.conn.executemany(statement, batch)
+
+            changed = self.conn.total_changes - before - deleted
+            if changed or deleted:
+                self._set_meta("last_updated", datetime.now().isoformat())
+            if source:
+                self._set_meta("source", source)
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+
+        return changed + deleted
+
+    def upsert(self, results, batch_size=5000):
+        return self.write(results, mode='merge', batch_size=batch_size)
+
+    def _set_meta(self, key, value):
+        self.conn.execute(
+            "INSERT INTO meta (key, value) VALUES (?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+            (key, value)
+        )
+
+    def get_meta(self, key, default=None):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM draws").fetchone()[0]
+
+    def iter_results(self, game_type=None, from_date=None, to_date=None):
+        """
+        Yield result dicts ordered by date, optionally filtered
+        """
+        clauses = []
+        params = []
+        if game_type:
+            clauses.append("game_type = ?")
+            params.append(game_type)
+        if from_date:
+            clauses.append("date >= ?")
+            params.append(from_date)
+        if to_date:
+            clauses.append("date <= ?")
+            params.append(to_date)
+
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        # A dedicated cursor reads from one consistent snapshot
+        cursor = self.conn.cursor()
+        cursor.execute(f"SELECT {_COLUMNS} FROM draws {where} ORDER BY date, game_type", params)
+        for row in cursor:
+            yield _result(row)
+
+    def load_results(self, **filters):
+        return list(self.iter_results(**filters))
+
+    def changed_results(self, results, keep_existing=False):
+        """
+        The results that are not stored yet or differ from the stored draw,
+        the last one winning for a key that repeats. With keep_existing
+        (append mode) only the draws that are not stored yet.
+        """
+        latest = {}
+        for result in results:
+            latest[(result["game_type"], result["date"])] = result
+        if not latest:
+            return []
+
+        # One join against a temporary table instead of a lookup per row
+        self.conn.execute(f"CREATE TEMP TABLE IF NOT EXISTS incoming ({_COLUMNS})")
+        self.conn.execute("BEGIN")
+        try:
+            self.conn.execute("DELETE FROM temp.incoming")
+            for batch in _batches(latest.values(), 5000):
+                self.conn.executemany(f"INSERT INTO temp.incoming ({_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?)", batch)
+            differs = "" if keep_existing else """
+                   OR d.game IS NOT i.game
+                   OR d.numbers IS NOT i.numbers
+                   OR d.jackpot IS NOT i.jackpot
+                   OR d.winners IS NOT i.winners"""
+            keys = set(self.conn.execute(f"""
+                SELECT i.game_type, i.date FROM temp.incoming i
+                LEFT JOIN draws d ON d.game_type = i.game_type AND d.date = i.date
+                WHERE d.id IS NULL{differs}
+            """))
+            self.conn.execute("DELETE FROM temp.incoming")
+        finally:
+            self.conn.execute("COMMIT")
+        return [result for key, result in latest.items() if key in keys]
+
+    def latest_dates(self):
+        """Newest draw date per game type"""
+        return dict(self.conn.execute("SELECT game_type, MAX(date) FROM draws GROUP BY game_type"))
+
+    def export_json(self, filename=JSON_FILE):
+        """
+        Write the pcso_lotto_data.json export atomically and return its size
+        """
+        tmp_filename = f"{filename}.{os.getpid()}.tmp"
+        total = 0
+        last = None
+
+        self.conn.execute("BEGIN")
+        try:
+            with open(tmp_filename, 'w') as f:
+                f.write('{\n  "results": [')
+                for result in self.iter_results():
+                    f.write(('\n    ' if total == 0 else ',\n    ') + json.dumps(result))
+                    total += 1
+                    last = result
+                tail = f.tell()
+                f.write(self._export_tail(total))
+        finally:
+            self.conn.execute("COMMIT")
+
+        os.replace(tmp_filename, filename)
+        return self._exported(filename, tail, total, last)
+
+    def append_json(self, filename, results):
+        """
+        Append results that all sort after the last exported draw to the
+        export. The export is copied, the tail of the copy is rewritten and
+        the copy renamed into place, so readers never see a partial file.
+        Returns the new size, or None if the export has to be written again
+        with export_json instead.
+        """
+        try:
+            size = os.path.getsize(filename)
+        except OSError:
+            return None
+        if self.get_meta("export_size") != str(size):
+            return None
+        if not results:
+            return size
+
+        rows = sorted((_result(_row(result)) for result in results), key=lambda r: (r["date"], r["game_type"]))
+        last = (self.get_meta("export_last_date", ""), self.get_meta("export_last_game_type", ""))
+        if (rows[0]["date"], rows[0]["game_type"]) <= last:
+            return None
+
+        total = int(self.get_meta("export_total"))
+        tail = int(self.get_meta("export_tail"))
+        tmp_filename = f"{filename}.{os.getpid()}.tmp"
+        shutil.copyfile(filename, tmp_filename)
+        with open(tmp_filename, 'r+') as f:
+            f.seek(tail)
+            for result in rows:
+                f.write(('\n    ' if total == 0 else ',\n    ') + json.dumps(result))
+                total += 1
+            tail = f.tell()
+            f.write(self._export_tail(total))
+            f.truncate()
+        os.replace(tmp_filename, filename)
+        return self._exported(filename, tail, total, rows[-1])
+
+    def _export_tail(self, total):
+        tail = '\n  ],\n'
+        tail += f'  "last_updated": {json.dumps(self.get_meta("last_updated", datetime.now().isoformat()))},\n'
+        source = self.get_meta("source")
+        if source:
+            tail += f'  "source": {json.dumps(source)},\n'
+        return tail + f'  "total_results": {total}\n}}\n'
+
+    def _exported(self, filename, tail, total, last):
+        """Remember the layout of the export for append_json"""
+        size = os.path.getsize(filename)
+        self.conn.execute("BEGIN IMMEDIATE")
+        for key, value in (("export_size", size), ("export_tail", tail), ("export_total", total),
+                           ("export_last_date", last["date"] if last else ""),
+                           ("export_last_game_type", last["game_type"] if last else "")):
+            self._set_meta(key, str(value))
+        self.conn.execute("COMMIT")
+        return size
+
+
+def open_database(path=DB_FILE, json_file=JSON_FILE):
+    """
+    Open the database, seeding it from the JSON export the first time
+    """
+    db = DrawDatabase(path)
+
+    if db.count() == 0 and os.path.exists(json_file):
+        try:
+            with open(json_file, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Could not seed database from {json_file}: {e}")
+            return db
+
+        db.write(data.get("results", []), mode='merge', source=data.get("source"))
+        if data.get("last_updated"):
+            db.conn.execute("BEGIN IMMEDIATE")
+            db._set_meta("last_updated", data["last_updated"])
+            db.conn.execute("COMMIT")
+        print(f"Seeded {path} with {db.count()} results from {json_file}")
+
+    return db
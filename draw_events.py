@@ -0,0 +1,410 @@
+"""
+Draw Events
+The log of data changes pushed to dashboards over /api/stream.
+
+Every publish that changes the static shards appends one event to
+.pcso_cache/events.jsonl: the draws that were added or changed, the
+(game_type, date) keys of draws that disappeared, the new manifest entries
+of the changed shards and per-game deltas of the aggregates (draw count,
+number frequencies, jackpot and winner totals). The rows come from diffing
+each changed shard against its previous version, which the export keeps
+for one more round. A change too large to be worth diffing on the client,
+like the first export or a full re-import, becomes a "reload" event
+instead.
+
+Event ids increase by one per event and are assigned under a file lock,
+so any process that publishes (the API server's refresh worker, a cron
+fetch, a CSV import) writes to the same sequence.
+
+An EventHub tails the log with one thread and encodes each new event
+once. A StreamServer serves the streams from a single asyncio event loop
+on its own port (the API redirects /api/stream there): every connected
+client is a socket of that loop, so hundreds of idle dashboards cost no
+server threads, and each new event is one file read and one write per
+socket. Streams that reconnect with a Last-Event-ID get the events they
+missed from the hub's backlog.
+"""
+import asyncio
+import fcntl
+import json
+import os
+import socket
+import threading
+import time
+from collections import deque
+from urllib.parse import parse_qs
+
+from static_export import EXPORT_DIR
+
+EVENTS_FILE = os.path.join(".pcso_cache", "events.jsonl")
+
+# Events kept in the log and in every hub's backlog
+KEEP_EVENTS = 500
+
+# Changed draws above which clients are told to reload instead
+MAX_EVENT_DRAWS = 5000
+
+# Seconds between checks of the log for new events
+POLL_SECONDS = 1.0
+
+# Seconds between keep-alive comments on an idle stream
+HEARTBEAT_SECONDS = 15.0
+
+# Milliseconds a disconnected EventSource waits before reconnecting
+RETRY_MS = 5000
+
+# Port of the stream server
+STREAM_PORT = 5001
+
+# Seconds a client gets to send its request
+REQUEST_SECONDS = 10.0
+
+# Unsent bytes above which a stream that is not reading gets dropped
+MAX_STREAM_BUFFER = 1 << 20
+
+STREAM_HEADERS = (
+    b"HTTP/1.1 200 OK\r\n"
+    b"Content-Type: text/event-stream\r\n"
+    b"Cache-Control: no-cache\r\n"
+    b"X-Accel-Buffering: no\r\n"
+    b"Access-Control-Allow-Origin: *\r\n"
+    b"Connection: close\r\n\r\n"
+)
+
+
+def _shard_rows(directory, shard):
+    """{date: result dict} of a shard file"""
+    if shard is None:
+        return {}
+    with open(os.path.join(directory, shard["file"]), 'r') as f:
+        payload = json.load(f)
+    return {
+        date: {
+            "game": payload["game"],
+            "game_type": payload["game_type"],
+            "date": date,
+            "numbers": numbers,
+            "jackpot": jackpot,
+            "winners": winners
+        }
+        for date, numbers, jackpot, winners in zip(payload["dates"], payload["numbers"],
+                                                   payload["jackpot"], payload["winners"])
+    }
+
+
+def _apply(games, game_type, row, sign):
+    delta = games.setdefault(game_type, {
+        "draws": 0,
+        "number_frequency": {},
+        "jackpot_total": 0.0,
+        "winners_total": 0
+    })
+    delta["draws"] += sign
+    for n in row["numbers"]:
+        key = str(n)
+        delta["number_frequency"][key] = delta["number_frequency"].get(key, 0) + sign
+    delta["jackpot_total"] += sign * (row["jackpot"] or 0)
+    delta["winners_total"] += sign * (row["winners"] or 0)
+
+
+def shard_delta(changes, directory=EXPORT_DIR):
+    """
+    Draws added or changed, keys of draws removed and per-game aggregate
+    deltas for the shard changes reported by export_static
+    """
+    draws, removed, games = [], [], {}
+    for change in changes:
+        before = _shard_rows(directory, change["previous"])
+        after = _shard_rows(directory, change["shard"])
+        game_type = (change["shard"] or change["previous"])["game_type"]
+
+        for date, row in after.items():
+            old = before.get(date)
+            if old == row:
+                continue
+            draws.append(row)
+            if old is not None:
+                _apply(games, game_type, old, -1)
+            _apply(games, game_type, row, 1)
+        for date, old in before.items():
+            if date not in after:
+                removed.append([game_type, date])
+                _apply(games, game_type, old, -1)
+
+    for delta in games.values():
+        delta["number_frequency"] = {n: c for n, c in delta["number_frequency"].items() if c}
+        delta["jackpot_total"] = round(delta["jackpot_total"], 2)
+    draws.sort(key=lambda r: (r["date"], r["game_type"]))
+    return draws, removed, games
+
+
+class EventLog:
+    """
+    Append-only JSON lines file of events with sequential ids
+    """
+
+    def __init__(self, filename=EVENTS_FILE, keep=KEEP_EVENTS):
+        self.filename = filename
+        self.keep = keep
+
+    def read(self):
+        """Every event in the log, oldest first"""
+        if not os.path.exists(self.filename):
+            return []
+        events = []
+        with open(self.filename, 'r') as f:
+            for line in f:
+                try:
+                    events.append(json.loads(line))
+                except ValueError:
+                    # A line still being written
+                    break
+        return events
+
+    def append(self, event_type, data):
+        """Add an event and return it with its id"""
+        os.makedirs(os.path.dirname(self.filename) or '.', exist_ok=True)
+        with open(self.filename + ".lock", 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            events = self.read()
+            event = {
+                "id": events[-1]["id"] + 1 if events else 1,
+                "event": event_type,
+                "time": time.time(),
+                "data": data
+            }
+            line = json.dumps(event, separators=(',', ':')) + '\n'
+
+            if len(events) >= 2 * self.keep:
+                # Rewrite with the newest events; tailers notice the new file
+                tmp_filename = f"{self.filename}.{os.getpid()}.tmp"
+                with open(tmp_filename, 'w') as f:
+                    for old in events[-self.keep:]:
+                        f.write(json.dumps(old, separators=(',', ':')) + '\n')
+                    f.write(line)
+                os.replace(tmp_filename, self.filename)
+            else:
+                with open(self.filename, 'a') as f:
+                    f.write(line)
+        return event
+
+
+def publish_changes(export, version=None, directory=EXPORT_DIR, log=None):
+    """
+    Append the event for an export_static summary. Returns the event, or
+    None if no shard changed.
+    """
+    if not export["changes"]:
+        return None
+    log = log or EventLog()
+
+    draws, removed, games = shard_delta(export["changes"], directory)
+    if export["first_export"] or len(draws) + len(removed) > MAX_EVENT_DRAWS:
+        return log.append("reload", {"version": version})
+    if not draws and not removed:
+        return None
+
+    return log.append("draws", {
+        "version": version,
+        "draws": draws,
+        "removed": removed,
+        "games": games,
+        "shards": [change["shard"] for change in export["changes"] if change["shard"]],
+        "replaced": [change["previous"]["file"] for change in export["changes"] if change["previous"]]
+    })
+
+
+def encode_event(event):
+    """The server-sent events frame of an event"""
+    data = json.dumps(dict(event["data"], id=event["id"]), separators=(',', ':'))
+    return f"id: {event['id']}\nevent: {event['event']}\ndata: {data}\n\n".encode('utf-8')
+
+
+class EventHub:
+    """
+    Tails the event log on one thread and tells listeners about new events
+    """
+
+    def __init__(self, log=None, keep=KEEP_EVENTS, poll=POLL_SECONDS):
+        self.log = log or EventLog()
+        self.poll = poll
+        self.backlog = deque(maxlen=keep)
+        self.last_id = 0
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._position = None
+        self._thread = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._read()
+                self._thread = threading.Thread(target=self._tail, name="event-tailer", daemon=True)
+                self._thread.start()
+
+    def listen(self, callback):
+        """Call callback() from the tailer thread after new events arrive"""
+        self._listeners.append(callback)
+
+    def _read(self):
+        """Load events appended since the last read into the backlog"""
+        try:
+            stat = os.stat(self.log.filename)
+        except FileNotFoundError:
+            return False
+        position = self._position
+        if position is None or position[0] != stat.st_ino or stat.st_size < position[1]:
+            # First read, or the log was rewritten: ids tell what is new
+            position = (stat.st_ino, 0)
+        if stat.st_size == position[1]:
+            return False
+
+        added = False
+        with open(self.log.filename, 'rb') as f:
+            f.seek(position[1])
+            offset = position[1]
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                offset += len(line)
+                event = json.loads(line)
+                if event["id"] > self.last_id:
+                    self.backlog.append((event["id"], encode_event(event)))
+                    self.last_id = event["id"]
+                    added = True
+        self._position = (stat.st_ino, offset)
+        return added
+
+    def _tail(self):
+        while True:
+            time.sleep(self.poll)
+            with self._lock:
+                try:
+                    added = self._read()
+                except (OSError, ValueError) as e:
+                    print(f"Event log unreadable: {e}")
+                    added = False
+            if added:
+                for callback in self._listeners:
+                    callback()
+
+    def newest(self):
+        with self._lock:
+            return self.last_id
+
+    def frames(self, last_id, upto):
+        """
+        Frames of the events after last_id up to upto, or a reload frame
+        if last_id is older than the backlog
+        """
+        with self._lock:
+            if self.backlog and last_id < self.backlog[0][0] - 1:
+                return [encode_event({"id": upto, "event": "reload", "data": {}})]
+            return [frame for event_id, frame in self.backlog if last_id < event_id <= upto]
+
+
+event_hub = EventHub()
+
+
+class StreamServer:
+    """
+    Serves /api/stream to every client from one asyncio event loop
+
+    Connected streams are just sockets of the loop: new events from the hub
+    are written to all of them at once, and an idle stream costs no thread
+    of the API server. The API redirects /api/stream here.
+    """
+
+    def __init__(self, hub=event_hub, heartbeat=HEARTBEAT_SECONDS, max_buffer=MAX_STREAM_BUFFER):
+        self.hub = hub
+        self.heartbeat = heartbeat
+        self.max_buffer = max_buffer
+        self.clients = set()
+        self.last_id = 0
+        self._loop = None
+        self._socket = None
+        self._thread = None
+
+    def start(self, host='0.0.0.0', port=STREAM_PORT):
+        """Listen on host:port and serve streams on a background thread"""
+        if self._thread is not None:
+            return
+        self._socket = socket.create_server((host, port))
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_until_complete, args=(self._serve(),),
+                                        name="event-streams", daemon=True)
+        self._thread.start()
+
+    def close_listener(self):
+        """Close this process's copy of the listening socket (after fork)"""
+        if self._socket is not None:
+            self._socket.close()
+
+    async def _serve(self):
+        server = await asyncio.start_server(self._client, sock=self._socket)
+        self.hub.listen(lambda: self._loop.call_soon_threadsafe(self._fan_out))
+        self.hub.start()
+        self.last_id = self.hub.newest()
+        async with server:
+            while True:
+                await asyncio.sleep(self.heartbeat)
+                self._send(b": keep-alive\n\n")
+
+    def _fan_out(self):
+        """Send every client the events the hub has read since the last call"""
+        newest = self.hub.newest()
+        if newest > self.last_id:
+            frames = self.hub.frames(self.last_id, newest)
+            self.last_id = newest
+            self._send(b"".join(frames))
+
+    def _send(self, data):
+        for writer in list(self.clients):
+            if writer.transport.get_write_buffer_size() > self.max_buffer:
+                # Not reading; it reconnects with its Last-Event-ID
+                self.clients.discard(writer)
+                writer.transport.abort()
+            else:
+                writer.write(data)
+
+    async def _client(self, reader, writer):
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), REQUEST_SECONDS)
+            request_line, *header_lines = head.decode('latin-1').split("\r\n")
+            method, target, _ = request_line.split(" ", 2)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                ConnectionError, ValueError):
+            writer.close()
+            return
+
+        path, _, query = target.partition("?")
+        if method != "GET" or path != "/api/stream":
+            writer.write(b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+            writer.close()
+            return
+        headers = {}
+        for line in header_lines:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        last_id = headers.get("last-event-id") or parse_qs(query).get("last_event_id", [""])[0]
+
+        # Catch the other clients up first, so this one joins at self.last_id
+        self._fan_out()
+        if last_id.isdigit() and int(last_id) <= self.last_id:
+            missed = self.hub.frames(int(last_id), self.last_id)
+        else:
+            missed = []
+        writer.write(STREAM_HEADERS + f"retry: {RETRY_MS}\n: connected\n\n".encode('utf-8') + b"".join(missed))
+        self.clients.add(writer)
+        try:
+            # Clients send nothing more; EOF means they went away
+            while await reader.read(1024):
+                pass
+        except ConnectionError:
+            pass
+        finally:
+            self.clients.discard(writer)
+            writer.close()
+
+
+stream_server = StreamServer()
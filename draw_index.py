@@ -0,0 +1,186 @@
+"""
+Draw Query Index
+Date-range and page lookups over the column store for the API server.
+
+Every game's columns are already sorted by date, so a game's range is two
+binary searches of its day column. Queries across all games use a combined
+index of (day, game, row) built once per store version, which is sorted the
+same way. Pages are served newest first and only the rows of the requested
+page are turned into result dicts.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from column_store import STORE_DIR, ColumnStore, date_to_day, store_version
+from cooccurrence import CooccurrenceStore
+from draw_record import is_lotto_game
+from frequency_index import FrequencyStore
+
+MAX_PER_PAGE = 500
+
+
+class DrawIndex:
+    """
+    Range and page queries over one published build of the column store
+    """
+
+    def __init__(self, store, version):
+        self.store = store
+        self.version = version
+        self.frequency = FrequencyStore(store=store)
+        self.cooccurrence = CooccurrenceStore(store=store)
+        self.games = store.load_all()
+        self.game_types = sorted(self.games)
+
+        # Combined index of every draw, ordered by day and then game type
+        days = [np.asarray(self.games[g].days) for g in self.game_types]
+        if days:
+            all_days = np.concatenate(days)
+            game_ids = np.repeat(np.arange(len(days), dtype=np.int16), [len(d) for d in days])
+            rows = np.concatenate([np.arange(len(d), dtype=np.int64) for d in days])
+        else:
+            all_days = np.zeros(0, np.int32)
+            game_ids = np.zeros(0, np.int16)
+            rows = np.zeros(0, np.int64)
+        order = np.lexsort((game_ids, all_days))
+        self.days = all_days[order]
+        self.game_ids = game_ids[order]
+        self.rows = rows[order]
+
+    def _bounds(self, days, from_date, to_date):
+        lo = 0 if not from_date else int(np.searchsorted(days, date_to_day(from_date), 'left'))
+        hi = len(days) if not to_date else int(np.searchsorted(days, date_to_day(to_date), 'right'))
+        return lo, max(lo, hi)
+
+    def count(self, game_type=None, from_date=None, to_date=None):
+        if game_type:
+            if game_type not in self.games:
+                return 0
+            lo, hi = self._bounds(self.games[game_type].days, from_date, to_date)
+        else:
+            lo, hi = self._bounds(self.days, from_date, to_date)
+        return hi - lo
+
+    def number_frequency(self, game_type=None, from_date=None, to_date=None):
+        """
+        ({number: count}, draws) over [from_date, to_date] from the prefix-sum
+        indexes. With no game, the 6/xx games are combined.
+        """
+        if game_type:
+            if game_type not in self.games:
+                return {}, 0
+            return self.frequency.window(game_type, from_date, to_date)
+
+        combined = {}
+        total = 0
+        for game_type in self.game_types:
+            if is_lotto_game(game_type):
+                counts, draws = self.frequency.window(game_type, from_date, to_date)
+                total += draws
+                for number, count in counts.items():
+                    combined[number] = combined.get(number, 0) + count
+        return combined, total
+
+    def page(self, game_type=None, from_date=None, to_date=None, page=1, per_page=15):
+        """
+        One page of results, newest first, with the total count
+        """
+        per_page = max(1, min(per_page, MAX_PER_PAGE))
+        page = max(1, page)
+
+        if game_type:
+            if game_type not in self.games:
+                return {"page": page, "per_page": per_page, "total": 0, "pages": 0, "results": []}
+            columns = self.games[game_type]
+            lo, hi = self._bounds(columns.days, from_date, to_date)
+        else:
+            lo, hi = self._bounds(self.days, from_date, to_date)
+
+        total = hi - lo
+        # Newest first: page 1 ends at hi
+        end = hi - (page - 1) * per_page
+        start = max(lo, end - per_page)
+
+        results = []
+        if end > start:
+            if game_type:
+                results = columns.take(slice(start, end)).results()
+            else:
+                for game_id, row in zip(self.game_ids[start:end].tolist(), self.rows[start:end].tolist()):
+                    results.extend(self.games[self.game_types[game_id]].take(slice(row, row + 1)).results())
+            results.reverse()
+
+        return {
+            "page": page,
+            "per_page": per_page,
+            "total": total,
+            "pages": (total + per_page - 1) // per_page,
+            "results": results
+        }
+
+
+class QueryCache:
+    """
+    LRU cache of query results for one store version at a time.
+
+    compute(index, *args) is called on a miss; everything cached is dropped
+    when a query arrives for a newer store version.
+    """
+
+    def __init__(self, compute, size=256):
+        self.compute = compute
+        self.size = size
+        self.version = None
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, index, *args):
+        with self._lock:
+            if self.version != index.version:
+                # New draws arrived; nothing cached for the old data is valid
+                self.entries.clear()
+                self.version = index.version
+            if args in self.entries:
+                self.entries.move_to_end(args)
+                self.hits += 1
+                return self.entries[args]
+            self.misses += 1
+
+        result = self.compute(index, *args)
+
+        with self._lock:
+            if self.version == index.version:
+                self.entries[args] = result
+                while len(self.entries) > self.size:
+                    self.entries.popitem(last=False)
+        return result
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def current_index(directory=STORE_DIR):
+    """
+    The index of the currently published store, rebuilt when a refresh
+    publishes a new version. Returns None if the store has not been built.
+    """
+    global _index
+    with _index_lock:
+        while True:
+            version = store_version(directory)
+            if version is None:
+                return None
+            if _index is not None and _index.version == version:
+                return _index
+
+            # Pin the build the symlink points at; retry if a refresh swapped it meanwhile
+            build = os.path.realpath(directory)
+            if store_version(directory) == version:
+                _index = DrawIndex(ColumnStore(build), version)
+                return _index
@@ -0,0 +1,253 @@
+"""
+Draw Record and Normalization
+Shared parsing for PCSO draw rows, used by the fetcher, the CSV importer and
+the statistics code.
+
+Draw dates and game names repeat constantly (a few thousand dates, about 15
+game names), so their normalization is memoized. Jackpot and winner strings
+go through precompiled patterns instead of chains of str.replace().
+"""
+import re
+from datetime import date
+from functools import lru_cache
+
+# Exact PCSO game names and their game types
+GAME_NAME_TYPES = {
+    "Ultra Lotto 6/58": "6/58",
+    "Grand Lotto 6/55": "6/55",
+    "Superlotto 6/49": "6/49",
+    "Super Lotto 6/49": "6/49",
+    "Megalotto 6/45": "6/45",
+    "Mega Lotto 6/45": "6/45",
+    "Lotto 6/42": "6/42",
+    "6D Lotto": "6D",
+    "4D Lotto": "4D",
+    "3D Lotto 2PM": "3D-2PM",
+    "3D Lotto 5PM": "3D-5PM",
+    "3D Lotto 9PM": "3D-9PM",
+    "2D Lotto 2PM": "2D-2PM",
+    "2D Lotto 5PM": "2D-5PM",
+    "2D Lotto 9PM": "2D-9PM"
+}
+
+# Game types whose combination may be written as one run of digits
+DIGIT_GAME_PREFIXES = ('6D', '4D', '3D')
+
+# Game type prefix, numbers per draw, lowest and highest number of the
+# digit games; the 6/xx games draw 6 different numbers from 1 to xx
+DIGIT_GAME_NUMBERS = (
+    ('6D', 6, 0, 9),
+    ('4D', 4, 0, 9),
+    ('3D', 3, 0, 9),
+    ('2D', 2, 1, 31)
+)
+
+_US_DATE = re.compile(r'(\d{1,2})/(\d{1,2})/(\d{4})')
+_ISO_DATE = re.compile(r'(\d{4})-(\d{2})-(\d{2})')
+_NOT_AMOUNT = re.compile(r'[^\d.\-]')
+_NOT_DIGIT = re.compile(r'[^\d\-]')
+
+
+@lru_cache(maxsize=None)
+def normalize_game_type(game_name):
+    """Game type for a PCSO game name, e.g. 'Ultra Lotto 6/58' -> '6/58'"""
+    game_name = game_name.strip()
+    if game_name in GAME_NAME_TYPES:
+        return GAME_NAME_TYPES[game_name]
+
+    game_name_lower = game_name.lower()
+
+    for lotto in ('6/58', '6/55', '6/49', '6/45', '6/42'):
+        if lotto in game_name:
+            return lotto
+
+    if '6d' in game_name_lower:
+        return '6D'
+    if '4d' in game_name_lower:
+        return '4D'
+
+    for digits in ('3d', '2d'):
+        if digits in game_name_lower:
+            for draw_time in ('2pm', '5pm', '9pm'):
+                if draw_time in game_name_lower:
+                    return f"{digits.upper()}-{draw_time.upper()}"
+            return digits.upper()
+
+    return game_name
+
+
+def is_lotto_game(game_type):
+    """True for the 6/xx pick-six games"""
+    return game_type.startswith("6/")
+
+
+def number_rule(game_type):
+    """
+    (numbers per draw, lowest, highest) of a game, or None for a game type
+    that is not known
+    """
+    if is_lotto_game(game_type):
+        highest = game_type[2:]
+        return (6, 1, int(highest)) if highest.isdigit() else None
+    for prefix, count, lowest, highest in DIGIT_GAME_NUMBERS:
+        if game_type.startswith(prefix):
+            return count, lowest, highest
+    return None
+
+
+def check_numbers(numbers, game_type):
+    """
+    Raise ValueError if the numbers cannot be a draw of the game: wrong
+    count, out of range or, in the 6/xx games, repeated
+    """
+    rule = number_rule(game_type)
+    if rule is None:
+        return
+    count, lowest, highest = rule
+    if len(numbers) != count:
+        raise ValueError(f"{game_type} draws {count} numbers, got {len(numbers)}")
+    for n in numbers:
+        if not lowest <= n <= highest:
+            raise ValueError(f"{game_type} number out of range {lowest}-{highest}: {n}")
+    if is_lotto_game(game_type) and len(set(numbers)) != count:
+        raise ValueError(f"{game_type} numbers repeat: {numbers}")
+
+
+@lru_cache(maxsize=16384)
+def normalize_date(date_str):
+    """
+    Normalize MM/DD/YYYY or YYYY-MM-DD to YYYY-MM-DD
+    Raises ValueError for anything else
+    """
+    date_str = date_str.strip()
+
+    match = _US_DATE.fullmatch(date_str)
+    if match:
+        month, day, year = (int(part) for part in match.groups())
+    else:
+        match = _ISO_DATE.fullmatch(date_str)
+        if not match:
+            raise ValueError(f"invalid date: {date_str!r}")
+        year, month, day = (int(part) for part in match.groups())
+
+    try:
+        # Rejects days past the end of the month, like 02/30
+        return date(year, month, day).isoformat()
+    except ValueError:
+        raise ValueError(f"invalid date: {date_str!r}")
+
+
+def parse_numbers(combination, game_type=''):
+    """
+    Parse a combination like '35-37-14-01-43-12', '3 0 9' or '306739'
+    """
+    tokens = combination.replace('-', ' ').replace(',', ' ').split()
+
+    # Digit games are sometimes written without separators
+    if len(tokens) == 1 and len(tokens[0]) > 1 and game_type.startswith(DIGIT_GAME_PREFIXES):
+        tokens = list(tokens[0])
+
+    try:
+        numbers = tuple(int(token) for token in tokens)
+    except ValueError:
+        raise ValueError(f"invalid numbers: {combination!r}")
+
+    if not numbers:
+        raise ValueError("missing numbers")
+    return numbers
+
+
+def parse_jackpot(jackpot_str):
+    """Parse 'PHP 49,500,000.00' or '₱4,500' into a float, 0.0 if unparseable"""
+    try:
+        return float(_NOT_AMOUNT.sub('', jackpot_str))
+    except ValueError:
+        return 0.0
+
+
+def parse_winners(winners_str):
+    """Parse '1,234' into an int, 0 if unparseable"""
+    try:
+        return int(_NOT_DIGIT.sub('', winners_str))
+    except ValueError:
+        return 0
+
+
+class Draw:
+    """
+    A single draw result
+    """
+    __slots__ = ('game', 'game_type', 'date', 'numbers', 'jackpot', 'winners')
+
+    def __init__(self, game, game_type, date, numbers, jackpot, winners):
+        self.game = game
+        self.game_type = game_type
+        self.date = date
+        self.numbers = numbers
+        self.jackpot = jackpot
+        self.winners = winners
+
+    @property
+    def key(self):
+        """Draws are unique per (game_type, date)"""
+        return (self.game_type, self.date)
+
+    def to_dict(self):
+        return {
+            "game": self.game,
+            "game_type": self.game_type,
+            "date": self.date,
+            "numbers": list(self.numbers),
+            "jackpot": self.jackpot,
+            "winners": self.winners
+        }
+
+    @classmethod
+    def from_dict(cls, result):
+        return cls(
+            result["game"],
+            result["game_type"],
+            result["date"],
+            tuple(result["numbers"]),
+            result["jackpot"],
+            result["winners"]
+        )
+
+    def _fields(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __eq__(self, other):
+        if not isinstance(other, Draw):
+            return NotImplemented
+        return self._fields() == other._fields()
+
+    def __hash__(self):
+        # Equal draws hash alike, so draws work in sets and as dict keys
+        return hash(self._fields())
+
+    def __repr__(self):
+        return f"Draw({self.game_type} {self.date} {'-'.join(map(str, self.numbers))})"
+
+
+def parse_draw(game_name, combination, draw_date, jackpot_str='0', winners_str='0'):
+    """
+    Build a Draw from the raw strings of one result row
+    Raises ValueError if the game, numbers or date cannot be parsed, or the
+    numbers do not fit the game
+    """
+    game_name = game_name.strip()
+    if not game_name:
+        raise ValueError("missing game name")
+
+    game_type = normalize_game_type(game_name)
+    numbers = parse_numbers(combination, game_type)
+    check_numbers(numbers, game_type)
+
+    return Draw(
+        game_name,
+        game_type,
+        normalize_date(draw_date),
+        numbers,
+        parse_jackpot(jackpot_str or '0'),
+        parse_winners(winners_str or '0')
+    )
@@ -3,16 +3,50 @@ PCSO Lotto Data Fetcher
 Fetches historical lotto results from PCSO official website and saves to JSON
 """
 import requests
-import json
+import os
+import sys
 from datetime import datetime, timedelta
 import time
-from bs4 import BeautifulSoup
 import re
 
+import metrics
+from aggregate_store import refresh_statistics
+from column_store import ColumnStore, STORE_DIR, store_version
+from draw_db import open_database
+from draw_record import GAME_NAME_TYPES, parse_draw
+from refresh_lock import refresh_lock
+from response_cache import ResponseCache
+from stats_engine import statistics_from_results
+from synthetic_history import synthetic_results
+from results_parser import ResultRows, extract_form_fields
+
+# Games whose newest stored draw is older than this (relative to the last
+# update) are treated as discontinued and do not widen the incremental window
+STALE_GAME_DAYS = 30
+
+PCSO_SEARCH_URL = "https://www.pcso.gov.ph/SearchLottoResult.aspx"
+
+# Value of the game dropdown that searches every game
+ALL_GAMES = '0'
+
+
+class FetchBlockedError(Exception):
+    """Raised when the PCSO website refuses a request"""
+
+
 class PCSODataFetcher:
-    def __init__(self):
-        self.base_url = "https://www.pcso.gov.ph/SearchLottoResult.aspx"
+    def __init__(self, base_url=None, rate_limiter=None, cache=None):
+        self.base_url = base_url or PCSO_SEARCH_URL
+        # Optional object with an acquire() method, called before every request
+        self.rate_limiter = rate_limiter
+        # Parsed search results are cached on disk; pass cache=False to disable
+        self.cache = ResponseCache() if cache is None else (cache or None)
+        self._form_fields = None
         self.session = requests.Session()
+        # One pooled keep-alive connection serves every request of a long-lived fetcher
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=4)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
         # Use more realistic headers to avoid bot detection
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
@@ -28,29 +62,17 @@ class PCSODataFetcher:
         })
         
         # Game type mapping
-        self.game_mapping = {
-            "Ultra Lotto 6/58": "6/58",
-            "Grand Lotto 6/55": "6/55",
-            "Superlotto 6/49": "6/49",
-            "Super Lotto 6/49": "6/49",
-            "Megalotto 6/45": "6/45",
-            "Mega Lotto 6/45": "6/45",
-            "Lotto 6/42": "6/42",
-            "6D Lotto": "6D",
-            "4D Lotto": "4D",
-            "3D Lotto 2PM": "3D-2PM",
-            "3D Lotto 5PM": "3D-5PM",
-            "3D Lotto 9PM": "3D-9PM",
-            "2D Lotto 2PM": "2D-2PM",
-            "2D Lotto 5PM": "2D-5PM",
-            "2D Lotto 9PM": "2D-9PM"
-        }
+        self.game_mapping = GAME_NAME_TYPES
+        
+        # Set whenever a fetch had to fall back to generated sample data
+        self.last_fetch_was_sample = False
         
     def fetch_from_pcso_website(self, start_date, end_date):
         """
         Scrape PCSO website for actual lotto results
         """
         results = []
+        self.last_fetch_was_sample = False
         
         print("Fetching PCSO lotto results from official website...")
         print(f"Date range: {start_date} to {end_date}")
@@ -61,102 +83,59 @@ class PCSODataFetcher:
         print("  2. Use a different data source/API")
         print("  3. Run from a different IP/network\n")
         
+        cached = self._cached_window(start_date, end_date)
+        if cached is not None:
+            print(f"Loaded {len(cached)} results from the response cache")
+            return cached
+        
         try:
-            # Add delay to appear more human-like
-            time.sleep(2)
-            
-            # Get the initial page to extract ViewState and other form data
-            print("Loading PCSO website...")
-            response = self.session.get(self.base_url, timeout=30)
-            
-            if response.status_code == 403 or 'Access Denied' in response.text:
-                print("⚠️  Website access denied (bot protection active)")
-                print("Generating sample data instead...")
-                return self._generate_sample_data(start_date, end_date)
-            
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            # Extract form fields needed for POST request
-            viewstate = soup.find('input', {'name': '__VIEWSTATE'})
-            viewstate_value = viewstate['value'] if viewstate else ''
-            
-            viewstategenerator = soup.find('input', {'name': '__VIEWSTATEGENERATOR'})
-            viewstategenerator_value = viewstategenerator['value'] if viewstategenerator else ''
-            
-            eventvalidation = soup.find('input', {'name': '__EVENTVALIDATION'})
-            eventvalidation_value = eventvalidation['value'] if eventvalidation else ''
-            
-            if not viewstate_value:
-                print("⚠️  Could not extract form data from website")
-                print("Generating sample data instead...")
-                return self._generate_sample_data(start_date, end_date)
-            
-            # Prepare form data for search
-            form_data = {
-                '__VIEWSTATE': viewstate_value,
-                '__VIEWSTATEGENERATOR': viewstategenerator_value,
-                '__EVENTVALIDATION': eventvalidation_value,
-                'ctl00$ctl00$cphContainer$cpContent$txtStartDate': start_date,
-                'ctl00$ctl00$cphContainer$cpContent$txtEndDate': end_date,
-                'ctl00$ctl00$cphContainer$cpContent$ddlSelectGame': '0',  # 0 = All games
-                'ctl00$ctl00$cphContainer$cpContent$btnSearch': 'Search Lotto'
-            }
-            
-            # Submit the search
-            print("Submitting search request...")
-            time.sleep(2)  # Another delay
-            response = self.session.post(self.base_url, data=form_data, timeout=30)
+            # A long-lived fetcher reuses the form state of its last search
+            response = self._resubmit_search(start_date, end_date)
             
-            if response.status_code == 403 or 'Access Denied' in response.text:
-                print("⚠️  Search request denied (bot protection active)")
-                print("Generating sample data instead...")
-                return self._generate_sample_data(start_date, end_date)
-            
-            # Parse the results
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            # Find the results table - PCSO uses a specific ID or class
-            results_table = soup.find('table', id='GridView1')
-            
-            if not results_table:
-                # Try alternative selectors
-                results_table = soup.find('table', class_='grid')
-                
-            if not results_table:
-                # Try finding any table with lotto results
-                tables = soup.find_all('table')
-                for table in tables:
-                    headers = table.find_all('th')
-                    if headers and any('LOTTO GAME' in th.text for th in headers):
-                        results_table = table
-                        break
-            
-            if results_table:
-                rows = results_table.find_all('tr')[1:]  # Skip header row
+            if response is None:
+                # Add delay to appear more human-like
+                time.sleep(2)
                 
-                print(f"Found {len(rows)} result rows")
+                # Get the initial page to extract ViewState and other form data
+                print("Loading PCSO website...")
+                try:
+                    form_fields = self._load_search_form()
+                except FetchBlockedError:
+                    print("⚠️  Website access denied (bot protection active)")
+                    print("Generating sample data instead...")
+                    return self._generate_sample_data(start_date, end_date)
                 
-                for row in rows:
-                    cols = row.find_all('td')
-                    if len(cols) >= 5:
-                        game_name = cols[0].text.strip()
-                        combinations = cols[1].text.strip()
-                        draw_date = cols[2].text.strip()
-                        jackpot = cols[3].text.strip()
-                        winners = cols[4].text.strip()
-                        
-                        # Parse the data
-                        result = self._parse_result(game_name, combinations, draw_date, jackpot, winners)
-                        if result:
-                            results.append(result)
+                if not form_fields:
+                    print("⚠️  Could not extract form data from website")
+                    print("Generating sample data instead...")
+                    return self._generate_sample_data(start_date, end_date)
                 
+                # Submit the search
+                print("Submitting search request...")
+                time.sleep(2)  # Another delay
+                try:
+                    response = self._submit_search(form_fields, start_date, end_date)
+                except FetchBlockedError:
+                    print("⚠️  Search request denied (bot protection active)")
+                    print("Generating sample data instead...")
+                    return self._generate_sample_data(start_date, end_date)
+            
+            # Keep the postback form state for the next search
+            self._form_fields = extract_form_fields(response.content)
+            
+            # Parse the results
+            rows = ResultRows(response.content)
+            results = self._parse_rows(rows)
+            
+            if rows.table_found:
                 print(f"Successfully parsed {len(results)} results")
+                self._cache_window(start_date, end_date, results)
             else:
                 print("No results table found.")
                 print("Response preview:", response.text[:500])
                 print("\nUsing fallback method...")
                 # Fallback: try to find results in divs or other structure
-                results = self._parse_alternative_structure(soup, start_date, end_date)
+                results = self._parse_alternative_structure(response.text, start_date, end_date)
             
         except Exception as e:
             print(f"Error fetching data: {e}")
@@ -165,63 +144,162 @@ class PCSODataFetcher:
         
         return results
     
+    def _resubmit_search(self, start_date, end_date):
+        """
+        Submit a search with the form state kept from the previous one.
+        
+        Returns None when there is no usable form state, so the caller loads
+        the search page again.
+        """
+        if not self._form_fields:
+            return None
+        
+        print("Submitting search request with the previous form state...")
+        try:
+            response = self._submit_search(self._form_fields, start_date, end_date)
+        except Exception as e:
+            print(f"Previous form state rejected ({e}), reloading the search page")
+            self._form_fields = None
+            return None
+        
+        if not extract_form_fields(response.content):
+            self._form_fields = None
+            return None
+        return response
+    
+    def search_window(self, start_date, end_date):
+        """
+        Fetch the results for one date window without any fallback.
+        
+        Used by the backfill engine, which retries failed windows itself.
+        The search form state is loaded once and then taken from each search
+        response, so consecutive windows need a single POST each. Raises
+        FetchBlockedError when the website refuses the request.
+        """
+        cached = self._cached_window(start_date, end_date)
+        if cached is not None:
+            return cached
+        
+        if not self._form_fields:
+            self._form_fields = self._load_search_form()
+            if not self._form_fields:
+                raise FetchBlockedError("Could not extract form data from website")
+        
+        try:
+            response = self._submit_search(self._form_fields, start_date, end_date)
+        except Exception:
+            # The form state may have expired, load it again on the next try
+            self._form_fields = None
+            raise
+        
+        next_form_fields = extract_form_fields(response.content)
+        
+        if not next_form_fields:
+            self._form_fields = None
+            raise FetchBlockedError("Search response is not a PCSO results page")
+        
+        self._form_fields = next_form_fields
+        
+        # A postback without a results table is a window with no draws
+        results = self._parse_rows(ResultRows(response.content))
+        self._cache_window(start_date, end_date, results)
+        return results
+    
+    def _cached_window(self, start_date, end_date):
+        if self.cache is None:
+            return None
+        results = self.cache.get(ALL_GAMES, start_date, end_date)
+        if results is not None:
+            metrics.inc('pcso_fetch_cache_hits_total')
+        return results
+    
+    def _cache_window(self, start_date, end_date, results):
+        if self.cache is not None:
+            self.cache.put(ALL_GAMES, start_date, end_date, results)
+    
+    def _request(self, method, **kwargs):
+        """
+        Send a request to the PCSO website, honouring the rate limiter
+        """
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, self.base_url, timeout=30, **kwargs)
+        except requests.RequestException:
+            metrics.observe('pcso_http_request_seconds', time.perf_counter() - started, method=method, outcome='error')
+            raise
+        
+        blocked = response.status_code == 403 or 'Access Denied' in response.text
+        metrics.observe('pcso_http_request_seconds', time.perf_counter() - started, method=method,
+                        outcome='blocked' if blocked else str(response.status_code))
+        if blocked:
+            raise FetchBlockedError(f"{method} {self.base_url} denied with HTTP {response.status_code}")
+        response.raise_for_status()
+        
+        return response
+    
+    def _load_search_form(self):
+        """
+        Load the search page and return its ASP.NET form fields
+        """
+        response = self._request('GET')
+        return extract_form_fields(response.content)
+    
+    def _submit_search(self, form_fields, start_date, end_date):
+        """
+        POST a search for all games between two MM/DD/YYYY dates
+        """
+        form_data = dict(form_fields)
+        form_data.update({
+            'ctl00$ctl00$cphContainer$cpContent$txtStartDate': start_date,
+            'ctl00$ctl00$cphContainer$cpContent$txtEndDate': end_date,
+            'ctl00$ctl00$cphContainer$cpContent$ddlSelectGame': ALL_GAMES,
+            'ctl00$ctl00$cphContainer$cpContent$btnSearch': 'Search Lotto'
+        })
+        
+        return self._request('POST', data=form_data)
+    
+    def _parse_rows(self, rows):
+        """
+        Parse the (game, combination, date, jackpot, winners) rows of a page
+        """
+        results = []
+        rejected = 0
+        
+        # The page is parsed while its rows are iterated
+        with metrics.timer('pcso_parse_seconds'):
+            for game_name, combinations, draw_date, jackpot, winners in rows:
+                # Parse the data
+                result = self._parse_result(game_name, combinations, draw_date, jackpot, winners)
+                if result:
+                    results.append(result)
+                else:
+                    rejected += 1
+        
+        metrics.inc('pcso_rows_parsed_total', len(results), source='pcso')
+        metrics.inc('pcso_rows_rejected_total', rejected, source='pcso')
+        print(f"Found {len(results)} result rows")
+        return results
+    
     def _parse_result(self, game_name, combinations, draw_date, jackpot_str, winners_str):
         """
         Parse a single result row into structured data
         """
         try:
-            # Get game type
-            game_type = self.game_mapping.get(game_name, game_name)
-            
-            # Parse numbers
-            numbers = []
-            if '-' in combinations:
-                numbers = [int(n.strip()) for n in combinations.split('-')]
-            else:
-                # Handle formats like "3-0-9-7-3-9" or just "306739"
-                numbers = [int(n) for n in combinations.replace('-', '').strip()]
-            
-            # Parse date (format: MM/DD/YYYY)
-            try:
-                date_obj = datetime.strptime(draw_date, '%m/%d/%Y')
-                date_str = date_obj.strftime('%Y-%m-%d')
-            except:
-                date_str = draw_date
-            
-            # Parse jackpot (remove PHP symbol, commas)
-            try:
-                jackpot = float(jackpot_str.replace('PHP', '').replace('php', '').replace(',', '').replace(' ', '').strip())
-            except:
-                jackpot = 0
-            
-            # Parse winners
-            try:
-                winners = int(winners_str.replace(',', '').strip())
-            except:
-                winners = 0
-            
-            return {
-                "game": game_name,
-                "game_type": game_type,
-                "date": date_str,
-                "numbers": numbers,
-                "jackpot": jackpot,
-                "winners": winners
-            }
-        except Exception as e:
+            return parse_draw(game_name, combinations, draw_date, jackpot_str, winners_str).to_dict()
+        except ValueError as e:
             print(f"Error parsing result: {e} - {game_name}, {combinations}")
             return None
     
-    def _parse_alternative_structure(self, soup, start_date, end_date):
+    def _parse_alternative_structure(self, html, start_date, end_date):
         """
         Alternative parser if table structure is different
         """
         print("Trying alternative parsing method...")
         results = []
         
-        # Try to find any text that looks like results
-        text_content = soup.get_text()
-        
         # If we can't parse, use sample data
         if not results:
             print("Could not parse results, generating sample data...")
@@ -234,108 +312,22 @@ class PCSODataFetcher:
         Generate sample data for demonstration
         Replace this with actual PCSO data fetching
         """
-        import random
-        
-        results = []
+        self.last_fetch_was_sample = True
+        metrics.inc('pcso_sample_fallbacks_total')
         
         # Handle both date formats
         try:
-            current_date = datetime.strptime(start_date, "%Y-%m-%d")
+            start = datetime.strptime(start_date, "%Y-%m-%d")
             end = datetime.strptime(end_date, "%Y-%m-%d")
         except ValueError:
             # Try MM/DD/YYYY format
-            current_date = datetime.strptime(start_date, "%m/%d/%Y")
+            start = datetime.strptime(start_date, "%m/%d/%Y")
             end = datetime.strptime(end_date, "%m/%d/%Y")
         
-        while current_date <= end:
-            date_str = current_date.strftime("%Y-%m-%d")
-            
-            # 6/58 - Monday, Wednesday, Friday, Saturday
-            if current_date.weekday() in [0, 2, 4, 5]:
-                results.append({
-                    "game": "Ultra Lotto 6/58",
-                    "game_type": "6/58",
-                    "date": date_str,
-                    "numbers": sorted(random.sample(range(1, 59), 6)),
-                    "jackpot": random.randint(50000000, 1000000000),
-                    "winners": random.randint(0, 3)
-                })
-            
-            # 6/55 - Monday, Wednesday, Saturday
-            if current_date.weekday() in [0, 2, 5]:
-                results.append({
-                    "game": "Grand Lotto 6/55",
-                    "game_type": "6/55",
-                    "date": date_str,
-                    "numbers": sorted(random.sample(range(1, 56), 6)),
-                    "jackpot": random.randint(30000000, 500000000),
-                    "winners": random.randint(0, 5)
-                })
-            
-            # 6/49 - Tuesday, Thursday, Sunday
-            if current_date.weekday() in [1, 3, 6]:
-                results.append({
-                    "game": "Super Lotto 6/49",
-                    "game_type": "6/49",
-                    "date": date_str,
-                    "numbers": sorted(random.sample(range(1, 50), 6)),
-                    "jackpot": random.randint(16000000, 300000000),
-                    "winners": random.randint(0, 8)
-                })
-            
-            # 6/45 - Monday, Wednesday, Friday
-            if current_date.weekday() in [0, 2, 4]:
-                results.append({
-                    "game": "Mega Lotto 6/45",
-                    "game_type": "6/45",
-                    "date": date_str,
-                    "numbers": sorted(random.sample(range(1, 46), 6)),
-                    "jackpot": random.randint(9000000, 100000000),
-                    "winners": random.randint(0, 10)
-                })
-            
-            # 6/42 - Tuesday, Thursday, Saturday
-            if current_date.weekday() in [1, 3, 5]:
-                results.append({
-                    "game": "Lotto 6/42",
-                    "game_type": "6/42",
-                    "date": date_str,
-                    "numbers": sorted(random.sample(range(1, 43), 6)),
-                    "jackpot": random.randint(6000000, 50000000),
-                    "winners": random.randint(0, 12)
-                })
-            
-            # 4D, 3D, 2D - Daily
-            results.append({
-                "game": "4D Lotto",
-                "game_type": "4D",
-                "date": date_str,
-                "numbers": [random.randint(0, 9) for _ in range(4)],
-                "jackpot": 10000,
-                "winners": random.randint(0, 50)
-            })
-            
-            results.append({
-                "game": "3D Lotto",
-                "game_type": "3D",
-                "date": date_str,
-                "numbers": [random.randint(0, 9) for _ in range(3)],
-                "jackpot": 4500,
-                "winners": random.randint(0, 100)
-            })
-            
-            results.append({
-                "game": "2D Lotto",
-                "game_type": "2D",
-                "date": date_str,
-                "numbers": [random.randint(0, 31) for _ in range(2)],
-                "jackpot": 4000,
-                "winners": random.randint(0, 200)
-            })
-            
-            current_date += timedelta(days=1)
-        
-        return results
+        if end < start:
+            return []
+        # A fresh random history on the sample schedule of every game
+        return synthetic_results(start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d"), seed=None)
     
     def fetch_all_games(self, days_back=365):
         """
@@ -355,82 +347,174 @@ class PCSODataFetcher:
         
         return results
     
-    def save_to_json(self, data, filename="pcso_lotto_data.json"):
+    def load_existing(self, filename="pcso_lotto_data.json"):
+        """
+        Summary of the stored data (last update, draw count and newest draw
+        date per game type), or None if there is no usable store
+        """
+        db = open_database(json_file=filename)
+        try:
+            total = db.count()
+            if total == 0:
+                return None
+            
+            return {
+                "last_updated": db.get_meta("last_updated"),
+                "total_results": total,
+                "latest_dates": db.latest_dates()
+            }
+        finally:
+            db.close()
+    
+    def incremental_start_date(self, existing):
+        """
+        Work out the first date that still needs to be fetched.
+        
+        The window starts at the oldest of the per-game newest draws, so every
+        game is caught up. The newest date itself is fetched again because
+        results for that day may have been posted after the last update.
+        Games that stopped drawing long before the last update are ignored.
         """
-        Save fetched data to JSON file
+        latest = existing["latest_dates"]
+        
+        try:
+            last_updated = datetime.fromisoformat(existing["last_updated"])
+        except (KeyError, TypeError, ValueError):
+            last_updated = datetime.strptime(max(latest.values()), "%Y-%m-%d")
+        
+        stale_before = (last_updated - timedelta(days=STALE_GAME_DAYS)).strftime("%Y-%m-%d")
+        active = [date for date in latest.values() if date >= stale_before]
+        
+        if active:
+            return datetime.strptime(min(active), "%Y-%m-%d")
+        return last_updated.replace(hour=0, minute=0, second=0, microsecond=0)
+    
+    def merge_results(self, existing, new):
         """
-        with open(filename, 'w') as f:
-            json.dump({
-                "last_updated": datetime.now().isoformat(),
-                "total_results": len(data),
-                "results": data
-            }, f, indent=2)
+        Merge newly fetched results into the existing ones.
         
-        print(f"Data saved to {filename}")
-        print(f"Total results: {len(data)}")
+        Draws are keyed by (game_type, date); a newly fetched draw replaces the
+        stored one for the same key. The merged list is sorted by date.
+        """
+        merged = {}
+        for result in existing:
+            merged[(result["game_type"], result["date"])] = result
+        for result in new:
+            merged[(result["game_type"], result["date"])] = result
         
-        # Create statistics
-        stats = self.generate_statistics(data)
-        with open("pcso_statistics.json", 'w') as f:
-            json.dump(stats, f, indent=2)
-        print("Statistics saved to pcso_statistics.json")
+        return sorted(merged.values(), key=lambda r: r["date"])
+    
+    def fetch_incremental(self, filename="pcso_lotto_data.json", max_days_back=3650):
+        """
+        Fetch only the draws newer than the stored data.
+        
+        Falls back to a full fetch of max_days_back days when there is no
+        existing store. Returns the fetched results; save_to_json merges
+        them into the store by (game_type, date).
+        """
+        existing = self.load_existing(filename)
+        
+        if existing is None:
+            print(f"No existing data in {filename}, running a full fetch")
+            return self.fetch_all_games(days_back=max_days_back)
+        
+        end_date = datetime.now()
+        start_date = self.incremental_start_date(existing)
+        start_date = max(start_date, end_date - timedelta(days=max_days_back))
+        
+        start_str = start_date.strftime('%m/%d/%Y')
+        end_str = end_date.strftime('%m/%d/%Y')
+        
+        print(f"Existing data: {existing['total_results']} results, last updated {existing.get('last_updated')}")
+        print(f"Fetching new PCSO lotto data from {start_str} to {end_str}")
+        
+        new_results = self.fetch_from_pcso_website(start_str, end_str)
+        
+        if self.last_fetch_was_sample:
+            print("⚠️  Fetch returned sample data, keeping existing data unchanged")
+            return []
+        
+        print(f"Fetched {len(new_results)} results")
+        return new_results
+    
+    def save_to_json(self, data, filename="pcso_lotto_data.json"):
+        """
+        Save fetched data to the database and refresh the JSON export.
+        
+        Only the draws that are new or differ from the stored ones are
+        written. When they are all newer than the stored history they are
+        appended to the JSON export and the column store; otherwise both are
+        rebuilt from the database. Returns the number of results added or
+        updated.
+        """
+        # Serialized with API refreshes and other fetches or imports
+        with refresh_lock():
+            db = open_database(json_file=filename)
+            try:
+                with metrics.timer('pcso_phase_seconds', phase='db_write'):
+                    rows = db.changed_results(data)
+                    changed = db.upsert(rows)
+                metrics.inc('pcso_rows_written_total', changed)
+                print(f"{changed} results added or updated in {db.path}")
+                print(f"Total results: {db.count()}")
+                
+                if not changed and os.path.exists(filename):
+                    print(f"No changes, keeping {filename}")
+                    return changed
+                
+                with metrics.timer('pcso_phase_seconds', phase='json_export'):
+                    size = db.append_json(filename, rows)
+                    appended = size is not None
+                    if not appended:
+                        size = db.export_json(filename)
+                metrics.inc('pcso_bytes_written_total', size, output='json_export')
+                print(f"Data {'appended' if appended else 'saved'} to {filename}")
+                
+                # Columnar copy for fast readers
+                store = ColumnStore()
+                since = store_version(store.directory)
+                with metrics.timer('pcso_phase_seconds', phase='column_store'):
+                    appended = store.append(rows) is not None
+                    if not appended:
+                        store.write(db.iter_results())
+                print(f"Columnar store in {STORE_DIR}/ {'extended' if appended else 'rebuilt'}")
+            finally:
+                db.close()
+            
+            # Only the draws that were appended are processed; a rebuilt
+            # store is checked in full
+            keys = [(r["game_type"], r["date"]) for r in rows] if appended else None
+            updated = refresh_statistics(store, changed=keys, since=since)
+            print(f"Statistics saved to pcso_statistics.json ({sum(updated.values())} month buckets updated)")
+            return changed
     
     def generate_statistics(self, data):
         """
         Generate statistics from the data
         """
-        stats = {
-            "by_game": {},
-            "date_range": {
-                "start": None,
-                "end": None
-            }
-        }
-        
-        for result in data:
-            game_type = result["game_type"]
-            
-            if game_type not in stats["by_game"]:
-                stats["by_game"][game_type] = {
-                    "count": 0,
-                    "game_name": result["game"],
-                    "number_frequency": {}
-                }
-            
-            stats["by_game"][game_type]["count"] += 1
-            
-            # Count number frequency (only for 6-digit games)
-            if game_type.startswith("6/"):
-                for num in result["numbers"]:
-                    if str(num) not in stats["by_game"][game_type]["number_frequency"]:
-                        stats["by_game"][game_type]["number_frequency"][str(num)] = 0
-                    stats["by_game"][game_type]["number_frequency"][str(num)] += 1
-        
-        # Sort frequency
-        for game_type in stats["by_game"]:
-            if stats["by_game"][game_type]["number_frequency"]:
-                stats["by_game"][game_type]["number_frequency"] = dict(
-                    sorted(stats["by_game"][game_type]["number_frequency"].items(), 
-                           key=lambda x: x[1], reverse=True)
-                )
-        
-        return stats
+        return statistics_from_results(data)
 
 
 def main():
     fetcher = PCSODataFetcher()
     
-    # Fetch data for the last year
+    # Pass --full to ignore the existing data and fetch everything again
+    full = '--full' in sys.argv[1:]
+    
     print("=" * 60)
     print("PCSO Lotto Data Fetcher")
     print("=" * 60)
-    print("\nFetching all available PCSO lotto data (last 10 years)...")
-    print("This may take a few moments...")
     
     # Fetch maximum available data (10 years)
     days = 3650
     
-    results = fetcher.fetch_all_games(days_back=days)
+    if full:
+        print("\nFetching all available PCSO lotto data (last 10 years)...")
+        print("This may take a few moments...")
+        results = fetcher.fetch_all_games(days_back=days)
+    else:
+        print("\nFetching PCSO lotto data added since the last update...")
+        results = fetcher.fetch_incremental(max_days_back=days)
     
     # Save to JSON
     fetcher.save_to_json(results)
@@ -440,6 +524,7 @@ def main():
     print("Files created:")
     print("  - pcso_lotto_data.json (raw data)")
     print("  - pcso_statistics.json (statistics)")
+    print("  - pcso_data/ (per game and year shards for the dashboard)")
     print("\nYou can now open the HTML dashboard to view the results.")
     print("=" * 60)
 
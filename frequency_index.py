@@ -0,0 +1,197 @@
+"""
+Prefix-Sum Frequency Index
+Per-game running number counts for O(1) frequency queries over any date
+range.
+
+For a game with n draws sorted by date and numbers up to max_number, the
+index is an (n + 1) x (max_number + 1) matrix whose row i holds how often
+each number was drawn in the first i draws. The frequency vector of any
+[from, to] window is prefix[hi] - prefix[lo], where lo and hi come from two
+binary searches of the day column.
+
+Layout (one file per game_type, '/' replaced by '-'):
+
+    pcso_frequency/
+        6-58.npz    days    int32   days of the indexed draws
+                    hashes  uint64  per-draw digest of the numbers (row_digests)
+                    prefix  int32   (n + 1) x (max_number + 1) running counts
+
+When a refresh only appends draws after the indexed ones, the new rows are
+summed onto the last running count instead of rebuilding the matrix. A
+refresh that is told which draws changed skips the games without any and,
+when they all come after the indexed draws, only digests the new rows.
+"""
+import os
+import threading
+
+import numpy as np
+
+from column_store import ColumnStore, date_to_day, game_dir_name, row_digests
+from stats_engine import max_number, min_number
+
+FREQUENCY_DIR = "pcso_frequency"
+
+
+def running_counts(numbers, top, start=None):
+    """
+    Running counts of rows of numbers, continuing from the count vector start
+    """
+    numbers = np.asarray(numbers)
+    n = len(numbers)
+    size = top + 1
+
+    # One bincount over row * size + number gives every row's count vector
+    rows = np.repeat(np.arange(n, dtype=np.int64), numbers.shape[1])
+    values = numbers.ravel().astype(np.int64)
+    keep = values <= top
+    counts = np.bincount(rows[keep] * size + values[keep], minlength=n * size).reshape(n, size)
+
+    prefix = np.cumsum(counts, axis=0, dtype=np.int32)
+    if start is not None:
+        prefix += start
+    return prefix
+
+
+class FrequencyIndex:
+    """
+    Running number counts of one game, aligned with its day column
+    """
+
+    def __init__(self, game_type, days, hashes, prefix):
+        self.game_type = game_type
+        self.days = days
+        self.hashes = hashes
+        self.prefix = prefix
+
+    def __len__(self):
+        return len(self.days)
+
+    @classmethod
+    def build(cls, columns):
+        top = max_number(columns.game_type)
+        prefix = np.zeros((len(columns) + 1, top + 1), np.int32)
+        prefix[1:] = running_counts(columns.numbers, top)
+        return cls(columns.game_type, np.array(columns.days, dtype=np.int32),
+                   row_digests(columns.numbers), prefix)
+
+    def extend(self, columns, first_changed=None):
+        """
+        Bring the index in line with a game's columns. first_changed is the
+        first day with a changed draw, if known: when it comes after the
+        indexed draws they are taken as unchanged instead of compared.
+        Returns True if only new rows were appended, False if the index had
+        to be rebuilt.
+        """
+        n = len(self.days)
+        days = np.asarray(columns.days)
+        same = len(days) >= n and self.prefix.shape[1] == max_number(columns.game_type) + 1
+        if same and first_changed is not None and n and first_changed > self.days[-1]:
+            same = days[n - 1] == self.days[-1] and self.hashes.dtype == np.uint64
+        elif same:
+            same = np.array_equal(days[:n], self.days) and np.array_equal(row_digests(columns.numbers[:n]), self.hashes)
+
+        if same:
+            if len(days) > n:
+                top = self.prefix.shape[1] - 1
+                tail = running_counts(columns.numbers[n:], top, start=self.prefix[-1])
+                self.prefix = np.concatenate((self.prefix, tail))
+                self.days = np.array(days, dtype=np.int32)
+                self.hashes = np.concatenate((self.hashes, row_digests(columns.numbers[n:])))
+            return True
+
+        rebuilt = FrequencyIndex.build(columns)
+        self.days, self.hashes, self.prefix = rebuilt.days, rebuilt.hashes, rebuilt.prefix
+        return False
+
+    def window(self, from_date=None, to_date=None):
+        """
+        Count vector (indexed by number) of the draws in [from_date, to_date]
+        """
+        lo = 0 if not from_date else int(np.searchsorted(self.days, date_to_day(from_date), 'left'))
+        hi = len(self.days) if not to_date else int(np.searchsorted(self.days, date_to_day(to_date), 'right'))
+        return self.prefix[max(lo, hi)] - self.prefix[lo], max(0, hi - lo)
+
+    def save(self, filename):
+        tmp_filename = f"{filename}.{os.getpid()}.tmp"
+        with open(tmp_filename, 'wb') as f:
+            np.savez(f, days=self.days, hashes=self.hashes, prefix=self.prefix)
+        os.replace(tmp_filename, filename)
+
+    @classmethod
+    def load(cls, game_type, filename):
+        with np.load(filename) as data:
+            index = cls(game_type, data["days"], data["hashes"], data["prefix"])
+        if len(index.prefix) != len(index.days) + 1 or len(index.hashes) != len(index.days):
+            raise ValueError(f"{filename} is inconsistent")
+        return index
+
+
+class FrequencyStore:
+    """
+    Frequency indexes for every game in the column store
+    """
+
+    def __init__(self, directory=FREQUENCY_DIR, store=None):
+        self.directory = directory
+        self.store = store or ColumnStore()
+        self._games = {}
+        self._lock = threading.Lock()
+
+    def _filename(self, game_type):
+        return os.path.join(self.directory, game_dir_name(game_type) + ".npz")
+
+    def game(self, game_type):
+        """
+        The index of one game, loaded from disk and brought up to date with
+        the column store on first use
+        """
+        with self._lock:
+            if game_type not in self._games:
+                columns = self.store.load(game_type)
+                try:
+                    index = FrequencyIndex.load(game_type, self._filename(game_type))
+                    index.extend(columns)
+                except (OSError, ValueError, KeyError):
+                    index = FrequencyIndex.build(columns)
+                self._games[game_type] = index
+            return self._games[game_type]
+
+    def refresh(self, changed=None):
+        """
+        Update and save the index of every game. changed is {game_type:
+        sorted days} of the draws written since the last refresh, or None to
+        compare every draw. Returns {game_type: 'appended' | 'rebuilt' |
+        'unchanged'}.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        outcome = {}
+        for game_type in self.store.game_types():
+            filename = self._filename(game_type)
+            if changed is not None and game_type not in changed and os.path.exists(filename):
+                outcome[game_type] = 'unchanged'
+                continue
+            columns = self.store.load(game_type)
+            first_changed = int(changed[game_type][0]) if changed is not None and game_type in changed else None
+            try:
+                index = FrequencyIndex.load(game_type, filename)
+                before = len(index)
+                appended = index.extend(columns, first_changed)
+            except (OSError, ValueError, KeyError):
+                index, before, appended = FrequencyIndex.build(columns), -1, False
+
+            if appended and before == len(index):
+                outcome[game_type] = 'unchanged'
+                continue
+            outcome[game_type] = 'appended' if appended else 'rebuilt'
+            index.save(filename)
+
+        with self._lock:
+            self._games = {}
+        return outcome
+
+    def window(self, game_type, from_date=None, to_date=None):
+        """
+        {number: count} and the draw count of a game over [from_date, to_date]
+        """
+        counts, draws = self.game(game_type).window(from_date, to_date)
+        return {n: int(counts[n]) for n in range(min_number(game_type), len(counts))}, draws
@@ -1,184 +1,294 @@
 """
 CSV Import Tool for PCSO Lotto Data
 Allows manual import of data from CSV files
+
+Many files (or glob patterns) are parsed in parallel worker processes. Each
+worker spools its parsed rows to disk in batches, and the store is written
+by streaming those spools, so memory stays flat on large archives. Rows
+that cannot be parsed go to a reject file with their line numbers instead
+of aborting the import.
+
+Rows are written to the SQLite database in batches inside one transaction;
+pcso_lotto_data.json is then exported from it.
 """
+import argparse
 import csv
+import glob
 import json
-from datetime import datetime
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 import sys
 
-def import_csv_to_json(csv_file):
+import metrics
+from aggregate_store import refresh_statistics
+from column_store import ColumnStore, STORE_DIR, store_version
+from draw_db import open_database
+from draw_record import normalize_game_type, parse_draw
+from refresh_lock import refresh_lock
+from stats_engine import statistics_from_results, write_statistics
+
+DATA_FILE = 'pcso_lotto_data.json'
+REJECT_FILE = 'pcso_import_rejects.csv'
+
+# How rows from an import are combined with the existing store
+IMPORT_MODES = ('replace', 'append', 'merge')
+
+
+class BadRowError(ValueError):
+    """Raised for a CSV row that cannot be imported"""
+
+
+def parse_csv_row(row):
+    """
+    Parse one CSV row into a Draw
+    Raises BadRowError if the row has no usable game, numbers or date
+    """
+    try:
+        return parse_draw(
+            row.get('Game') or row.get('LOTTO GAME') or '',
+            row.get('Numbers') or row.get('COMBINATIONS') or '',
+            row.get('Date') or row.get('DRAW DATE') or '',
+            row.get('Jackpot') or row.get('JACKPOT (PHP)') or '0',
+            row.get('Winners') or row.get('WINNERS') or '0'
+        )
+    except ValueError as e:
+        raise BadRowError(str(e))
+
+
+def _parse_file(csv_file, spool_file, reject_spool, batch_size):
+    """
+    Worker: parse one CSV file into a JSON-lines spool
+    Returns (csv_file, imported, rejected)
+    """
+    imported = 0
+    rejected = 0
+    batch = []
+    
+    with open(csv_file, 'r', encoding='utf-8', newline='') as f, \
+            open(spool_file, 'w', encoding='utf-8') as spool, \
+            open(reject_spool, 'w', encoding='utf-8', newline='') as rejects:
+        reject_writer = csv.writer(rejects)
+        reader = csv.DictReader(f)
+        
+        for row in reader:
+            try:
+                draw = parse_csv_row(row)
+            except BadRowError as e:
+                raw = ','.join('' if v is None else str(v) for v in row.values())
+                reject_writer.writerow([csv_file, reader.line_num, str(e), raw])
+                rejected += 1
+                continue
+            
+            batch.append(json.dumps(draw.to_dict(), separators=(',', ':')))
+            imported += 1
+            if len(batch) >= batch_size:
+                spool.write('\n'.join(batch) + '\n')
+                batch = []
+        
+        if batch:
+            spool.write('\n'.join(batch) + '\n')
+    
+    return csv_file, imported, rejected
+
+
+def expand_inputs(patterns):
+    """Expand file names and glob patterns, keeping order and dropping duplicates"""
+    files = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        for match in matches:
+            if match not in files:
+                files.append(match)
+    return files
+
+
+def _iter_spools(spools):
+    for spool_file in spools:
+        with open(spool_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                yield json.loads(line)
+
+
+def import_csv_files(inputs, mode='replace', workers=None, batch_size=5000,
+                     output=DATA_FILE, reject_file=REJECT_FILE):
     """
-    Import PCSO data from CSV file
+    Import PCSO data from many CSV files
     Expected CSV format:
     Game,Numbers,Date,Jackpot,Winners
+    
+    mode is 'replace' (new rows only), 'append' (new rows are added, existing
+    draws for the same game and date are kept) or 'merge' (new rows replace
+    existing draws for the same game and date).
+    Returns a summary dict, or None if no input file exists.
     """
-    results = []
+    if mode not in IMPORT_MODES:
+        raise ValueError(f"Unknown import mode: {mode}")
     
-    print(f"Importing data from {csv_file}...")
+    files = expand_inputs(inputs)
+    missing = [f for f in files if not os.path.exists(f)]
+    for csv_file in missing:
+        print(f"Error: File '{csv_file}' not found")
+    files = [f for f in files if f not in missing]
+    if not files:
+        return None
     
+    spool_dir = tempfile.mkdtemp(prefix='pcso_import_', dir=os.path.dirname(os.path.abspath(output)))
     try:
-        with open(csv_file, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            
-            for row in reader:
-                # Parse numbers
-                numbers_str = row.get('Numbers', row.get('COMBINATIONS', ''))
-                numbers = [int(n.strip()) for n in numbers_str.replace('-', ' ').split()]
-                
-                # Parse date
-                date_str = row.get('Date', row.get('DRAW DATE', ''))
-                try:
-                    date_obj = datetime.strptime(date_str, '%m/%d/%Y')
-                    date_formatted = date_obj.strftime('%Y-%m-%d')
-                except:
-                    try:
-                        date_obj = datetime.strptime(date_str, '%Y-%m-%d')
-                        date_formatted = date_str
-                    except:
-                        date_formatted = date_str
-                
-                # Parse jackpot
-                jackpot_str = row.get('Jackpot', row.get('JACKPOT (PHP)', '0'))
-                try:
-                    jackpot = float(jackpot_str.replace('PHP', '').replace('₱', '').replace(',', '').strip())
-                except:
-                    jackpot = 0
-                
-                # Parse winners
-                winners_str = row.get('Winners', row.get('WINNERS', '0'))
-                try:
-                    winners = int(winners_str.replace(',', '').strip())
-                except:
-                    winners = 0
-                
-                # Get game name and determine type
-                game_name = row.get('Game', row.get('LOTTO GAME', '')).strip()
-                game_type = extract_game_type(game_name)
-                
-                result = {
-                    "game": game_name,
-                    "game_type": game_type,
-                    "date": date_formatted,
-                    "numbers": numbers,
-                    "jackpot": jackpot,
-                    "winners": winners
-                }
-                
-                results.append(result)
+        jobs = [
+            (csv_file, os.path.join(spool_dir, f'{i}.jsonl'), os.path.join(spool_dir, f'{i}.rejects.csv'), batch_size)
+            for i, csv_file in enumerate(files)
+        ]
         
-        print(f"Successfully imported {len(results)} records")
+        print(f"Importing data from {len(files)} file(s) ({mode} mode)...")
         
-        # Save to JSON
-        output_data = {
-            "last_updated": datetime.now().isoformat(),
-            "total_results": len(results),
-            "source": "manual_csv_import",
-            "results": results
-        }
+        workers = workers or min(len(files), os.cpu_count() or 1)
+        with metrics.timer('pcso_phase_seconds', phase='csv_parse'):
+            if workers > 1 and len(files) > 1:
+                with ProcessPoolExecutor(max_workers=workers) as pool:
+                    outcomes = list(pool.map(_parse_file, *zip(*jobs)))
+            else:
+                outcomes = [_parse_file(*job) for job in jobs]
         
-        with open('pcso_lotto_data.json', 'w') as f:
-            json.dump(output_data, f, indent=2)
+        imported = 0
+        rejected = 0
+        for csv_file, file_imported, file_rejected in outcomes:
+            print(f"  {csv_file}: {file_imported} rows, {file_rejected} rejected")
+            imported += file_imported
+            rejected += file_rejected
+        metrics.inc('pcso_rows_parsed_total', imported, source='csv')
+        metrics.inc('pcso_rows_rejected_total', rejected, source='csv')
         
-        print("Data saved to pcso_lotto_data.json")
+        # Collect rejected rows from every worker into one report
+        if rejected:
+            with open(reject_file, 'w', encoding='utf-8', newline='') as f:
+                csv.writer(f).writerow(['file', 'line', 'reason', 'row'])
+                for _, _, reject_spool, _ in jobs:
+                    with open(reject_spool, 'r', encoding='utf-8', newline='') as spool:
+                        shutil.copyfileobj(spool, f)
+            print(f"Rejected rows written to {reject_file}")
         
-        # Generate statistics
-        generate_statistics(results)
+        spools = [spool for _, spool, _, _ in jobs]
         
-        return results
+        # Serialized with API refreshes and other fetches or imports
+        with refresh_lock():
+            db = open_database(json_file=output)
+            try:
+                with metrics.timer('pcso_phase_seconds', phase='db_write'):
+                    if mode == 'replace':
+                        rows = _iter_spools(spools)
+                    else:
+                        # Only the new or changed draws go on to the exports
+                        rows = db.changed_results(_iter_spools(spools), keep_existing=mode == 'append')
+                    changed = db.write(rows, mode=mode, batch_size=batch_size, source="manual_csv_import")
+                    if mode == 'replace':
+                        rows = None
+                metrics.inc('pcso_rows_written_total', changed)
+                print(f"Successfully imported {imported} records ({changed} rows changed in {db.path})")
+                
+                total = db.count()
+                with metrics.timer('pcso_phase_seconds', phase='json_export'):
+                    size = _append_json(db, output, rows)
+                    appended = size is not None
+                    if not appended:
+                        size = db.export_json(output)
+                metrics.inc('pcso_bytes_written_total', size, output='json_export')
+                print(f"Data {'appended' if appended else 'saved'} to {output} ({total} results)")
+                
+                # Columnar copy for fast readers
+                store = ColumnStore()
+                since = store_version(store.directory)
+                with metrics.timer('pcso_phase_seconds', phase='column_store'):
+                    appended = _append_store(store, rows) is not None
+                    if not appended:
+                        store.write(db.iter_results())
+                print(f"Columnar store in {STORE_DIR}/ {'extended' if appended else 'rebuilt'}")
+            finally:
+                db.close()
+            
+            # Only the draws that were appended are processed; a rebuilt
+            # store is checked in full
+            keys = [(r["game_type"], r["date"]) for r in rows] if appended else None
+            updated = refresh_statistics(store, changed=keys, since=since)
+            print(f"Statistics saved to pcso_statistics.json ({sum(updated.values())} month buckets updated)")
         
-    except FileNotFoundError:
-        print(f"Error: File '{csv_file}' not found")
+        return {
+            "files": len(files),
+            "imported": imported,
+            "rejected": rejected,
+            "total_results": total
+        }
+    finally:
+        shutil.rmtree(spool_dir, ignore_errors=True)
+
+
+def _append_json(db, output, rows):
+    """db.append_json, or None when the export has to be written in full"""
+    if rows is None:
+        return None
+    try:
+        return db.append_json(output, rows)
+    except (OSError, ValueError) as e:
+        print(f"Could not append to {output}, writing it again: {e}")
+        return None
+
+
+def _append_store(store, rows):
+    """store.append, or None when the store has to be written in full"""
+    if rows is None:
         return None
-    except Exception as e:
-        print(f"Error importing CSV: {e}")
+    try:
+        return store.append(rows)
+    except (OSError, ValueError) as e:
+        print(f"Could not append to {store.directory}/, writing it again: {e}")
         return None
 
+
+def import_csv_to_json(csv_file, mode='replace'):
+    """
+    Import PCSO data from a single CSV file
+    """
+    return import_csv_files([csv_file], mode=mode)
+
 def extract_game_type(game_name):
     """Extract game type from game name"""
-    game_name_lower = game_name.lower()
-    
-    if '6/58' in game_name:
-        return '6/58'
-    elif '6/55' in game_name:
-        return '6/55'
-    elif '6/49' in game_name:
-        return '6/49'
-    elif '6/45' in game_name:
-        return '6/45'
-    elif '6/42' in game_name:
-        return '6/42'
-    elif '6d' in game_name_lower:
-        return '6D'
-    elif '4d' in game_name_lower:
-        return '4D'
-    elif '3d' in game_name_lower:
-        if '2pm' in game_name_lower:
-            return '3D-2PM'
-        elif '5pm' in game_name_lower:
-            return '3D-5PM'
-        elif '9pm' in game_name_lower:
-            return '3D-9PM'
-        return '3D'
-    elif '2d' in game_name_lower:
-        if '2pm' in game_name_lower:
-            return '2D-2PM'
-        elif '5pm' in game_name_lower:
-            return '2D-5PM'
-        elif '9pm' in game_name_lower:
-            return '2D-9PM'
-        return '2D'
-    else:
-        return game_name
+    return normalize_game_type(game_name)
 
 def generate_statistics(results):
-    """Generate statistics from imported data"""
-    stats = {
-        "by_game": {},
-        "total_draws": len(results)
-    }
-    
-    for result in results:
-        game_type = result["game_type"]
-        
-        if game_type not in stats["by_game"]:
-            stats["by_game"][game_type] = {
-                "count": 0,
-                "game_name": result["game"],
-                "number_frequency": {}
-            }
-        
-        stats["by_game"][game_type]["count"] += 1
-        
-        # Count number frequency (only for 6-digit games)
-        if game_type.startswith("6/"):
-            for num in result["numbers"]:
-                if str(num) not in stats["by_game"][game_type]["number_frequency"]:
-                    stats["by_game"][game_type]["number_frequency"][str(num)] = 0
-                stats["by_game"][game_type]["number_frequency"][str(num)] += 1
-    
-    # Sort frequency
-    for game_type in stats["by_game"]:
-        if stats["by_game"][game_type]["number_frequency"]:
-            stats["by_game"][game_type]["number_frequency"] = dict(
-                sorted(stats["by_game"][game_type]["number_frequency"].items(), 
-                       key=lambda x: x[1], reverse=True)
-            )
-    
-    with open('pcso_statistics.json', 'w') as f:
-        json.dump(stats, f, indent=2)
-    
+    """Generate statistics from imported data (any iterable of results)"""
+    write_statistics(statistics_from_results(results))
     print("Statistics saved to pcso_statistics.json")
 
-if __name__ == "__main__":
+def main():
     if len(sys.argv) < 2:
-        print("Usage: python import_csv.py <csv_file>")
+        print("Usage: python import_csv.py [--append | --merge] [--workers N] <csv_file_or_glob> ...")
         print("\nExample CSV format:")
         print("Game,Numbers,Date,Jackpot,Winners")
         print("Ultra Lotto 6/58,35-37-14-01-43-12,12/16/2025,49500000,0")
         sys.exit(1)
     
-    csv_file = sys.argv[1]
-    import_csv_to_json(csv_file)
+    parser = argparse.ArgumentParser(description="Import PCSO lotto results from CSV files")
+    parser.add_argument('inputs', nargs='+', help="CSV files or glob patterns")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--append', dest='mode', action='store_const', const='append',
+                       help="add the rows, keeping existing draws for the same game and date")
+    group.add_argument('--merge', dest='mode', action='store_const', const='merge',
+                       help="add the rows, replacing existing draws for the same game and date")
+    parser.add_argument('--workers', type=int, default=None, help="parser processes (default: one per file)")
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--reject-file', default=REJECT_FILE)
+    parser.set_defaults(mode='replace')
+    args = parser.parse_args()
+    
+    summary = import_csv_files(
+        args.inputs, mode=args.mode, workers=args.workers,
+        batch_size=args.batch_size, reject_file=args.reject_file
+    )
+    if summary is None:
+        sys.exit(1)
     
     print("\nImport complete! You can now open dashboard.html to view the data.")
+
+if __name__ == "__main__":
+    main()
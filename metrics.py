@@ -0,0 +1,292 @@
+"""
+Pipeline Metrics
+Counters and timing histograms for the refresh pipeline and the API,
+rendered in the Prometheus text format by /api/metrics.
+
+Every process records into its own registry. The registry is written to
+.pcso_cache/metrics/<pid>.json at most every FLUSH_SECONDS while it
+changes, and at exit, so /api/metrics can add up every process: each
+worker of serve.py, and fetches or imports run from cron or the command
+line. Files of processes that have exited are kept for KEEP_SECONDS after
+their last write, then folded into retired.json, whose totals are rendered
+with the live processes so counters never go down.
+
+A forked child starts from an empty registry, so nothing recorded in the
+serve.py master before the fork is counted once per worker.
+"""
+import atexit
+import fcntl
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+METRICS_DIR = os.path.join(".pcso_cache", "metrics")
+FLUSH_SECONDS = 5
+KEEP_SECONDS = 3600
+
+# Summed snapshots of the processes that have exited
+RETIRED_FILE = "retired.json"
+
+# Upper bounds (seconds) of the histogram buckets
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# name: (type, help)
+METRICS = {
+    "pcso_http_request_seconds": ("histogram", "PCSO website request latency by method and outcome"),
+    "pcso_parse_seconds": ("histogram", "Time to parse a PCSO results page"),
+    "pcso_rows_parsed_total": ("counter", "Result rows parsed from PCSO pages"),
+    "pcso_rows_rejected_total": ("counter", "Result rows that could not be parsed"),
+    "pcso_sample_fallbacks_total": ("counter", "Fetches that fell back to generated sample data"),
+    "pcso_fetch_cache_hits_total": ("counter", "Fetch windows answered from the response cache"),
+    "pcso_phase_seconds": ("histogram", "Time spent in each pipeline phase"),
+    "pcso_bytes_written_total": ("counter", "Bytes written by the pipeline, by output"),
+    "pcso_rows_written_total": ("counter", "Draws added or updated in the database"),
+    "pcso_refresh_jobs_total": ("counter", "Finished refresh jobs by status"),
+    "pcso_refresh_step_seconds": ("histogram", "Duration of each refresh job step"),
+    "pcso_api_request_seconds": ("histogram", "API request latency by endpoint and status class")
+}
+
+
+def _key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class Registry:
+    """
+    Counters and histograms of one process. With directory=None nothing is
+    written and only this process is rendered.
+    """
+
+    def __init__(self, directory=METRICS_DIR):
+        self.directory = directory
+        self.reset()
+
+    def reset(self):
+        # Also run in a forked child, where another thread may have held the lock
+        self._lock = threading.Lock()
+        self._flusher = None
+        self.counters = {}
+        self.histograms = {}
+        self._dirty = False
+        self._flusher_pid = None
+
+    def inc(self, name, value=1, **labels):
+        with self._lock:
+            key = (name, _key(labels))
+            self.counters[key] = self.counters.get(key, 0) + value
+            self._dirty = True
+        self._ensure_flusher()
+
+    def observe(self, name, seconds, **labels):
+        with self._lock:
+            key = (name, _key(labels))
+            entry = self.histograms.get(key)
+            if entry is None:
+                entry = self.histograms[key] = [0] * len(BUCKETS) + [0, 0.0]
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    entry[i] += 1
+                    break
+            # The last two slots are the count and the sum
+            entry[-2] += 1
+            entry[-1] += seconds
+            self._dirty = True
+        self._ensure_flusher()
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Observe the time spent in the with block, also when it raises"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "pid": os.getpid(),
+                "time": time.time(),
+                "counters": [[name, dict(labels), value] for (name, labels), value in self.counters.items()],
+                "histograms": [[name, dict(labels), list(entry)] for (name, labels), entry in self.histograms.items()]
+            }
+
+    def _filename(self, pid=None):
+        return os.path.join(self.directory, f"{pid or os.getpid()}.json")
+
+    def flush(self):
+        """Write this process's snapshot if anything changed since the last one"""
+        if not self._dirty or self.directory is None:
+            return
+        self._dirty = False
+        os.makedirs(self.directory, exist_ok=True)
+        filename = self._filename()
+        tmp_filename = f"{filename}.tmp"
+        with open(tmp_filename, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp_filename, filename)
+
+    def _ensure_flusher(self):
+        if self._flusher_pid == os.getpid() or self.directory is None:
+            return
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+            self._flusher = threading.Thread(target=self._flush_loop, name="metrics-flusher", daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(FLUSH_SECONDS)
+            try:
+                self.flush()
+            except OSError as e:
+                print(f"Could not write metrics: {e}")
+
+    def collect(self):
+        """
+        Snapshots of this process, of every other process that wrote one and
+        the retired totals of the processes that have exited
+        """
+        snapshots = [self.snapshot()]
+        if self.directory is None or not os.path.isdir(self.directory):
+            return snapshots
+        own = os.path.basename(self._filename())
+        # Scrapes from several workers take turns, so a snapshot is never
+        # read both on its own and folded into the retired totals
+        with open(os.path.join(self.directory, ".lock"), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            expired = []
+            for name in os.listdir(self.directory):
+                if not name.endswith(".json") or name in (own, RETIRED_FILE):
+                    continue
+                path = os.path.join(self.directory, name)
+                snapshot = _read(path)
+                if snapshot is None:
+                    continue
+                if not _alive(snapshot["pid"]) and time.time() - snapshot["time"] > KEEP_SECONDS:
+                    expired.append((path, snapshot))
+                    continue
+                snapshots.append(snapshot)
+
+            retired = self._retire(expired)
+        if retired is not None:
+            snapshots.append(retired)
+        return snapshots
+
+    def _retire(self, expired):
+        """
+        Add expired (path, snapshot) pairs to the retired totals and delete
+        their files. Returns the retired totals, or None if there are none.
+        """
+        filename = os.path.join(self.directory, RETIRED_FILE)
+        retired = _read(filename)
+        if not expired:
+            return retired
+
+        counters, histograms = {}, {}
+        for snapshot in ([retired] if retired else []) + [snapshot for _, snapshot in expired]:
+            _add(counters, histograms, snapshot)
+        retired = {
+            "pid": None,
+            "time": time.time(),
+            "counters": [[name, dict(labels), value] for (name, labels), value in counters.items()],
+            "histograms": [[name, dict(labels), entry] for (name, labels), entry in histograms.items()]
+        }
+        tmp_filename = f"{filename}.tmp"
+        with open(tmp_filename, 'w') as f:
+            json.dump(retired, f)
+        os.replace(tmp_filename, filename)
+
+        for path, _ in expired:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        return retired
+
+    def render(self):
+        """Prometheus text exposition of the sum over every snapshot"""
+        counters = {}
+        histograms = {}
+        for snapshot in self.collect():
+            _add(counters, histograms, snapshot)
+
+        lines = []
+        for name, (kind, help_text) in METRICS.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == "counter":
+                for (metric, labels), value in sorted(counters.items()):
+                    if metric == name:
+                        lines.append(f"{name}{_labels(labels)} {_number(value)}")
+                continue
+            for (metric, labels), entry in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(BUCKETS, entry):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(labels + (('le', str(bound)),))} {cumulative}")
+                lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {entry[-2]}")
+                lines.append(f"{name}_sum{_labels(labels)} {_number(entry[-1])}")
+                lines.append(f"{name}_count{_labels(labels)} {entry[-2]}")
+        return "\n".join(lines) + "\n"
+
+
+def _read(path):
+    """A snapshot file, or None if it is missing or unreadable"""
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _add(counters, histograms, snapshot):
+    """Add a snapshot's counters and histograms to the running totals"""
+    for name, labels, value in snapshot["counters"]:
+        key = (name, _key(labels))
+        counters[key] = counters.get(key, 0) + value
+    for name, labels, entry in snapshot["histograms"]:
+        key = (name, _key(labels))
+        total = histograms.setdefault(key, [0] * len(entry))
+        for i, value in enumerate(entry):
+            total[i] += value
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = (f'{k}="{_escape(v)}"' for k, v in labels)
+    return "{" + ",".join(escaped) + "}"
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    return repr(round(value, 6)) if isinstance(value, float) else str(value)
+
+
+registry = Registry()
+inc = registry.inc
+observe = registry.observe
+timer = registry.timer
+
+atexit.register(registry.flush)
+os.register_at_fork(after_in_child=registry.reset)
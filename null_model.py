@@ -0,0 +1,406 @@
+"""
+Monte Carlo Null Model
+How far the statistics of a game's history stray from what fair draws
+produce by chance alone.
+
+For a game with N draws, each replicate is N synthetic fair draws: six
+distinct numbers for the 6/xx games (sampled without replacement), and
+independent uniform digits for the 2D-6D games. Replicates are generated in
+NumPy batches, and the statistics below are computed for every replicate
+of a batch at once with bincounts over replicate-offset codes, using the
+same definitions as stats_engine (range thirds, spread, consecutive pairs,
+pair counts). The observed history goes through the same code as a batch
+of one.
+
+Batches run across processes. Each batch has its own stream spawned from
+one SeedSequence, so results depend only on the seed, not on the number of
+workers.
+
+A history is compared over its most recent B draws, where B is the largest
+of a few fixed lengths (DRAW_BUCKETS) that fits in it, so every date range
+of a game maps to one of a handful of models. The sorted simulated values
+of every statistic are cached per (game, B) in memory and in
+.pcso_cache/null_model/, both with a size limit, so p-values and confidence
+bands are binary searches. A missing model is simulated on a background
+thread; one simulation runs at a time across processes (only across the
+threads of one process without fcntl), and
+`python null_model.py --precompute` simulates every bucket up front.
+
+The worker processes are started with forkserver (spawn where that is not
+available), never forked from the thread that runs the simulation.
+"""
+import argparse
+import glob
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+import numpy as np
+
+from column_store import ColumnStore, game_dir_name
+from draw_record import is_lotto_game
+from stats_engine import _sorted_columns, max_number, min_number
+
+NULL_MODEL_DIR = os.path.join(".pcso_cache", "null_model")
+DEFAULT_REPLICATES = 1000
+DEFAULT_SEED = 20240101
+
+# Synthetic draws generated per batch, bounding the size of temporaries
+BATCH_DRAWS = 1 << 18
+
+# Central share of the simulated values covered by the confidence band
+BAND = 0.95
+
+# History lengths with a null model; a history is compared over its most
+# recent draws_bucket(N) draws
+DRAW_BUCKETS = (25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000)
+
+# Simulated models kept in memory and on disk
+MAX_MODELS = 32
+MAX_FILES = 256
+
+# Serializes simulations when there is no fcntl to lock across processes
+_simulation_lock = threading.Lock()
+
+LOTTO_STATISTICS = ("max_frequency", "min_frequency", "frequency_chi2", "even_share",
+                    "low_share", "mid_share", "high_share", "sum_mean", "spread_mean",
+                    "consecutive_share", "max_pair")
+DIGIT_STATISTICS = ("max_frequency", "min_frequency", "frequency_chi2", "even_share",
+                    "sum_mean", "spread_mean", "max_pair", "max_position_chi2")
+
+
+def statistic_names(game_type):
+    return LOTTO_STATISTICS if is_lotto_game(game_type) else DIGIT_STATISTICS
+
+
+def draws_bucket(draws):
+    """Largest bucket of at most `draws` draws, or None below the smallest"""
+    fitting = [bucket for bucket in DRAW_BUCKETS if bucket <= draws]
+    return fitting[-1] if fitting else None
+
+
+def synthetic_draws(game_type, width, replicates, draws, rng):
+    """replicates x draws x width uint8 array of fair draws"""
+    top = max_number(game_type)
+    low = min_number(game_type)
+    rows = replicates * draws
+    if is_lotto_game(game_type):
+        # The positions of the `width` smallest of `top` uniforms are a uniform sample without replacement
+        keys = rng.random((rows, top), dtype=np.float32)
+        numbers = np.argpartition(keys, width, axis=1)[:, :width] + 1
+    else:
+        numbers = rng.integers(low, top + 1, (rows, width))
+    return numbers.astype(np.uint8).reshape(replicates, draws, width)
+
+
+def _chi2(counts, low, top):
+    counts = counts[:, low:top + 1].astype(np.float64)
+    expected = counts.sum(axis=1, keepdims=True) / counts.shape[1]
+    return ((counts - expected) ** 2 / np.maximum(expected, 1e-12)).sum(axis=1)
+
+
+def batch_statistics(game_type, draws):
+    """
+    {statistic: replicates array} for a replicates x draws x width array
+    """
+    replicates, n, width = draws.shape
+    top = max_number(game_type)
+    low = min_number(game_type)
+    size = top + 1
+    flat = draws.reshape(replicates * n, width)
+    replicate = np.repeat(np.arange(replicates, dtype=np.int64), n)
+
+    freq = np.bincount((replicate[:, None] * size + flat).ravel(),
+                       minlength=replicates * size).reshape(replicates, size)
+    total = max(n * width, 1)
+    third = top // 3
+
+    stats = {
+        "max_frequency": freq[:, low:].max(axis=1).astype(np.float64),
+        "min_frequency": freq[:, low:].min(axis=1).astype(np.float64),
+        "frequency_chi2": _chi2(freq, low, top),
+        "even_share": freq[:, 0::2].sum(axis=1) / total,
+        "sum_mean": flat.sum(axis=1, dtype=np.int64).reshape(replicates, n).mean(axis=1)
+    }
+    if is_lotto_game(game_type):
+        stats["low_share"] = freq[:, :third + 1].sum(axis=1) / total
+        stats["mid_share"] = freq[:, third + 1:2 * third + 1].sum(axis=1) / total
+        stats["high_share"] = freq[:, 2 * third + 1:].sum(axis=1) / total
+
+    columns = _sorted_columns(flat)
+    spread = (columns[-1] - columns[0]).reshape(replicates, n)
+    stats["spread_mean"] = spread.mean(axis=1)
+
+    if is_lotto_game(game_type):
+        consecutive = np.zeros(len(flat), bool)
+        for a, b in zip(columns, columns[1:]):
+            consecutive |= (b - a) == 1
+        stats["consecutive_share"] = consecutive.reshape(replicates, n).mean(axis=1)
+    else:
+        stats["max_position_chi2"] = np.max([
+            _chi2(np.bincount(replicate * size + flat[:, p], minlength=replicates * size).reshape(replicates, size), low, top)
+            for p in range(width)
+        ], axis=0)
+
+    # Largest count of a pair of distinct numbers, as in stats_engine.top_pairs
+    codes = []
+    for i, a in enumerate(columns):
+        for b in columns[i + 1:]:
+            distinct = a != b
+            codes.append(replicate[distinct] * size * size + a[distinct].astype(np.int64) * size + b[distinct])
+    if codes:
+        pairs = np.bincount(np.concatenate(codes), minlength=replicates * size * size)
+        stats["max_pair"] = pairs.reshape(replicates, -1).max(axis=1).astype(np.float64)
+    else:
+        stats["max_pair"] = np.zeros(replicates)
+
+    return {name: np.asarray(stats[name], dtype=np.float64) for name in statistic_names(game_type)}
+
+
+def _pool_context():
+    """Start method of the simulation workers; fork is unsafe from a thread"""
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+
+def _simulate_batch(game_type, width, draws, replicates, seed):
+    rng = np.random.default_rng(seed)
+    return batch_statistics(game_type, synthetic_draws(game_type, width, replicates, draws, rng))
+
+
+def simulate(game_type, width, draws, replicates=DEFAULT_REPLICATES, seed=DEFAULT_SEED, workers=None):
+    """
+    {statistic: sorted simulated values} of `replicates` fair histories of
+    `draws` draws
+    """
+    per_batch = max(1, min(replicates, BATCH_DRAWS // max(draws, 1)))
+    sizes = [min(per_batch, replicates - start) for start in range(0, replicates, per_batch)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = [(game_type, width, draws, size, child) for size, child in zip(sizes, seeds)]
+
+    workers = workers or min(len(tasks), os.cpu_count() or 1)
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=_pool_context()) as pool:
+            batches = list(pool.map(_simulate_batch, *zip(*tasks)))
+    else:
+        batches = [_simulate_batch(*task) for task in tasks]
+
+    return {
+        name: np.sort(np.concatenate([batch[name] for batch in batches]))
+        for name in statistic_names(game_type)
+    }
+
+
+def observed_statistics(game_type, numbers):
+    """Statistics of a real history (draws x width); padded rows are left out"""
+    numbers = np.asarray(numbers)
+    numbers = numbers[(numbers <= max_number(game_type)).all(axis=1)]
+    values = batch_statistics(game_type, numbers[None, :, :])
+    return {name: float(value[0]) for name, value in values.items()}
+
+
+def significance(observed, simulated):
+    """
+    Two-sided empirical p-value, median and confidence band of every statistic
+    """
+    result = {}
+    for name, value in observed.items():
+        values = simulated[name]
+        n = len(values)
+        below = int(np.searchsorted(values, value, 'right'))
+        above = n - int(np.searchsorted(values, value, 'left'))
+        p_value = min(1.0, 2 * min(below + 1, above + 1) / (n + 1))
+        tail = (1 - BAND) / 2
+        lo, median, hi = np.quantile(values, [tail, 0.5, 1 - tail])
+        result[name] = {
+            "observed": round(value, 4),
+            "p_value": round(p_value, 4),
+            "median": round(float(median), 4),
+            "band": [round(float(lo), 4), round(float(hi), 4)]
+        }
+    return result
+
+
+class NullModelCache:
+    """
+    Simulated distributions per (game, bucket), kept in memory and on disk,
+    least recently used first out of both
+    """
+
+    def __init__(self, directory=NULL_MODEL_DIR, replicates=DEFAULT_REPLICATES, seed=DEFAULT_SEED, workers=None,
+                 max_models=MAX_MODELS, max_files=MAX_FILES):
+        self.directory = directory
+        self.replicates = replicates
+        self.seed = seed
+        self.workers = workers
+        self.max_models = max_models
+        self.max_files = max_files
+        self._models = OrderedDict()
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def _filename(self, game_type, width, draws):
+        name = f"{game_dir_name(game_type)}.{width}x{draws}.{self.replicates}.{self.seed}.npz"
+        return os.path.join(self.directory, name)
+
+    def _remember(self, key, simulated):
+        with self._lock:
+            self._models[key] = simulated
+            self._models.move_to_end(key)
+            while len(self._models) > self.max_models:
+                self._models.popitem(last=False)
+
+    def _load(self, key):
+        """The model from memory or disk, or None if it was not simulated yet"""
+        with self._lock:
+            if key in self._models:
+                self._models.move_to_end(key)
+                return self._models[key]
+
+        game_type = key[0]
+        filename = self._filename(*key)
+        try:
+            with np.load(filename) as data:
+                simulated = {name: data[name] for name in statistic_names(game_type)}
+            # The modification time orders the files for eviction
+            os.utime(filename)
+        except (OSError, ValueError, KeyError):
+            return None
+        self._remember(key, simulated)
+        return simulated
+
+    def _simulate(self, key):
+        """
+        Simulate and save a model. The directory lock runs one simulation at
+        a time across processes; a model saved meanwhile is loaded instead.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, ".lock"), 'w') as lock, _simulation_lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            simulated = self._load(key)
+            if simulated is not None:
+                return simulated
+
+            simulated = simulate(*key, self.replicates, self.seed, self.workers)
+            filename = self._filename(*key)
+            tmp_filename = f"{filename}.{os.getpid()}.tmp"
+            with open(tmp_filename, 'wb') as f:
+                np.savez(f, **simulated)
+            os.replace(tmp_filename, filename)
+            self._evict_files()
+
+        self._remember(key, simulated)
+        return simulated
+
+    def _evict_files(self):
+        files = sorted(glob.glob(os.path.join(self.directory, "*.npz")), key=os.path.getmtime)
+        for filename in files[:max(0, len(files) - self.max_files)]:
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
+
+    def _simulate_pending(self, key):
+        try:
+            self._simulate(key)
+        finally:
+            with self._lock:
+                self._pending.discard(key)
+
+    def get(self, game_type, width, draws, wait=True):
+        """
+        {statistic: sorted simulated values} for histories of `draws` draws.
+        A missing model is simulated first, or with wait=False started on a
+        background thread while None is returned.
+        """
+        key = (game_type, width, draws)
+        simulated = self._load(key)
+        if simulated is not None:
+            return simulated
+        if wait:
+            return self._simulate(key)
+
+        with self._lock:
+            if key not in self._pending:
+                self._pending.add(key)
+                threading.Thread(target=self._simulate_pending, args=(key,), daemon=True).start()
+        return None
+
+    def significance(self, game_type, numbers, wait=True):
+        """
+        Observed statistics of the most recent draws of a history with their
+        p-values and bands, or None while the model is being simulated
+        (wait=False)
+        """
+        numbers = np.asarray(numbers)
+        numbers = numbers[(numbers <= max_number(game_type)).all(axis=1)]
+        if not len(numbers):
+            raise ValueError(f"No complete draws for {game_type}")
+        draws = draws_bucket(len(numbers))
+        if draws is None:
+            raise ValueError(f"At least {DRAW_BUCKETS[0]} complete draws are needed for {game_type}")
+
+        simulated = self.get(game_type, numbers.shape[1], draws, wait)
+        if simulated is None:
+            return None
+        observed = observed_statistics(game_type, numbers[-draws:])
+        return {
+            "draws": draws,
+            "history_draws": len(numbers),
+            "replicates": self.replicates,
+            "statistics": significance(observed, simulated)
+        }
+
+    def precompute(self, game_type, numbers):
+        """Simulate the model of every bucket that fits in a history; returns the buckets"""
+        numbers = np.asarray(numbers)
+        complete = int((numbers <= max_number(game_type)).all(axis=1).sum())
+        buckets = [bucket for bucket in DRAW_BUCKETS if bucket <= complete]
+        for bucket in buckets:
+            self.get(game_type, numbers.shape[1], bucket)
+        return buckets
+
+
+null_models = NullModelCache()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate fair draws to put the statistics in context")
+    parser.add_argument('--games', nargs='*', help="game types (default: every game in the store)")
+    parser.add_argument('--replicates', type=int, default=DEFAULT_REPLICATES)
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--precompute', action='store_true',
+                        help="simulate every history length the API can ask for")
+    args = parser.parse_args()
+
+    store = ColumnStore()
+    cache = NullModelCache(replicates=args.replicates, seed=args.seed, workers=args.workers)
+    for game_type in args.games or store.game_types():
+        started = time.perf_counter()
+        if args.precompute:
+            buckets = cache.precompute(game_type, store.load(game_type).numbers)
+            print(f"{game_type}: {len(buckets)} models ({', '.join(map(str, buckets))} draws) "
+                  f"in {time.perf_counter() - started:.1f}s")
+            continue
+        result = cache.significance(game_type, store.load(game_type).numbers)
+        elapsed = time.perf_counter() - started
+        print(f"\n{game_type}: last {result['draws']} of {result['history_draws']} draws, "
+              f"{result['replicates']} replicates in {elapsed:.1f}s")
+        for name, entry in result["statistics"].items():
+            flag = " *" if entry["p_value"] < 0.05 else ""
+            print(f"  {name:<18} {entry['observed']:>10} p={entry['p_value']:<6} "
+                  f"95% band {entry['band'][0]} .. {entry['band'][1]}{flag}")
+
+
+if __name__ == "__main__":
+    main()
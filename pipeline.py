@@ -0,0 +1,73 @@
+"""
+Refresh Pipeline
+The fetch, import and statistics steps as functions that run inside a
+long-lived process such as the API server.
+
+The scraper stack (requests, NumPy, the HTML parsers) is imported on first
+use, so importing this module costs nothing. The first fetch creates one
+PCSODataFetcher that is kept for the life of the process: its pooled
+requests.Session keeps the connection to the PCSO website alive, and the
+ASP.NET form state of its last search is reused by the next one.
+"""
+import threading
+import time
+
+DATA_FILE = "pcso_lotto_data.json"
+
+# Days fetched when there is no existing data
+MAX_DAYS_BACK = 3650
+
+_fetcher = None
+_fetcher_lock = threading.Lock()
+
+
+def get_fetcher():
+    """
+    The process-wide fetcher, created on first use
+    """
+    global _fetcher
+    with _fetcher_lock:
+        if _fetcher is None:
+            from fetch_pcso_data import PCSODataFetcher
+            _fetcher = PCSODataFetcher()
+        return _fetcher
+
+
+def fetch_step(full=False, filename=DATA_FILE, days_back=MAX_DAYS_BACK):
+    """
+    Fetch new draws and save them (database, JSON export, column store and
+    statistics). Returns a summary dict.
+    """
+    fetcher = get_fetcher()
+    started = time.perf_counter()
+
+    if full:
+        results = fetcher.fetch_all_games(days_back=days_back)
+    else:
+        results = fetcher.fetch_incremental(filename, max_days_back=days_back)
+
+    changed = fetcher.save_to_json(results, filename)
+
+    return {
+        "results": len(results),
+        "changed": changed,
+        "sample_data": fetcher.last_fetch_was_sample,
+        "seconds": round(time.perf_counter() - started, 3)
+    }
+
+
+def import_step(inputs, mode='merge', **options):
+    """
+    Import CSV files in-process; see import_csv.import_csv_files
+    """
+    from import_csv import import_csv_files
+    return import_csv_files(inputs, mode=mode, **options)
+
+
+def stats_step():
+    """
+    Bring the month-bucket aggregates and pcso_statistics.json up to date
+    with the column store. Returns {game_type: buckets updated}.
+    """
+    from aggregate_store import refresh_statistics
+    return refresh_statistics()
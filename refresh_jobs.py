@@ -0,0 +1,293 @@
+"""
+Background Refresh Jobs
+Runs data refreshes on a worker thread so HTTP requests never wait on a
+scrape. The steps are the in-process pipeline functions, so a refresh
+reuses the warm fetcher of the server process.
+
+Refreshes are single-flight: while a refresh is queued or running, further
+triggers get the id of that job instead of starting another one. A refresh
+that finished less than MIN_REFRESH_INTERVAL seconds ago, successfully or
+not, is not repeated; triggers in that window get the finished job back.
+
+The jobs live in JOBS_FILE, read and updated under a file lock, so every
+worker of serve.py sees the same jobs: a trigger on any worker joins the
+refresh another one is running, and GET /api/jobs/<id> answers from any
+worker. The job runs in the process that created it; a job whose process
+died is marked failed by the next trigger.
+
+A job holds the refresh lock (refresh_lock.py) for all of its steps.
+Fetches and imports from outside the API take the same lock in the shared
+write path, so the two never write the store at the same time.
+
+A job submitted with profile=True runs its steps under cProfile; the
+stats are saved to PROFILE_DIR/<job id>.prof (open them with pstats or
+snakeviz) and the slowest functions are listed in the job.
+"""
+import cProfile
+import fcntl
+import json
+import os
+import pstats
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+
+import metrics
+import pipeline
+from refresh_lock import refresh_lock
+
+# Seconds between the end of one refresh and the start of the next
+MIN_REFRESH_INTERVAL = 15 * 60
+
+# Finished jobs kept for GET /api/jobs/<id>
+KEEP_JOBS = 50
+
+JOBS_FILE = os.path.join(".pcso_cache", "refresh_jobs.json")
+
+PROFILE_DIR = os.path.join(".pcso_cache", "profiles")
+
+# Functions listed in a profiled job, by cumulative time
+PROFILE_TOP = 25
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+
+class Job:
+    """
+    One refresh run and its progress
+    """
+
+    def __init__(self, job_id, steps, profile=False):
+        self.id = job_id
+        self.steps = steps
+        self.profile = profile
+        # The process that runs the job
+        self.pid = os.getpid()
+        self.status = QUEUED
+        self.step = None
+        self.completed_steps = 0
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self.profile_result = None
+
+    @property
+    def active(self):
+        return self.status in (QUEUED, RUNNING)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "status": self.status,
+            "progress": {
+                "step": self.step,
+                "completed_steps": self.completed_steps,
+                "total_steps": len(self.steps)
+            },
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "result": self.result,
+            "error": self.error,
+            "profile": self.profile_result
+        }
+
+    def to_record(self):
+        """to_dict plus what another process needs to rebuild the job"""
+        return dict(self.to_dict(), steps=self.steps, profile_requested=self.profile, pid=self.pid)
+
+    @classmethod
+    def from_record(cls, record):
+        job = cls(record["id"], record["steps"], record["profile_requested"])
+        job.pid = record["pid"]
+        job.status = record["status"]
+        job.step = record["progress"]["step"]
+        job.completed_steps = record["progress"]["completed_steps"]
+        for name in ("created_at", "started_at", "finished_at", "result", "error"):
+            setattr(job, name, record[name])
+        job.profile_result = record["profile"]
+        return job
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def save_profile(profiler, job_id, directory=PROFILE_DIR, top=PROFILE_TOP):
+    """Write the stats of a profiled job and return its file and top functions"""
+    os.makedirs(directory, exist_ok=True)
+    filename = os.path.join(directory, f"{job_id}.prof")
+    profiler.dump_stats(filename)
+
+    stats = pstats.Stats(profiler).stats
+    slowest = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:top]
+    return {
+        "file": filename,
+        "top": [
+            {
+                "function": f"{path}:{line}({name})",
+                "calls": calls,
+                "total_seconds": round(total, 6),
+                "cumulative_seconds": round(cumulative, 6)
+            }
+            for (path, line, name), (_, calls, total, cumulative, _) in slowest
+        ]
+    }
+
+
+# (name, callable) pairs run in order by every refresh
+DEFAULT_STEPS = [
+    ("fetch", pipeline.fetch_step),
+]
+
+
+class RefreshQueue:
+    """
+    Single-flight queue of refresh jobs shared by every process that uses
+    the same JOBS_FILE; this process's jobs run on one worker thread
+    """
+
+    def __init__(self, steps=None, min_interval=MIN_REFRESH_INTERVAL, keep=KEEP_JOBS, filename=JOBS_FILE):
+        self.steps = steps or DEFAULT_STEPS
+        self.min_interval = min_interval
+        self.keep = keep
+        self.filename = filename
+        self.pending = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._worker = None
+
+    @contextmanager
+    def _jobs(self, write=True):
+        """
+        The job records, oldest first, under the jobs file lock; changes are
+        saved when the block ends if write is set
+        """
+        os.makedirs(os.path.dirname(self.filename) or '.', exist_ok=True)
+        with open(self.filename + ".lock", 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX if write else fcntl.LOCK_SH)
+            state = {"next_id": 1, "jobs": []}
+            if os.path.exists(self.filename):
+                try:
+                    with open(self.filename, 'r') as f:
+                        state = json.load(f)
+                except ValueError:
+                    print(f"Unreadable {self.filename}, starting a new job list")
+            yield state
+            if write:
+                tmp_filename = f"{self.filename}.{os.getpid()}.tmp"
+                with open(tmp_filename, 'w') as f:
+                    json.dump(state, f)
+                os.replace(tmp_filename, self.filename)
+
+    def submit(self, force=False, profile=False):
+        """
+        Return (job, created): the job that serves this trigger, and whether
+        it is a new one. A job already in flight is returned as it is, also
+        when profile is asked for.
+        """
+        with self._lock, self._jobs() as state:
+            records = state["jobs"]
+            for record in records:
+                if record["status"] in (QUEUED, RUNNING) and not _alive(record["pid"]):
+                    record["status"] = FAILED
+                    record["error"] = "the process running the refresh exited"
+                    record["finished_at"] = time.time()
+                elif record["status"] in (QUEUED, RUNNING):
+                    return Job.from_record(record), False
+
+            finished = [record for record in records if record["finished_at"] is not None]
+            last = max(finished, key=lambda record: record["finished_at"], default=None)
+            if not force and last is not None and time.time() - last["finished_at"] < self.min_interval:
+                return Job.from_record(last), False
+
+            job = Job(f"{int(time.time())}-{state['next_id']}", [name for name, _ in self.steps], profile)
+            state["next_id"] += 1
+            records.append(job.to_record())
+            del records[:-self.keep]
+
+            self.pending = job
+            self._ensure_worker()
+            self._wakeup.notify()
+            return job, True
+
+    def get(self, job_id):
+        with self._jobs(write=False) as state:
+            for record in state["jobs"]:
+                if record["id"] == job_id:
+                    return Job.from_record(record)
+        return None
+
+    def _save(self, job):
+        """Publish the progress of a job of this process"""
+        with self._jobs() as state:
+            for i, record in enumerate(state["jobs"]):
+                if record["id"] == job.id:
+                    state["jobs"][i] = job.to_record()
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._work, name="refresh-worker", daemon=True)
+            self._worker.start()
+
+    def _work(self):
+        while True:
+            with self._lock:
+                while self.pending is None:
+                    self._wakeup.wait()
+                job = self.pending
+                self.pending = None
+            self._run(job)
+
+    def _run(self, job):
+        results = {}
+        profiler = cProfile.Profile() if job.profile else None
+        try:
+            # Waits for a refresh running outside the API
+            with refresh_lock():
+                job.status = RUNNING
+                job.started_at = time.time()
+                self._save(job)
+                if profiler is not None:
+                    profiler.enable()
+                try:
+                    for name, step in self.steps:
+                        job.step = name
+                        self._save(job)
+                        print(f"Refresh {job.id}: running {name}...")
+                        with metrics.timer('pcso_refresh_step_seconds', step=name):
+                            results[name] = step()
+                        job.completed_steps += 1
+                finally:
+                    if profiler is not None:
+                        profiler.disable()
+            status, error = SUCCEEDED, None
+        except Exception as e:
+            traceback.print_exc()
+            status, error = FAILED, str(e)
+        metrics.inc('pcso_refresh_jobs_total', status=status)
+
+        if profiler is not None:
+            try:
+                job.profile_result = save_profile(profiler, job.id)
+            except OSError as e:
+                print(f"Could not save the profile of {job.id}: {e}")
+
+        job.result = results
+        job.error = error
+        job.step = None
+        job.finished_at = time.time()
+        job.status = status
+        self._save(job)
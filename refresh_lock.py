@@ -0,0 +1,75 @@
+"""
+Refresh Lock
+An exclusive file lock around everything that writes the data: the
+database upsert, the JSON export, the column store swap, the aggregates
+and the static export.
+
+Every entry point (an API refresh job, fetch_pcso_data.py from cron,
+import_csv.py, backfill.py, response_cache.py --rebuild) goes through
+save_to_json, import_csv_files or refresh_statistics, which all hold it,
+so two refreshes never write at the same time and serve.py can tell when
+a refresh is in progress.
+
+The lock is reentrant within a thread: a refresh job holds it for all of
+its steps, and the steps take it again. Without fcntl (not Unix) it only
+serializes the threads of one process.
+"""
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+REFRESH_LOCK = os.path.join(".pcso_cache", "refresh.lock")
+
+_held = threading.local()
+_process_lock = threading.Lock()
+
+
+def _lock_file():
+    os.makedirs(os.path.dirname(REFRESH_LOCK), exist_ok=True)
+    return open(REFRESH_LOCK, 'w')
+
+
+@contextmanager
+def refresh_lock():
+    """Hold the refresh lock, waiting for a refresh in another process"""
+    depth = getattr(_held, 'depth', 0)
+    if depth:
+        _held.depth = depth + 1
+        try:
+            yield
+        finally:
+            _held.depth -= 1
+        return
+
+    with _lock_file() as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        else:
+            _process_lock.acquire()
+        _held.depth = 1
+        try:
+            yield
+        finally:
+            _held.depth = 0
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+            else:
+                _process_lock.release()
+
+
+def refresh_running():
+    """Whether any process holds the refresh lock"""
+    if fcntl is None:
+        return _process_lock.locked()
+    with _lock_file() as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return True
+        fcntl.flock(lock, fcntl.LOCK_UN)
+        return False
@@ -0,0 +1,252 @@
+"""
+PCSO Replay Server
+Local stand-in for the PCSO search page, used to test the fetcher and the
+backfill engine offline.
+
+The server answers GET with a search form carrying ASP.NET ViewState fields
+and answers the search POST with a GridView1 results table, filtered to the
+requested date range. Rows come from a saved data file (same shape as
+pcso_lotto_data.json) or from recorded PCSO result pages.
+"""
+import argparse
+import html
+import json
+import random
+import sys
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+from fetch_pcso_data import PCSODataFetcher
+from results_parser import ResultRows
+
+START_FIELD = 'ctl00$ctl00$cphContainer$cpContent$txtStartDate'
+END_FIELD = 'ctl00$ctl00$cphContainer$cpContent$txtEndDate'
+
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head><title>PCSO Lotto Results</title></head>
+<body>
+<form method="post" action="SearchLottoResult.aspx" id="mainForm">
+<input type="hidden" name="__VIEWSTATE" id="__VIEWSTATE" value="{viewstate}" />
+<input type="hidden" name="__VIEWSTATEGENERATOR" id="__VIEWSTATEGENERATOR" value="C0C4D4A3" />
+<input type="hidden" name="__EVENTVALIDATION" id="__EVENTVALIDATION" value="{viewstate}" />
+{table}
+</form>
+</body>
+</html>
+"""
+
+
+def render_results_page(rows, viewstate="replay"):
+    """
+    Render rows as a PCSO results page.
+
+    Rows are (game, combination, MM/DD/YYYY date, jackpot, winners) strings.
+    Pass rows=None to render the plain search form without a table.
+    """
+    if rows is None:
+        table = ""
+    else:
+        lines = [
+            '<table class="grid" id="GridView1">',
+            '<tr><th>LOTTO GAME</th><th>COMBINATIONS</th><th>DRAW DATE</th>'
+            '<th>JACKPOT (PHP)</th><th>WINNERS</th></tr>'
+        ]
+        for row in rows:
+            cells = "".join(f"<td>{html.escape(str(value))}</td>" for value in row)
+            lines.append(f"<tr>{cells}</tr>")
+        lines.append("</table>")
+        table = "\n".join(lines)
+
+    return PAGE_TEMPLATE.format(viewstate=viewstate, table=table)
+
+
+def result_to_row(result):
+    """
+    Convert a stored result dict back into PCSO table cells
+    """
+    date_obj = datetime.strptime(result["date"], "%Y-%m-%d")
+
+    if result["game_type"].startswith("6/"):
+        combination = "-".join(f"{n:02d}" for n in result["numbers"])
+    else:
+        combination = "-".join(str(n) for n in result["numbers"])
+
+    return (
+        result["game"],
+        combination,
+        date_obj.strftime("%m/%d/%Y"),
+        f"{result['jackpot']:,.2f}",
+        f"{result['winners']:,}"
+    )
+
+
+def load_data_file(filename):
+    """
+    Load results from a saved pcso_lotto_data.json style file
+    """
+    with open(filename, 'r') as f:
+        return json.load(f)["results"]
+
+
+def load_recorded_pages(filenames):
+    """
+    Load results from recorded PCSO result pages
+    """
+    fetcher = PCSODataFetcher(cache=False)
+    results = []
+    for filename in filenames:
+        with open(filename, 'rb') as f:
+            results.extend(fetcher._parse_rows(ResultRows(f.read())))
+    return results
+
+
+class ReplayState:
+    """
+    Rows served by the replay server plus request counters
+    """
+
+    def __init__(self, results, latency=0.0, fail_rate=0.0, seed=None):
+        # Keep (ISO date, table row) pairs sorted so searches can slice them
+        self.rows = sorted(
+            ((r["date"], result_to_row(r)) for r in results),
+            key=lambda pair: pair[0]
+        )
+        self.dates = [date for date, _ in self.rows]
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counters = {"get": 0, "post": 0, "failed": 0}
+
+    def count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def should_fail(self):
+        with self.lock:
+            return self.random.random() < self.fail_rate
+
+    def search(self, start_date, end_date):
+        """
+        Rows between two MM/DD/YYYY dates, newest first like the PCSO site
+        """
+        from bisect import bisect_left, bisect_right
+
+        start = datetime.strptime(start_date, "%m/%d/%Y").strftime("%Y-%m-%d")
+        end = datetime.strptime(end_date, "%m/%d/%Y").strftime("%Y-%m-%d")
+
+        lo = bisect_left(self.dates, start)
+        hi = bisect_right(self.dates, end)
+        return [row for _, row in reversed(self.rows[lo:hi])]
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    """
+    Serves the search form and search results from a ReplayState
+    """
+    state = None
+    quiet = True
+
+    def do_GET(self):
+        self.state.count("get")
+        self._respond(render_results_page(None))
+
+    def do_POST(self):
+        self.state.count("post")
+
+        length = int(self.headers.get('Content-Length', 0))
+        form = parse_qs(self.rfile.read(length).decode('utf-8'))
+
+        if self.state.latency:
+            time.sleep(self.state.latency)
+
+        if self.state.should_fail():
+            self.state.count("failed")
+            self.send_error(503, "Service Unavailable")
+            return
+
+        try:
+            rows = self.state.search(form[START_FIELD][0], form[END_FIELD][0])
+        except (KeyError, ValueError):
+            self.send_error(400, "Bad search form")
+            return
+
+        self._respond(render_results_page(rows, viewstate=f"replay{len(rows)}"))
+
+    def _respond(self, page):
+        body = page.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if not self.quiet:
+            super().log_message(format, *args)
+
+
+def start_replay_server(results, host='127.0.0.1', port=0, latency=0.0, fail_rate=0.0, seed=None):
+    """
+    Start a replay server in a background thread.
+
+    Returns (server, base_url); call server.shutdown() to stop it. The
+    request counters are available as server.state.counters.
+    """
+    state = ReplayState(results, latency=latency, fail_rate=fail_rate, seed=seed)
+    handler = type('BoundReplayHandler', (ReplayHandler,), {'state': state})
+
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.state = state
+
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    base_url = f"http://{host}:{server.server_address[1]}/SearchLottoResult.aspx"
+    return server, base_url
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded PCSO result pages locally")
+    parser.add_argument('--data', default='pcso_lotto_data.json',
+                        help="saved results file to serve (default: pcso_lotto_data.json)")
+    parser.add_argument('--pages', nargs='*', default=[],
+                        help="recorded PCSO result pages to serve instead of --data")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help="seconds to wait before answering each search")
+    parser.add_argument('--fail-rate', type=float, default=0.0,
+                        help="fraction of searches answered with HTTP 503")
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    if args.pages:
+        results = load_recorded_pages(args.pages)
+    else:
+        results = load_data_file(args.data)
+
+    ReplayHandler.quiet = not args.verbose
+    server, base_url = start_replay_server(
+        results, host=args.host, port=args.port,
+        latency=args.latency, fail_rate=args.fail_rate
+    )
+
+    print(f"Replaying {len(results)} results at {base_url}")
+    print("Press Ctrl+C to stop")
+
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+        print(f"\nRequests served: {server.state.counters}")
+        sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""
+PCSO Response Cache
+Persistent on-disk cache of parsed search results, keyed by
+(game filter, start date, end date).
+
+Results for a window that closed a few days ago never change, so those
+entries are kept permanently. Windows that reach into recent days get a
+short TTL because late results may still be posted. Entries are stored as
+gzip-compressed JSON of the parsed rows, so rebuilding the dataset from the
+cache needs neither the network nor the HTML parser.
+"""
+import gzip
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+CACHE_DIR = os.path.join(".pcso_cache", "responses")
+
+# A window is closed once its end date is this many days in the past
+SETTLE_DAYS = 3
+
+
+def _iso_date(date_str):
+    """Normalize MM/DD/YYYY or YYYY-MM-DD to YYYY-MM-DD"""
+    for fmt in ('%m/%d/%Y', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(date_str, fmt).strftime('%Y-%m-%d')
+        except ValueError:
+            continue
+    raise ValueError(f"Unrecognized date: {date_str}")
+
+
+class ResponseCache:
+    """
+    Size-bounded cache of parsed result windows with LRU eviction
+    """
+
+    def __init__(self, directory=CACHE_DIR, max_bytes=256 * 1024 * 1024, recent_ttl=3600):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.recent_ttl = recent_ttl
+        self.lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, game, start_date, end_date):
+        key = f"{game}|{_iso_date(start_date)}|{_iso_date(end_date)}"
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, digest + ".json.gz")
+
+    def is_closed(self, end_date):
+        """
+        True if results for a window ending on end_date can no longer change
+        """
+        settled = (datetime.now() - timedelta(days=SETTLE_DAYS)).strftime('%Y-%m-%d')
+        return _iso_date(end_date) < settled
+
+    def _read(self, path):
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, EOFError, ValueError):
+            return None
+
+    def _is_fresh(self, entry):
+        return entry["permanent"] or time.time() - entry["stored_at"] < self.recent_ttl
+
+    def get(self, game, start_date, end_date):
+        """
+        Return the cached results for a window, or None on a miss
+        """
+        path = self._path(game, start_date, end_date)
+        entry = self._read(path)
+
+        if entry is None or not self._is_fresh(entry):
+            return None
+
+        # The file mtime doubles as the last access time for eviction
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return entry["results"]
+
+    def put(self, game, start_date, end_date, results):
+        """
+        Store the parsed results for a window
+        """
+        entry = {
+            "game": game,
+            "start": _iso_date(start_date),
+            "end": _iso_date(end_date),
+            "stored_at": time.time(),
+            "permanent": self.is_closed(end_date),
+            "results": results
+        }
+
+        path = self._path(game, start_date, end_date)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with gzip.open(tmp_path, 'wt', encoding='utf-8', compresslevel=6) as f:
+            json.dump(entry, f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+
+        self.evict()
+
+    def _entries(self):
+        """(mtime, size, path) for every cache file"""
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json.gz"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def evict(self):
+        """
+        Remove least recently used entries until the cache fits max_bytes
+        """
+        with self.lock:
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                total -= size
+
+    def iter_windows(self):
+        """
+        Yield (start, end, results) for every usable entry
+        """
+        for _, _, path in self._entries():
+            entry = self._read(path)
+            if entry is not None and self._is_fresh(entry):
+                yield entry["start"], entry["end"], entry["results"]
+
+    def clear(self):
+        for _, _, path in self._entries():
+            os.remove(path)
+
+    def stats(self):
+        entries = self._entries()
+        return {
+            "entries": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+            "max_bytes": self.max_bytes
+        }
+
+
+def rebuild_from_cache(cache=None):
+    """
+    Rebuild the full result list from cached windows only, without network.
+
+    Windows are applied oldest first so a later window wins for a draw that
+    appears in more than one.
+    """
+    from fetch_pcso_data import PCSODataFetcher
+
+    cache = cache or ResponseCache()
+    windows = sorted(cache.iter_windows(), key=lambda w: (w[1], w[0]))
+
+    results = []
+    for _, _, window_results in windows:
+        results.extend(window_results)
+
+    return PCSODataFetcher().merge_results([], results), len(windows)
+
+
+def main():
+    command = sys.argv[1] if len(sys.argv) > 1 else "stats"
+    cache = ResponseCache()
+
+    if command == "rebuild":
+        from fetch_pcso_data import PCSODataFetcher
+
+        started = time.perf_counter()
+        results, windows = rebuild_from_cache(cache)
+        print(f"Rebuilt {len(results)} results from {windows} cached windows "
+              f"in {time.perf_counter() - started:.3f}s")
+        if results:
+            PCSODataFetcher().save_to_json(results)
+    elif command == "clear":
+        cache.clear()
+        print("Response cache cleared")
+    elif command == "stats":
+        stats = cache.stats()
+        print(f"Cache entries: {stats['entries']}")
+        print(f"Cache size: {stats['bytes'] / 1024:.1f} KiB of {stats['max_bytes'] / 1024 / 1024:.0f} MiB")
+    else:
+        print("Usage: python response_cache.py [stats|rebuild|clear]")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+"""
+PCSO Results Page Parser
+Streams (game, combination, date, jackpot, winners) rows out of the PCSO
+results table.
+
+Three interchangeable backends are available:
+  lxml    - libxml2 HTML parser, used when lxml is installed
+  stream  - stdlib html.parser tokenizer that never builds a tree
+  bs4     - BeautifulSoup, the most lenient and the slowest
+
+The first fast backend that is available is the default. If it does not
+find a results table, the page is parsed again with BeautifulSoup before
+giving up. Set PCSO_HTML_PARSER to force a backend.
+"""
+import os
+import re
+from html.parser import HTMLParser
+
+try:
+    import lxml.html
+except ImportError:
+    lxml = None
+
+FORM_FIELDS = ('__VIEWSTATE', '__VIEWSTATEGENERATOR', '__EVENTVALIDATION')
+
+_INPUT_TAG = re.compile(r'<input\b[^>]*>', re.IGNORECASE)
+_TAG_ATTR = re.compile(r'([\w:-]+)\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s>]+))')
+
+
+def _text(content):
+    if isinstance(content, bytes):
+        return content.decode('utf-8', errors='replace')
+    return content
+
+
+def _clean(text):
+    return ' '.join(text.split())
+
+
+def extract_form_fields(content):
+    """
+    Return the ASP.NET ViewState fields of a page, or None if it has none.
+
+    Scans only the <input> tags, so no parse tree is built for the page.
+    """
+    from html import unescape
+
+    fields = {}
+    for tag in _INPUT_TAG.findall(_text(content)):
+        attrs = {
+            m.group(1).lower(): m.group(2) if m.group(2) is not None else (m.group(3) if m.group(3) is not None else m.group(4))
+            for m in _TAG_ATTR.finditer(tag)
+        }
+        name = attrs.get('name')
+        if name in FORM_FIELDS:
+            fields[name] = unescape(attrs.get('value') or '')
+
+    if not fields.get('__VIEWSTATE'):
+        return None
+
+    return {name: fields.get(name, '') for name in FORM_FIELDS}
+
+
+def _is_results_table(table_id, table_class):
+    return table_id == 'GridView1' or 'grid' in (table_class or '').split()
+
+
+def _rows_lxml(content, owner):
+    """Rows via lxml; the table is located with XPath"""
+    doc = lxml.html.fromstring(content)
+
+    tables = doc.xpath('//table[@id="GridView1"]')
+    if not tables:
+        tables = doc.xpath('//table[contains(concat(" ", normalize-space(@class), " "), " grid ")]')
+    if not tables:
+        tables = doc.xpath('//table[.//th[contains(., "LOTTO GAME")]]')
+    if not tables:
+        return
+
+    owner.table_found = True
+    for row in tables[0].iter('tr'):
+        cells = row.findall('td')
+        if len(cells) >= 5:
+            # Plain cells carry their text directly; only nested markup needs text_content()
+            yield tuple(
+                _clean(cell.text or '') if len(cell) == 0 else _clean(cell.text_content())
+                for cell in cells[:5]
+            )
+
+
+class _TableTokenizer(HTMLParser):
+    """
+    Collects the rows of the first results table while tokenizing.
+
+    Rows are buffered per feed() call, so a caller feeding the page in
+    chunks gets rows as soon as they are complete.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.tables = []       # stack of [is_results] per open table
+        self.found = False
+        self.done = False
+        self.row = None
+        self.cell = None
+        self.header = None
+        self.ready = []
+
+    def _in_results(self):
+        return bool(self.tables) and self.tables[-1][0] and not self.done
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'table':
+            attrs = dict(attrs)
+            is_results = not self.found and _is_results_table(attrs.get('id'), attrs.get('class'))
+            self.tables.append([is_results])
+            if is_results:
+                self.found = True
+        elif tag == 'tr' and self.tables:
+            self.row = []
+        elif tag == 'td' and self.row is not None:
+            self.cell = []
+        elif tag == 'th' and self.tables:
+            self.header = []
+
+    def handle_endtag(self, tag):
+        if tag == 'table' and self.tables:
+            is_results, = self.tables.pop()
+            if is_results:
+                self.done = True
+        elif tag == 'tr':
+            if self.row is not None and len(self.row) >= 5 and self._in_results():
+                self.ready.append(tuple(self.row[:5]))
+            self.row = None
+        elif tag == 'td' and self.cell is not None:
+            if self.row is not None:
+                self.row.append(_clean(''.join(self.cell)))
+            self.cell = None
+        elif tag == 'th' and self.header is not None:
+            # A table is also recognised by its LOTTO GAME header
+            if 'LOTTO GAME' in ''.join(self.header) and self.tables and not self.found:
+                self.tables[-1][0] = True
+                self.found = True
+            self.header = None
+
+    def handle_data(self, data):
+        if self.cell is not None:
+            self.cell.append(data)
+        elif self.header is not None:
+            self.header.append(data)
+
+
+def _rows_stream(content, owner, chunk_size=64 * 1024):
+    """Rows via the stdlib tokenizer, fed in chunks"""
+    text = _text(content)
+    tokenizer = _TableTokenizer()
+
+    for start in range(0, len(text), chunk_size):
+        tokenizer.feed(text[start:start + chunk_size])
+        if tokenizer.ready:
+            owner.table_found = True
+            yield from tokenizer.ready
+            tokenizer.ready = []
+        if tokenizer.done:
+            break
+    else:
+        tokenizer.close()
+        yield from tokenizer.ready
+
+    owner.table_found = tokenizer.found
+
+
+def _rows_bs4(content, owner):
+    """Rows via BeautifulSoup, matching the original fetcher logic"""
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(content, 'html.parser')
+
+    # Find the results table - PCSO uses a specific ID or class
+    results_table = soup.find('table', id='GridView1')
+
+    if not results_table:
+        # Try alternative selectors
+        results_table = soup.find('table', class_='grid')
+
+    if not results_table:
+        # Try finding any table with lotto results
+        for table in soup.find_all('table'):
+            headers = table.find_all('th')
+            if headers and any('LOTTO GAME' in th.text for th in headers):
+                results_table = table
+                break
+
+    if not results_table:
+        return
+
+    owner.table_found = True
+    for row in results_table.find_all('tr')[1:]:  # Skip header row
+        cols = row.find_all('td')
+        if len(cols) >= 5:
+            yield tuple(_clean(col.text) for col in cols[:5])
+
+
+BACKENDS = {
+    'lxml': _rows_lxml,
+    'stream': _rows_stream,
+    'bs4': _rows_bs4,
+}
+
+
+def available_backends():
+    """
+    Names of the backends that can run here, fastest first
+    """
+    names = ['stream']
+    if lxml is not None:
+        names.insert(0, 'lxml')
+    try:
+        import bs4  # noqa: F401
+        names.append('bs4')
+    except ImportError:
+        pass
+    return names
+
+
+def default_backend():
+    forced = os.environ.get('PCSO_HTML_PARSER')
+    if forced:
+        if forced not in BACKENDS:
+            raise ValueError(f"Unknown HTML parser backend: {forced}")
+        return forced
+    return available_backends()[0]
+
+
+class ResultRows:
+    """
+    Iterable of result row tuples from one page.
+
+    After iteration, table_found tells whether a results table was found at
+    all, which separates an empty result from an unexpected page.
+    """
+
+    def __init__(self, content, backend=None):
+        self.content = content
+        self.backend = backend or default_backend()
+        self.table_found = False
+
+    def __iter__(self):
+        yield from BACKENDS[self.backend](self.content, self)
+
+        # Fast backends are stricter; let BeautifulSoup have a second look
+        if not self.table_found and self.backend != 'bs4' and 'bs4' in available_backends():
+            yield from _rows_bs4(self.content, self)
+
+
+def iter_result_rows(content, backend=None):
+    """
+    Stream (game, combination, date, jackpot, winners) tuples from a page
+    """
+    return iter(ResultRows(content, backend))
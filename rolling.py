@@ -0,0 +1,94 @@
+"""
+Rolling Frequency Series
+How often chosen numbers were drawn in a sliding window of draws, for the
+dashboard's "Number Frequency Trends Over Time" chart.
+
+The series come straight from the running counts of the prefix-sum
+frequency index: the count of every number in the window of `window` draws
+ending before draw e is prefix[e] - prefix[e - window], so all windows of a
+query are one fancy-indexed subtraction instead of a loop over the draws of
+each window. Queries over all 6/xx games use running counts of the combined,
+date-ordered lotto draws, built once per store version.
+"""
+import numpy as np
+
+from column_store import date_to_day, day_to_date
+from draw_index import QueryCache
+from draw_record import is_lotto_game
+from frequency_index import running_counts
+from stats_engine import max_number
+
+DEFAULT_WINDOW = 30
+MAX_SERIES = 20
+
+CACHE_SIZE = 256
+
+
+def _combined_counts(index):
+    """(days, prefix) of every 6/xx draw in date order, numbers up to the largest max"""
+    game_types = [g for g in index.game_types if is_lotto_game(g)]
+    top = max((max_number(g) for g in game_types), default=max_number("6/58"))
+    blocks = [index.games[g] for g in game_types if len(index.games[g])]
+    if not blocks:
+        return np.zeros(0, np.int32), np.zeros((1, top + 1), np.int32)
+
+    width = max(columns.numbers.shape[1] for columns in blocks)
+    blocks = [columns for columns in blocks if columns.numbers.shape[1] == width]
+    days = np.concatenate([np.asarray(columns.days) for columns in blocks])
+    order = np.argsort(days, kind='stable')
+    numbers = np.concatenate([np.asarray(columns.numbers) for columns in blocks])[order]
+
+    prefix = np.zeros((len(days) + 1, top + 1), np.int32)
+    prefix[1:] = running_counts(numbers, top)
+    return days[order], prefix
+
+
+_combined_cache = QueryCache(_combined_counts, 1)
+
+
+def rolling_frequency(index, game_type=None, from_date=None, to_date=None,
+                      numbers=(), window=DEFAULT_WINDOW, step=1):
+    """
+    Count of each number in the `window` draws before every `step`-th draw of
+    [from_date, to_date], matching the dashboard's loop over the sorted draws
+    """
+    if window < 1 or step < 1:
+        raise ValueError("window and step must be at least 1")
+    if not numbers:
+        raise ValueError("No numbers given")
+    if len(numbers) > MAX_SERIES:
+        raise ValueError(f"At most {MAX_SERIES} numbers per query")
+
+    if game_type:
+        if not is_lotto_game(game_type):
+            raise ValueError("Rolling frequencies are only available for the 6/xx lotto games")
+        if game_type in index.games:
+            frequency = index.frequency.game(game_type)
+            days, prefix = frequency.days, frequency.prefix
+        else:
+            days, prefix = np.zeros(0, np.int32), np.zeros((1, max_number(game_type) + 1), np.int32)
+    else:
+        days, prefix = _combined_cache.get(index)
+
+    top = prefix.shape[1] - 1
+    if any(n < 1 or n > top for n in numbers):
+        raise ValueError(f"Numbers must be between 1 and {top}")
+
+    lo = 0 if not from_date else int(np.searchsorted(days, date_to_day(from_date), 'left'))
+    hi = len(days) if not to_date else int(np.searchsorted(days, date_to_day(to_date), 'right'))
+
+    ends = np.arange(lo + window, hi, step)
+    columns = list(numbers)
+    counts = prefix[ends][:, columns] - prefix[ends - window][:, columns]
+
+    return {
+        "draws": max(0, hi - lo),
+        "window": window,
+        "step": step,
+        "numbers": columns,
+        "dates": [day_to_date(day) for day in days[ends].tolist()],
+        "series": {str(n): counts[:, i].tolist() for i, n in enumerate(columns)}
+    }
+
+
+rolling_cache = QueryCache(rolling_frequency, CACHE_SIZE)
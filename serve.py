@@ -0,0 +1,156 @@
+"""
+Production Server
+Runs api_server (the API, the dashboard and the exported data files) on
+gunicorn with one worker process per core.
+
+The master process loads the published column store and builds every
+index (the combined draw index, frequency prefix sums, co-occurrence
+matrices, ticket bitsets) before forking, and freezes the garbage
+collector so the workers share those pages copy-on-write instead of each
+building its own copy.
+
+A watcher thread in the master polls the store version. When a refresh,
+from any worker or another process, has published new data and released
+the refresh lock, the master reloads like on SIGHUP: it rebuilds the
+indexes, forks fresh workers and lets the old ones finish their requests.
+
+Workers are threaded workers. The /api/stream connections are not theirs:
+the master serves them from one event loop on the stream port
+(draw_events.StreamServer) and the API redirects there, so open streams
+hold no worker threads. Without gunicorn the app runs on one threaded
+process with the stream server next to it.
+"""
+import argparse
+import importlib.util
+import os
+
+DEFAULT_PORT = 5000
+
+# Seconds between checks for newly published data
+WATCH_SECONDS = 5
+
+# Threads per worker
+THREADS = 32
+
+
+def preload():
+    """
+    Load the published store and every index into this process; returns
+    the DrawIndex or None if the store has not been built yet
+    """
+    import gc
+
+    from draw_index import current_index
+    from draw_record import is_lotto_game
+    from rolling import _combined_cache
+    from ticket_index import ticket_indexes
+
+    gc.unfreeze()
+    index = current_index()
+    if index is not None:
+        for game_type in index.game_types:
+            index.frequency.game(game_type)
+            if is_lotto_game(game_type):
+                index.cooccurrence.game(game_type)
+                ticket_indexes.get(index, game_type)
+        _combined_cache.get(index)
+
+    # Objects that survive to here are never collected, so the collector
+    # does not write to the pages the workers share
+    gc.collect()
+    gc.freeze()
+    return index
+
+
+def watch_store(arbiter, interval=WATCH_SECONDS):
+    """Reload the workers when new data has been published"""
+    import signal
+    import time
+
+    from column_store import store_version
+    from refresh_lock import refresh_running
+
+    version = store_version()
+    while True:
+        time.sleep(interval)
+        current = store_version()
+        # Wait for the statistics and exports of a refresh to finish too
+        if current != version and not refresh_running():
+            version = current
+            arbiter.log.info("New data published (store version %s), reloading workers", current)
+            os.kill(arbiter.pid, signal.SIGHUP)
+
+
+def _start_master(host, stream_port, arbiter):
+    """Stream server and store watcher threads of the master"""
+    import threading
+
+    from draw_events import stream_server
+
+    stream_server.start(host, stream_port)
+    threading.Thread(target=watch_store, args=(arbiter,), name="store-watcher", daemon=True).start()
+
+
+def _close_stream_listener():
+    # Workers inherit the master's listening socket but never accept on it
+    from draw_events import stream_server
+    stream_server.close_listener()
+
+
+def run_gunicorn(host, port, workers, stream_port):
+    from gunicorn.app.base import BaseApplication
+
+    class Server(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', f"{host}:{port}")
+            self.cfg.set('workers', workers)
+            self.cfg.set('worker_class', 'gthread')
+            self.cfg.set('threads', THREADS)
+            self.cfg.set('preload_app', True)
+            # Seconds a worker may go without a heartbeat before it is restarted
+            self.cfg.set('timeout', 120)
+            self.cfg.set('graceful_timeout', 30)
+            self.cfg.set('when_ready', lambda arbiter: _start_master(host, stream_port, arbiter))
+            self.cfg.set('post_fork', lambda arbiter, worker: _close_stream_listener())
+
+        def load(self):
+            from api_server import app
+            app.config['STREAM_PORT'] = stream_port
+            index = preload()
+            print(f"Preloaded store version {index.version if index else None}")
+            return app
+
+        def reload(self):
+            super().reload()
+            # The app stays loaded; only the data is rebuilt before new workers fork
+            index = preload()
+            print(f"Reloaded store version {index.version if index else None}")
+
+    Server().run()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the API and dashboard with multiple workers")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--stream-port', type=int, help="port of /api/stream (default: port + 1)")
+    args = parser.parse_args()
+    stream_port = args.stream_port or args.port + 1
+
+    if importlib.util.find_spec('gunicorn') is None:
+        print("gunicorn is not installed, serving from one threaded process")
+        from api_server import app
+        from draw_events import stream_server
+        app.config['STREAM_PORT'] = stream_port
+        preload()
+        stream_server.start(args.host, stream_port)
+        app.run(host=args.host, port=args.port, threaded=True)
+        return
+
+    print(f"Serving on {args.host}:{args.port} with {args.workers} workers, streams on {stream_port}")
+    run_gunicorn(args.host, args.port, args.workers, stream_port)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,18 @@
 #!/bin/bash
 
-echo "Starting API server on port 5000..."
-python api_server.py &
-API_PID=$!
-
-sleep 2
-
-echo "Starting dashboard server on port 8000..."
-python serve_dashboard.py &
-DASHBOARD_PID=$!
+# The API server also serves the dashboard and the data files.
+# With gunicorn installed it runs one worker per core (see serve.py).
+echo "Starting server on port 5000..."
+python serve.py --port 5000 &
+SERVER_PID=$!
 
 echo ""
-echo "Servers running:"
-echo "API: http://localhost:5000"
-echo "Dashboard: http://localhost:8000"
+echo "Server running:"
+echo "API: http://localhost:5000/api/health"
+echo "Dashboard: http://localhost:5000/"
+echo "Event stream: http://localhost:5001/api/stream"
 echo ""
 echo "Press Ctrl+C to stop"
 
-trap "kill $API_PID $DASHBOARD_PID; exit" INT
+trap "kill $SERVER_PID; exit" INT
 wait
@@ -0,0 +1,236 @@
+"""
+Static Data Export
+Sharded, precompressed copies of the draws for static hosting, so the
+dashboard downloads only the games and years it shows.
+
+Layout:
+
+    pcso_data/
+        manifest.json                   shard list with per-shard stats
+        6-58.2024.1f0c9a2b7d3e.json     minified shard, named by content hash
+        6-58.2024.1f0c9a2b7d3e.json.gz
+        6-58.2024.1f0c9a2b7d3e.json.br  only when brotli is installed
+
+A shard holds one game's draws of one calendar year in columns (dates,
+numbers, jackpot, winners), in the same order as pcso_lotto_data.json.
+File names carry the hash of their contents, so a shard URL never changes
+meaning and can be cached forever; an export only writes the shards whose
+contents changed, and the manifest is the one file clients revalidate.
+The .gz and .br variants are precompressed at the highest level for hosts
+that serve them directly.
+
+Shards referenced by the previous manifest are kept for one more export,
+so a page that loaded the old manifest can still fetch them, and the
+export reports which shards changed so their rows can be diffed. An export
+told which draws changed serializes only the shards of their games and
+years and keeps the previous manifest entries of the others.
+"""
+import gzip
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+from column_store import NO_NUMBER, ColumnStore, day_to_date, game_dir_name, store_version
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+EXPORT_DIR = "pcso_data"
+MANIFEST_FILE = "manifest.json"
+
+# Hex digits of the SHA-256 content hash kept in shard names
+HASH_LENGTH = 12
+
+
+def _dumps(payload):
+    return json.dumps(payload, separators=(',', ':')).encode('utf-8')
+
+
+def year_bounds(days):
+    """(year, lo, hi) row slices of a sorted day column, one per calendar year"""
+    if not len(days):
+        return []
+    first = int(day_to_date(days[0])[:4])
+    last = int(day_to_date(days[-1])[:4])
+    years = np.arange(first, last + 2)
+    # January 1st of every year, as days since 1970-01-01
+    starts = (years - 1970).astype('datetime64[Y]').astype('datetime64[D]').astype(np.int64)
+    bounds = np.searchsorted(days, starts, 'left').tolist()
+    return [(int(year), lo, hi) for year, lo, hi in zip(years[:-1].tolist(), bounds, bounds[1:]) if hi > lo]
+
+
+def shard_payload(columns, year):
+    """The shard document of one game's rows of one year"""
+    numbers = columns.numbers.tolist()
+    if (np.asarray(columns.numbers) == NO_NUMBER).any():
+        numbers = [[n for n in row if n != NO_NUMBER] for row in numbers]
+    return {
+        "game": columns.game_name,
+        "game_type": columns.game_type,
+        "year": year,
+        "dates": columns.dates(),
+        "numbers": numbers,
+        "jackpot": columns.jackpot.tolist(),
+        "winners": columns.winners.tolist()
+    }
+
+
+def _write(path, data):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def write_shard(directory, prefix, body):
+    """
+    Write a shard and its compressed variants unless they already exist.
+    Returns (entry, bytes written).
+    """
+    digest = hashlib.sha256(body).hexdigest()
+    name = f"{prefix}.{digest[:HASH_LENGTH]}.json"
+    variants = {"file": (name, lambda: body), "gz": (name + ".gz", lambda: gzip.compress(body, 9, mtime=0))}
+    if brotli is not None:
+        variants["br"] = (name + ".br", lambda: brotli.compress(body, quality=11))
+
+    entry = {}
+    written = 0
+    for key, (filename, encode) in variants.items():
+        path = os.path.join(directory, filename)
+        if not os.path.exists(path):
+            data = encode()
+            _write(path, data)
+            written += len(data)
+        entry[key] = filename
+        entry["bytes" if key == "file" else f"{key}_bytes"] = os.path.getsize(path)
+    return entry, written
+
+
+def read_manifest(directory=EXPORT_DIR):
+    path = os.path.join(directory, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _shard_files(manifest):
+    files = set()
+    for shard in (manifest or {}).get("shards", []):
+        files.update(shard.get(key) for key in ("file", "gz", "br") if shard.get(key))
+    return files
+
+
+def export_static(store=None, directory=EXPORT_DIR, changed=None):
+    """
+    Write the shards and manifest for the column store. changed is
+    {game_type: days} of the draws written since the last export, or None
+    to serialize every shard.
+    Returns a summary dict; its changes list the manifest entries of every
+    (game, year) whose shard changed, as {"previous": ..., "shard": ...}
+    with None for a shard that is new or gone.
+    """
+    store = store or ColumnStore()
+    os.makedirs(directory, exist_ok=True)
+    previous = read_manifest(directory)
+    previous_shards = {(shard["game_type"], shard["year"]): shard for shard in (previous or {}).get("shards", [])}
+
+    shards = []
+    games = {}
+    written = 0
+    written_bytes = 0
+    for game_type in sorted(store.game_types()):
+        columns = store.load(game_type)
+        changed_years = None
+        if changed is not None and previous is not None:
+            changed_years = {int(day_to_date(day)[:4]) for day in changed.get(game_type, ())}
+        for year, lo, hi in year_bounds(columns.days):
+            kept = previous_shards.get((game_type, year))
+            if (changed_years is not None and year not in changed_years and kept is not None
+                    and kept["count"] == hi - lo and os.path.exists(os.path.join(directory, kept["file"]))):
+                shards.append(kept)
+                continue
+            rows = columns.take(slice(lo, hi))
+            entry, size = write_shard(directory, f"{game_dir_name(game_type)}.{year}",
+                                      _dumps(shard_payload(rows, year)))
+            written += size > 0
+            written_bytes += size
+            shards.append(dict({
+                "game_type": game_type,
+                "year": year,
+                "count": hi - lo,
+                "first_date": day_to_date(rows.days[0]),
+                "last_date": day_to_date(rows.days[-1]),
+                "jackpot_total": round(float(rows.jackpot.sum()), 2),
+                "winners_total": int(rows.winners.sum(dtype=np.int64))
+            }, **entry))
+
+        if len(columns):
+            games[game_type] = {
+                "game": columns.game_name,
+                "count": len(columns),
+                "first_date": day_to_date(columns.days[0]),
+                "last_date": day_to_date(columns.days[-1])
+            }
+
+    manifest = {
+        "generated_at": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "version": store_version(store.directory),
+        "total_results": sum(shard["count"] for shard in shards),
+        "date_range": {
+            "start": min((g["first_date"] for g in games.values()), default=None),
+            "end": max((g["last_date"] for g in games.values()), default=None)
+        },
+        "games": games,
+        "shards": shards
+    }
+    manifest_body = _dumps(manifest)
+    _write(os.path.join(directory, MANIFEST_FILE), manifest_body)
+
+    # Keep the shards of the current and the previous manifest only
+    keep = _shard_files(manifest) | _shard_files(previous) | {MANIFEST_FILE}
+    removed = 0
+    for name in os.listdir(directory):
+        if name not in keep and not name.endswith(".tmp"):
+            os.remove(os.path.join(directory, name))
+            removed += 1
+
+    # Shards added, replaced or dropped since the previous manifest
+    current = {(shard["game_type"], shard["year"]): shard for shard in shards}
+    changes = [
+        {"previous": previous_shards.get(key), "shard": current.get(key)}
+        for key in sorted(current.keys() | previous_shards.keys())
+        if (previous_shards.get(key) or {}).get("file") != (current.get(key) or {}).get("file")
+    ]
+
+    return {
+        "shards": len(shards),
+        "first_export": previous is None,
+        "changes": changes,
+        "written": written,
+        "written_bytes": written_bytes + len(manifest_body),
+        "removed": removed,
+        "bytes": sum(shard["bytes"] for shard in shards),
+        "gz_bytes": sum(shard["gz_bytes"] for shard in shards)
+    }
+
+
+def main():
+    started = time.perf_counter()
+    summary = export_static()
+    elapsed = time.perf_counter() - started
+    print(f"Exported {summary['shards']} shards to {EXPORT_DIR}/ in {elapsed:.2f}s "
+          f"({summary['written']} written, {summary['removed']} old files removed)")
+    print(f"  {summary['bytes']:,} bytes minified, {summary['gz_bytes']:,} bytes gzipped")
+
+
+if __name__ == "__main__":
+    main()
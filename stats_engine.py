@@ -0,0 +1,345 @@
+"""
+Statistics Engine
+Vectorized statistics for every game type, computed from the per-game draw
+matrices of the column store.
+
+Statistics are built in two steps. game_aggregate() reduces a draw matrix
+to count vectors (number and per-position frequencies, and histograms of
+evens per draw, sums, spreads, consecutive pairs and gaps) using
+np.bincount, plus a matrix of within-draw pair counts. Aggregates are plain
+sums, so aggregates of separate blocks of draws can be added together. render_game() turns an aggregate into the
+pcso_statistics.json entry for a game.
+"""
+import json
+import os
+from datetime import datetime
+
+import numpy as np
+
+from column_store import build_columns, day_to_date
+from draw_record import is_lotto_game, number_rule
+
+STATS_FILE = "pcso_statistics.json"
+
+# Draws are reduced in blocks to bound the size of temporaries
+CHUNK_ROWS = 1 << 20
+
+# Width of the buckets in the sum histogram of the JSON output
+SUM_BUCKET = 20
+
+# Number of most frequent pairs listed per lotto game
+TOP_PAIRS = 10
+
+# One-dimensional count vectors of an aggregate
+HISTOGRAM_KEYS = ("number_freq", "even_hist", "sum_hist", "spread_hist", "consecutive_hist", "gap_hist")
+
+# Every array of an aggregate; all have a fixed shape for a game and width
+ARRAY_KEYS = HISTOGRAM_KEYS + ("position_freq", "pair_freq")
+
+
+def max_number(game_type):
+    """
+    Largest number that can be drawn in a game
+    """
+    rule = number_rule(game_type)
+    return rule[2] if rule else 9
+
+
+def min_number(game_type):
+    rule = number_rule(game_type)
+    return rule[1] if rule else 0
+
+
+def _add(a, b):
+    """Element-wise sum of two vectors that may differ in length"""
+    if len(a) < len(b):
+        a, b = b, a
+    a = a.copy()
+    a[:len(b)] += b
+    return a
+
+
+def empty_aggregate(game_type, width):
+    top = max_number(game_type)
+    return {
+        "count": 0,
+        "width": width,
+        "number_freq": np.zeros(top + 1, np.int64),
+        "position_freq": np.zeros((width, top + 1), np.int64),
+        "even_hist": np.zeros(width + 1, np.int64),
+        "sum_hist": np.zeros(width * top + 1, np.int64),
+        "spread_hist": np.zeros(top + 1, np.int64),
+        "consecutive_hist": np.zeros(width, np.int64),
+        "gap_hist": np.zeros(top + 1, np.int64),
+        "pair_freq": np.zeros((top + 1, top + 1), np.int64),
+        "jackpot_sum": 0.0,
+        "winners_sum": 0,
+        "first_day": None,
+        "last_day": None
+    }
+
+
+def merge_aggregates(a, b):
+    """
+    Combine two aggregates of the same game
+    """
+    if a["width"] != b["width"]:
+        raise ValueError("Cannot merge aggregates of different draw widths")
+
+    days = [d for d in (a["first_day"], b["first_day"]) if d is not None]
+    last_days = [d for d in (a["last_day"], b["last_day"]) if d is not None]
+
+    merged = {"count": a["count"] + b["count"], "width": a["width"]}
+    for key in HISTOGRAM_KEYS:
+        merged[key] = _add(a[key], b[key])
+    merged["position_freq"] = a["position_freq"] + b["position_freq"]
+    merged["pair_freq"] = a["pair_freq"] + b["pair_freq"]
+    merged["jackpot_sum"] = a["jackpot_sum"] + b["jackpot_sum"]
+    merged["winners_sum"] = a["winners_sum"] + b["winners_sum"]
+    merged["first_day"] = min(days) if days else None
+    merged["last_day"] = max(last_days) if last_days else None
+    return merged
+
+
+def _sorted_columns(block):
+    """
+    The columns of a draws x k block sorted within each row.
+
+    Uses an odd-even transposition network of element-wise min/max, which
+    is much faster than np.sort(axis=1) for rows of a handful of numbers.
+    """
+    columns = [np.ascontiguousarray(block[:, i]) for i in range(block.shape[1])]
+    for step in range(len(columns)):
+        for i in range(step % 2, len(columns) - 1, 2):
+            a, b = columns[i], columns[i + 1]
+            columns[i], columns[i + 1] = np.minimum(a, b), np.maximum(a, b)
+    return columns
+
+
+def _pair_counts(columns, top):
+    """
+    Symmetric (top+1) x (top+1) matrix of how often two numbers were drawn
+    together, from row-sorted columns
+    """
+    size = top + 1
+    codes = []
+    for i, low in enumerate(columns):
+        base = low.astype(np.uint16) * size
+        codes.extend(base + high for high in columns[i + 1:])
+    upper = np.bincount(np.concatenate(codes), minlength=size * size).reshape(size, size)
+    # A number repeated within a draw (digit games) lands on the diagonal once
+    return upper + np.triu(upper, 1).T
+
+
+def game_aggregate(game_type, numbers, days=None, jackpot=None, winners=None):
+    """
+    Reduce a draws x k number matrix (plus optional columns) to an aggregate
+    """
+    numbers = np.asarray(numbers)
+    if numbers.ndim != 2:
+        numbers = numbers.reshape(len(numbers), -1)
+    width = numbers.shape[1]
+    aggregate = empty_aggregate(game_type, width)
+    top = max_number(game_type)
+    lotto = is_lotto_game(game_type)
+
+    for start in range(0, len(numbers), CHUNK_ROWS):
+        block = np.asarray(numbers[start:start + CHUNK_ROWS], dtype=np.uint8)
+        if not len(block):
+            continue
+
+        # Every draw is counted; rows padded with NO_NUMBER (or holding a
+        # number above the game's range) are left out of the shape histograms
+        aggregate["count"] += len(block)
+        if block.max() > top:
+            values = block[block <= top]
+            aggregate["number_freq"] += np.bincount(values, minlength=top + 1)
+            block = block[(block <= top).all(axis=1)]
+        else:
+            aggregate["number_freq"] += np.bincount(block.ravel(), minlength=top + 1)
+
+        if not len(block):
+            continue
+
+        for position in range(width):
+            aggregate["position_freq"][position] += np.bincount(block[:, position], minlength=top + 1)
+
+        odd = (block & 1).sum(axis=1, dtype=np.uint8)
+        aggregate["even_hist"] += np.bincount(width - odd, minlength=width + 1)
+        aggregate["sum_hist"] += np.bincount(block.sum(axis=1, dtype=np.int32), minlength=width * top + 1)
+
+        columns = _sorted_columns(block)
+        aggregate["spread_hist"] += np.bincount(columns[-1] - columns[0], minlength=top + 1)
+
+        if width > 1:
+            aggregate["pair_freq"] += _pair_counts(columns, top)
+
+        if lotto and width > 1:
+            consecutive = np.zeros(len(block), np.uint8)
+            for low, high in zip(columns, columns[1:]):
+                gaps = high - low
+                consecutive += gaps == 1
+                aggregate["gap_hist"] += np.bincount(gaps, minlength=top + 1)
+            aggregate["consecutive_hist"] += np.bincount(consecutive, minlength=width)
+
+    if jackpot is not None:
+        aggregate["jackpot_sum"] = float(np.sum(jackpot, dtype=np.float64))
+    if winners is not None:
+        aggregate["winners_sum"] = int(np.sum(winners, dtype=np.int64))
+    if days is not None and len(days):
+        aggregate["first_day"] = int(days[0])
+        aggregate["last_day"] = int(days[-1])
+
+    return aggregate
+
+
+def columns_aggregate(columns):
+    """
+    Aggregate of a GameColumns (memory-mapped or in memory)
+    """
+    return game_aggregate(columns.game_type, columns.numbers, columns.days, columns.jackpot, columns.winners)
+
+
+def _histogram_summary(hist):
+    nonzero = np.flatnonzero(hist)
+    total = int(hist.sum())
+    if not total:
+        return {"min": None, "max": None, "mean": None}
+    return {
+        "min": int(nonzero[0]),
+        "max": int(nonzero[-1]),
+        "mean": round(float((np.arange(len(hist)) * hist).sum()) / total, 2)
+    }
+
+
+def top_pairs(pair_freq, limit=TOP_PAIRS):
+    """
+    The most frequent pairs of distinct numbers, most frequent first
+    """
+    upper = np.triu(pair_freq, 1)
+    flat = upper.ravel()
+    order = np.argsort(-flat, kind='stable')[:limit]
+    size = len(pair_freq)
+    return [
+        {"pair": [int(i // size), int(i % size)], "count": int(flat[i])}
+        for i in order if flat[i]
+    ]
+
+
+def render_game(game_type, game_name, aggregate):
+    """
+    The pcso_statistics.json entry for one game
+    """
+    top = max_number(game_type)
+    low = min_number(game_type)
+    freq = aggregate["number_freq"]
+    numbers = np.arange(len(freq))
+    width = aggregate["width"]
+
+    # Most frequent first, like the original output; ties by number
+    order = sorted((n for n in range(low, top + 1) if freq[n]), key=lambda n: (-int(freq[n]), n))
+    entry = {
+        "count": aggregate["count"],
+        "game_name": game_name,
+        "number_frequency": {str(n): int(freq[n]) for n in order}
+    }
+
+    even = int(freq[numbers % 2 == 0].sum())
+    entry["even_odd"] = {
+        "even": even,
+        "odd": int(freq.sum()) - even,
+        "patterns": {
+            f"{e}E-{width - e}O": int(aggregate["even_hist"][e]) for e in range(width, -1, -1)
+        }
+    }
+
+    third = top // 3
+    entry["range_distribution"] = {
+        "low": int(freq[:third + 1].sum()),
+        "mid": int(freq[third + 1:2 * third + 1].sum()),
+        "high": int(freq[2 * third + 1:].sum())
+    }
+
+    entry["last_digit"] = {str(d): int(freq[numbers % 10 == d].sum()) for d in range(10)}
+
+    sum_hist = aggregate["sum_hist"]
+    sums = _histogram_summary(sum_hist)
+    buckets = {}
+    if sums["min"] is not None:
+        for start in range(sums["min"] // SUM_BUCKET * SUM_BUCKET, sums["max"] + 1, SUM_BUCKET):
+            buckets[f"{start}-{start + SUM_BUCKET - 1}"] = int(sum_hist[start:start + SUM_BUCKET].sum())
+    entry["sum"] = dict(sums, histogram=buckets)
+
+    entry["spread"] = _histogram_summary(aggregate["spread_hist"])
+
+    if is_lotto_game(game_type):
+        consecutive = aggregate["consecutive_hist"]
+        entry["consecutive"] = {str(c): int(consecutive[c]) for c in range(min(4, len(consecutive)))}
+        entry["consecutive"]["4+"] = int(consecutive[4:].sum())
+        gaps = aggregate["gap_hist"]
+        entry["gap_frequency"] = {str(g): int(gaps[g]) for g in np.flatnonzero(gaps)}
+        entry["top_pairs"] = top_pairs(aggregate["pair_freq"])
+    else:
+        entry["position_frequency"] = [
+            {str(n): int(row[n]) for n in range(low, top + 1)}
+            for row in aggregate["position_freq"]
+        ]
+
+    entry["jackpot_total"] = aggregate["jackpot_sum"]
+    entry["winners_total"] = aggregate["winners_sum"]
+    entry["first_date"] = day_to_date(aggregate["first_day"]) if aggregate["first_day"] is not None else None
+    entry["last_date"] = day_to_date(aggregate["last_day"]) if aggregate["last_day"] is not None else None
+    return entry
+
+
+def render_statistics(aggregates, game_names):
+    """
+    Assemble the full statistics document from per-game aggregates
+    """
+    stats = {
+        "by_game": {},
+        "total_draws": 0,
+        "date_range": {
+            "start": None,
+            "end": None
+        },
+        "generated_at": datetime.now().isoformat()
+    }
+
+    for game_type in sorted(aggregates):
+        entry = render_game(game_type, game_names[game_type], aggregates[game_type])
+        stats["by_game"][game_type] = entry
+        stats["total_draws"] += entry["count"]
+
+        if entry["first_date"] and (stats["date_range"]["start"] is None or entry["first_date"] < stats["date_range"]["start"]):
+            stats["date_range"]["start"] = entry["first_date"]
+        if entry["last_date"] and (stats["date_range"]["end"] is None or entry["last_date"] > stats["date_range"]["end"]):
+            stats["date_range"]["end"] = entry["last_date"]
+
+    return stats
+
+
+def compute_statistics(games):
+    """
+    Statistics for a {game_type: GameColumns} mapping
+    """
+    aggregates = {game_type: columns_aggregate(columns) for game_type, columns in games.items()}
+    names = {game_type: columns.game_name for game_type, columns in games.items()}
+    return render_statistics(aggregates, names)
+
+
+def statistics_from_results(results):
+    """
+    Statistics for an iterable of result dicts
+    """
+    return compute_statistics(build_columns(results))
+
+
+def write_statistics(stats, filename=STATS_FILE):
+    """
+    Write the statistics file atomically
+    """
+    tmp_filename = f"{filename}.{os.getpid()}.tmp"
+    with open(tmp_filename, 'w') as f:
+        json.dump(stats, f, indent=2)
+    os.replace(tmp_filename, filename)
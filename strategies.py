@@ -0,0 +1,185 @@
+"""
+Prediction Strategies
+Python ports of the dashboard's prediction models (predictByFrequency,
+predictByHotCold, predictByPattern, predictByWeighted, predictByMarkov,
+predictByNeural, generateBalanced and generateRandom), so they can be
+scored against history.
+
+Every strategy takes a PriorDraws, the draws before the one being
+predicted, and a numpy Generator for its random choices, and returns six
+sorted numbers. PriorDraws keeps the counts the strategies need (total and
+recent-window frequencies, recency-weighted counts, draw-to-draw
+transitions) and updates them one draw at a time, so walking forward
+through history never re-reads it.
+
+The dashboard code treats gameData[0] as the most recent draw, so "recent"
+here means the latest draws before the predicted one. Ties in a ranking go
+to the smaller number, as in the dashboard's sort of Object.entries.
+
+One deliberate difference: the Markov transitions run forward in time.
+Read with gameData[0] as the newest draw, the dashboard's loop counts each
+draw followed by the one before it; here a draw is followed by the next
+one, as in cooccurrence.py's matrix that the dashboard now asks the server
+for.
+"""
+import numpy as np
+
+PICKS = 6
+
+# Draws in the dashboard's recent windows: hot/cold, pattern and neural
+HOT_WINDOW = 20
+PATTERN_WINDOW = 50
+NEURAL_WINDOW = 100
+
+NEURAL_NOISE = 0.3
+
+# 1/k as a sum of exponential decays: the trapezoidal rule on the integral of
+# exp(u - k e^u) over u. Within 1e-11 of 1/k for k up to 300000.
+_RECENCY_STEP = 0.3
+_RECENCY_U = np.arange(-40.0, 4.0, _RECENCY_STEP)
+_RECENCY_DECAY = np.exp(-np.exp(_RECENCY_U))
+_RECENCY_WEIGHTS = _RECENCY_STEP * np.exp(_RECENCY_U)
+
+
+class PriorDraws:
+    """
+    Running state of the draws of one game seen so far
+    """
+
+    WINDOWS = (HOT_WINDOW, PATTERN_WINDOW, NEURAL_WINDOW)
+
+    def __init__(self, top, capacity=1024):
+        self.top = top
+        self.count = 0
+        self.onehot = np.zeros((capacity, top + 1), np.float64)
+        self.frequency = np.zeros(top + 1, np.int64)
+        self.recent = {window: np.zeros(top + 1, np.int64) for window in self.WINDOWS}
+        self.transitions = np.zeros((top + 1, top + 1), np.int64)
+        self.last = np.zeros(0, np.int64)
+        # Counts decayed at each of the _RECENCY_DECAY rates, once weighted() is used
+        self.decayed = None
+
+    def add(self, numbers):
+        """Record the next draw"""
+        numbers = np.asarray(numbers, dtype=np.int64)
+        numbers = numbers[(numbers >= 1) & (numbers <= self.top)]
+
+        row = self.count
+        if row == len(self.onehot):
+            self.onehot = np.concatenate((self.onehot, np.zeros_like(self.onehot)))
+        self.onehot[row, numbers] = 1
+
+        self.frequency[numbers] += 1
+        for window, counts in self.recent.items():
+            counts[numbers] += 1
+            if row >= window:
+                counts -= self.onehot[row - window].astype(np.int64)
+        if row:
+            self.transitions[np.ix_(self.last, numbers)] += 1
+        if self.decayed is not None:
+            self.decayed[:, numbers] += 1
+            self.decayed *= _RECENCY_DECAY[:, None]
+
+        self.last = numbers
+        self.count += 1
+
+    def weighted(self):
+        """
+        Recency scores: the draw k back counts 1 / k. The decayed counts are
+        updated by add(), so a score costs the same at any history length.
+        """
+        if self.decayed is None:
+            back = np.arange(self.count, 0, -1)
+            self.decayed = (_RECENCY_DECAY[:, None] ** back) @ self.onehot[:self.count]
+        return _RECENCY_WEIGHTS @ self.decayed
+
+
+def _ranked(scores, k, drawn):
+    """The k highest-scoring numbers among drawn, ties to the smaller number"""
+    numbers = np.flatnonzero(drawn)
+    order = np.lexsort((numbers, -scores[numbers]))
+    return numbers[order[:k]].tolist()
+
+
+def _fill(picks, top, rng):
+    """Add random numbers until there are six, like the dashboard's while loops"""
+    picks = dict.fromkeys(picks)
+    while len(picks) < PICKS:
+        picks[int(rng.integers(1, top + 1))] = None
+    return sorted(list(picks)[:PICKS])
+
+
+def predict_by_frequency(prior, rng):
+    return sorted(_ranked(prior.frequency, PICKS, prior.frequency > 0))
+
+
+def predict_by_hot_cold(prior, rng):
+    """Four most frequent of the last 20 draws and two others drawn there at most twice"""
+    recent = prior.recent[HOT_WINDOW]
+    hot = _ranked(recent, 4, recent > 0)
+    cold = np.setdiff1d(np.flatnonzero(recent[1:] <= 2) + 1, hot)
+    picks = rng.choice(cold, min(2, len(cold)), replace=False).tolist()
+    return sorted(hot + picks)
+
+
+def predict_by_pattern(prior, rng):
+    """Random numbers with the even/odd split of the last 50 draws"""
+    recent = prior.recent[PATTERN_WINDOW]
+    even = int(recent[2::2].sum())
+    odd = int(recent[1::2].sum())
+    # Math.round rounds halves up
+    target_even = int(np.floor(PICKS * even / (even + odd) + 0.5)) if even + odd else PICKS // 2
+
+    numbers = np.arange(1, prior.top + 1)
+    evens = rng.choice(numbers[1::2], target_even, replace=False)
+    odds = rng.choice(numbers[0::2], PICKS - target_even, replace=False)
+    return sorted(evens.tolist() + odds.tolist())
+
+
+def predict_by_weighted(prior, rng):
+    return sorted(_ranked(prior.weighted(), PICKS, prior.frequency > 0))
+
+
+def predict_by_markov(prior, rng):
+    """
+    The two most frequent successors of each number of the last draw, where
+    the successors of a draw are the numbers of the draw after it in time
+    (not the newer-to-older order of the dashboard's own loop)
+    """
+    picks = []
+    for number in prior.last.tolist():
+        successors = prior.transitions[number]
+        picks.extend(_ranked(successors, 2, successors > 0))
+    return _fill(picks, prior.top, rng)
+
+
+def predict_by_neural(prior, rng):
+    """Frequency in the last 100 draws plus up to 0.3 of noise"""
+    recent = prior.recent[NEURAL_WINDOW]
+    draws = min(NEURAL_WINDOW, prior.count)
+    scores = recent / max(draws, 1) + rng.random(len(recent)) * NEURAL_NOISE
+    return sorted(_ranked(scores, PICKS, recent > 0))
+
+
+def generate_balanced(prior, rng):
+    """One number from each third of the range, then three more at random"""
+    third = prior.top // 3
+    picks = [int(rng.integers(0, third)) + 1 + i * third for i in range(3)]
+    return _fill(picks, prior.top, rng)
+
+
+def generate_random(prior, rng):
+    return _fill([], prior.top, rng)
+
+
+# Keyed like the dashboard's model selector and calculateConfidence methods
+STRATEGIES = {
+    "frequency": predict_by_frequency,
+    "hotcold": predict_by_hot_cold,
+    "pattern": predict_by_pattern,
+    "weighted": predict_by_weighted,
+    "markov": predict_by_markov,
+    "neural": predict_by_neural,
+    "balanced": generate_balanced,
+    "random": generate_random
+}
@@ -0,0 +1,149 @@
+"""
+Synthetic Draw History
+Seeded, vectorized generator of fake PCSO results for benchmarks, demos
+and the fetcher's sample fallback.
+
+Every game follows the weekly schedule and the number, jackpot and winner
+ranges of the sample data. A game's draw days are a mask over a day range
+and all of its numbers are drawn in one NumPy call, so a century of every
+game takes well under a second; the same seed and date range always give
+the same history.
+
+Usage: python synthetic_history.py [--years N] [--end YYYY-MM-DD] [--seed N] [--output FILE]
+
+The CSV output has the Game,Numbers,Date,Jackpot,Winners columns that
+import_csv.py reads.
+"""
+import argparse
+from datetime import date, timedelta
+
+import numpy as np
+
+from column_store import GameColumns, date_to_day, day_to_date
+
+SEED = 20240101
+END_DATE = "2025-12-31"
+
+# game, game_type, draw weekdays (Monday = 0, None = daily), numbers per
+# draw, lowest and highest number, pick-six without repeats, jackpot range,
+# most winners
+GAMES = (
+    ("Ultra Lotto 6/58", "6/58", (0, 2, 4, 5), 6, 1, 58, True, (50000000, 1000000000), 3),
+    ("Grand Lotto 6/55", "6/55", (0, 2, 5), 6, 1, 55, True, (30000000, 500000000), 5),
+    ("Super Lotto 6/49", "6/49", (1, 3, 6), 6, 1, 49, True, (16000000, 300000000), 8),
+    ("Mega Lotto 6/45", "6/45", (0, 2, 4), 6, 1, 45, True, (9000000, 100000000), 10),
+    ("Lotto 6/42", "6/42", (1, 3, 5), 6, 1, 42, True, (6000000, 50000000), 12),
+    ("4D Lotto", "4D", None, 4, 0, 9, False, (10000, 10000), 50),
+    ("3D Lotto", "3D", None, 3, 0, 9, False, (4500, 4500), 100),
+    ("2D Lotto", "2D", None, 2, 1, 31, False, (4000, 4000), 200)
+)
+
+
+def draw_days(first_day, last_day, weekdays=None):
+    """Days since 1970-01-01 in [first_day, last_day] that fall on weekdays"""
+    days = np.arange(first_day, last_day + 1, dtype=np.int32)
+    if weekdays is None:
+        return days
+    # 1970-01-01 was a Thursday
+    return days[np.isin((days + 3) % 7, weekdays)]
+
+
+def _unique_numbers(rng, rows, count, lowest, highest):
+    """
+    rows x count numbers without repeats inside a row, sorted like the
+    sample data. Rows with a repeat are redrawn until none is left.
+    """
+    numbers = np.sort(rng.integers(lowest, highest + 1, size=(rows, count), dtype=np.uint8), axis=1)
+    repeats = (numbers[:, 1:] == numbers[:, :-1]).any(axis=1)
+    while repeats.any():
+        redrawn = rng.integers(lowest, highest + 1, size=(int(repeats.sum()), count), dtype=np.uint8)
+        numbers[repeats] = np.sort(redrawn, axis=1)
+        repeats = (numbers[:, 1:] == numbers[:, :-1]).any(axis=1)
+    return numbers
+
+
+def synthetic_columns(start_date, end_date, seed=SEED):
+    """
+    {game_type: GameColumns} of every game drawn between start_date and
+    end_date (YYYY-MM-DD, both included). seed=None draws a fresh history.
+    """
+    rng = np.random.default_rng(seed)
+    first_day, last_day = date_to_day(start_date), date_to_day(end_date)
+
+    games = {}
+    for game, game_type, weekdays, count, lowest, highest, unique, jackpot, winners in GAMES:
+        days = draw_days(first_day, last_day, weekdays)
+        rows = len(days)
+        if unique:
+            numbers = _unique_numbers(rng, rows, count, lowest, highest)
+        else:
+            numbers = rng.integers(lowest, highest + 1, size=(rows, count), dtype=np.uint8)
+        games[game_type] = GameColumns(
+            game_type, game, numbers, days,
+            rng.integers(jackpot[0], jackpot[1] + 1, size=rows).astype(np.float64),
+            rng.integers(0, winners + 1, size=rows, dtype=np.int32)
+        )
+    return games
+
+
+def history(years, seed=SEED, end_date=END_DATE):
+    """Synthetic columns for the `years` years up to end_date"""
+    end = date.fromisoformat(end_date)
+    start = end - timedelta(days=round(years * 365.2425) - 1)
+    return synthetic_columns(start.isoformat(), end_date, seed)
+
+
+def synthetic_results(start_date, end_date, seed=SEED):
+    """Result dicts of synthetic_columns, ordered by date and then game"""
+    results = []
+    for columns in synthetic_columns(start_date, end_date, seed).values():
+        results.extend(columns.results())
+    order = {game_type: i for i, (_, game_type, *_) in enumerate(GAMES)}
+    results.sort(key=lambda r: (r["date"], order[r["game_type"]]))
+    return results
+
+
+def write_csv(games, filename):
+    """
+    Write the draws in the import_csv.py format, one game after the other.
+    Returns the number of rows written.
+    """
+    rows = 0
+    with open(filename, 'w', encoding='utf-8', newline='') as f:
+        f.write("Game,Numbers,Date,Jackpot,Winners\n")
+        for columns in games.values():
+            if not len(columns):
+                continue
+            first = int(columns.days[0])
+            # MM/DD/YYYY of every day in the game's range and the padded
+            # text of every number, looked up instead of formatted per row
+            dates = [date.fromisoformat(day_to_date(day)).strftime('%m/%d/%Y')
+                     for day in range(first, int(columns.days[-1]) + 1)]
+            width = 2 if columns.numbers.max(initial=0) > 9 else 1
+            text = [f"{n:0{width}d}" for n in range(256)]
+            f.writelines(
+                f"{columns.game_name},{'-'.join([text[n] for n in numbers])},{dates[day - first]},{jackpot:.2f},{winners}\n"
+                for numbers, day, jackpot, winners in zip(columns.numbers.tolist(), columns.days.tolist(),
+                                                          columns.jackpot.tolist(), columns.winners.tolist())
+            )
+            rows += len(columns)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a seeded synthetic PCSO draw history as CSV")
+    parser.add_argument('--years', type=float, default=10)
+    parser.add_argument('--end', default=END_DATE, help="last draw date, YYYY-MM-DD")
+    parser.add_argument('--seed', type=int, default=SEED)
+    parser.add_argument('--output', default="synthetic_history.csv")
+    args = parser.parse_args()
+
+    games = history(args.years, args.seed, args.end)
+    rows = write_csv(games, args.output)
+    print(f"{rows:,} draws of {len(games)} games written to {args.output}")
+    for game_type, columns in games.items():
+        print(f"  {game_type}: {len(columns):,} draws")
+
+
+if __name__ == "__main__":
+    main()
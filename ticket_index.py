@@ -0,0 +1,215 @@
+"""
+Ticket Check Index
+Bulk "was this combination, or part of it, ever drawn?" checks for the 6/xx
+games.
+
+Each draw is stored as a uint64 with bit n set for every number n drawn, so
+the numbers a ticket shares with a draw are ticket_mask & draw_mask and the
+match count is its popcount.
+
+For bulk checks the mask column is also kept transposed: one bitset over
+the draws per number, 64 draws per word. A block of tickets gathers the
+bitsets of its numbers and adds them with a bit-sliced counter (three
+words of count bits per 64 draws), so every ticket is compared with every
+draw in about thirty word operations per 64 draws. Match counts per level
+are popcounts of the counter bits; only draws with enough matches are
+expanded, and their match counts come from AND + popcount of the masks.
+
+Indexes are built from the column store once per store version.
+"""
+import numpy as np
+
+from column_store import day_to_date
+from draw_index import QueryCache
+from draw_record import is_lotto_game, number_rule
+from stats_engine import max_number
+
+MAX_TICKETS = 20000
+
+# Match counts reported per ticket
+LEVELS = (3, 4, 5, 6)
+
+# Draws with at least this many matches are listed per ticket, newest first
+MIN_MATCHES = 4
+MAX_DATES = 50
+
+# Tickets per block; bounds the tickets x words temporaries
+BLOCK_TICKETS = 2048
+
+
+def number_masks(numbers, top):
+    """uint64 bitmask per row of numbers; numbers above top are ignored"""
+    numbers = np.asarray(numbers, dtype=np.uint64)
+    bits = np.where(numbers <= top, np.uint64(1) << np.minimum(numbers, np.uint64(63)), np.uint64(0))
+    return np.bitwise_or.reduce(bits, axis=1) if bits.shape[1] else np.zeros(len(bits), np.uint64)
+
+
+def draw_bitsets(masks, top):
+    """(top + 1) x words uint64: bit d of row n is set if draw d has number n"""
+    bits = (masks[None, :] >> np.arange(top + 1, dtype=np.uint64)[:, None]) & np.uint64(1)
+    words = (len(masks) + 63) // 64
+    packed = np.zeros((top + 1, words * 8), np.uint8)
+    packed[:, :(len(masks) + 7) // 8] = np.packbits(bits.astype(bool), axis=1, bitorder='little')
+    return packed.view(np.uint64)
+
+
+def _whole_number(n):
+    """int of 7, 7.0 or "7"; ValueError for 1.5 or "7.9" instead of truncating"""
+    if isinstance(n, str):
+        return int(n)
+    value = int(n)
+    if value != n:
+        raise ValueError(f"not a whole number: {n!r}")
+    return value
+
+
+class TicketIndex:
+    """
+    Draw masks of one 6/xx game in date order, and their per-number bitsets
+    """
+
+    def __init__(self, game_type, days, masks):
+        self.game_type = game_type
+        self.days = days
+        self.masks = masks
+        self.bitsets = draw_bitsets(masks, max_number(game_type))
+        self.dates = [day_to_date(day) for day in days.tolist()]
+
+    @classmethod
+    def build(cls, columns):
+        top = max_number(columns.game_type)
+        return cls(columns.game_type, np.asarray(columns.days), number_masks(columns.numbers, top))
+
+    def ticket_numbers(self, tickets):
+        """
+        Validate tickets (lists of distinct numbers) as a tickets x k matrix
+        padded with 0. Numbers that are not whole are rejected, not truncated.
+        """
+        top = max_number(self.game_type)
+        try:
+            rows = np.array(tickets)
+        except ValueError:
+            # Tickets of different lengths
+            rows = None
+        if rows is not None and rows.ndim == 2 and rows.dtype.kind in 'iu':
+            rows = rows.astype(np.int64)
+        else:
+            # Ragged, or floats and strings that have to be checked one by one
+            width = max((len(ticket) for ticket in tickets), default=0)
+            rows = np.zeros((len(tickets), width), np.int64)
+            for i, ticket in enumerate(tickets):
+                try:
+                    rows[i, :len(ticket)] = [_whole_number(n) for n in ticket]
+                except (TypeError, ValueError, OverflowError):
+                    raise ValueError(f"Ticket {i} must be distinct numbers from 1 to {top}") from None
+
+        ordered = np.sort(rows, axis=1)
+        sizes = (ordered > 0).sum(axis=1)
+        valid = ((ordered == 0) | (ordered <= top)).all(axis=1) & (sizes > 0)
+        # Padding zeros sort first; the numbers after them must be increasing
+        valid &= ((np.diff(ordered, axis=1) > 0) | (ordered[:, :-1] == 0)).all(axis=1)
+        valid &= (rows >= 0).all(axis=1) & (sizes == [len(ticket) for ticket in tickets])
+        if not valid.all():
+            raise ValueError(f"Ticket {int(np.argmin(valid))} must be distinct numbers from 1 to {top}")
+        return rows
+
+    def _counters(self, numbers):
+        """Bit-sliced match counts (ones, twos, fours) of a block of tickets"""
+        ones = np.zeros((len(numbers), self.bitsets.shape[1]), np.uint64)
+        twos = np.zeros_like(ones)
+        fours = np.zeros_like(ones)
+        # Number 0 is never drawn, so padding adds nothing
+        for position in range(numbers.shape[1]):
+            plane = self.bitsets[numbers[:, position]]
+            carry = ones & plane
+            ones ^= plane
+            carry_two = twos & carry
+            twos ^= carry
+            # A draw has six numbers, so a count never reaches eight
+            fours |= carry_two
+        return ones, twos, fours
+
+    def check(self, tickets, min_matches=MIN_MATCHES, max_dates=MAX_DATES):
+        """
+        Per ticket, in request order: the best match, how many draws matched
+        each of LEVELS numbers and the newest max_dates draws with at least
+        min_matches, as [date, matched] pairs
+        """
+        numbers = self.ticket_numbers(tickets)
+        masks = number_masks(numbers, max_number(self.game_type)) & ~np.uint64(1)
+        best = np.zeros(len(numbers), np.int64)
+        level_counts = np.zeros((len(numbers), len(LEVELS)), np.int64)
+        hit_rows, hit_draws = [], []
+
+        for start in range(0, len(numbers), BLOCK_TICKETS):
+            ones, twos, fours = self._counters(numbers[start:start + BLOCK_TICKETS])
+            exact = {
+                3: ones & twos & ~fours,
+                4: ~ones & ~twos & fours,
+                5: ones & ~twos & fours,
+                6: ~ones & twos & fours
+            }
+            block = slice(start, start + len(ones))
+            for j, level in enumerate(LEVELS):
+                level_counts[block, j] = np.bitwise_count(exact[level]).sum(axis=1)
+
+            # Below three matches, twos can only mean exactly two
+            below = np.where(twos.any(axis=1), 2, np.where(ones.any(axis=1), 1, 0))
+            highest = np.where(level_counts[block] > 0, np.array(LEVELS), 0).max(axis=1)
+            best[block] = np.maximum(highest, below)
+
+            wanted = exact[min_matches]
+            for level in range(min_matches + 1, 7):
+                wanted = wanted | exact[level]
+            # Only words that can hold one of a ticket's newest max_dates hits are expanded
+            per_word = np.bitwise_count(wanted).astype(np.int64)
+            newer = np.cumsum(per_word[:, ::-1], axis=1)[:, ::-1] - per_word
+            wanted[newer >= max_dates] = 0
+            rows, words = np.nonzero(wanted)
+            bits = np.unpackbits(wanted[rows, words].view(np.uint8).reshape(-1, 8), axis=1, bitorder='little')
+            which, bit = np.nonzero(bits)
+            hit_rows.append(rows[which] + start)
+            hit_draws.append(words[which] * 64 + bit)
+
+        rows = np.concatenate(hit_rows) if hit_rows else np.zeros(0, np.int64)
+        draws = np.concatenate(hit_draws) if hit_draws else np.zeros(0, np.int64)
+        # Group hits by ticket, newest draw first, and keep max_dates per ticket
+        order = np.lexsort((-draws, rows))
+        rows, draws = rows[order], draws[order]
+        bounds = np.searchsorted(rows, np.arange(len(numbers) + 1))
+        keep = np.arange(len(rows)) - bounds[rows] < max_dates
+        rows, draws = rows[keep], draws[keep]
+        counts = np.bitwise_count(masks[rows] & self.masks[draws]).tolist()
+        bounds = np.searchsorted(rows, np.arange(len(numbers) + 1)).tolist()
+
+        dates = self.dates
+        hits = [[dates[d], c] for d, c in zip(draws.tolist(), counts)]
+        return {
+            "levels": list(LEVELS),
+            "best": best.tolist(),
+            "counts": level_counts.tolist(),
+            "draws": [hits[lo:hi] for lo, hi in zip(bounds, bounds[1:])]
+        }
+
+
+def _ticket_index(index, game_type):
+    if not is_lotto_game(game_type):
+        raise ValueError("Tickets can only be checked for the 6/xx lotto games")
+    if game_type not in index.games:
+        raise ValueError(f"No draws for {game_type}")
+    return TicketIndex.build(index.games[game_type])
+
+
+ticket_indexes = QueryCache(_ticket_index, 16)
+
+
+def check_tickets(index, game_type, tickets, min_matches=MIN_MATCHES, max_dates=MAX_DATES):
+    """Check a batch of tickets against every draw of a game"""
+    if not isinstance(game_type, str) or number_rule(game_type) is None:
+        raise ValueError("game must be a game type such as 6/58")
+    if len(tickets) > MAX_TICKETS:
+        raise ValueError(f"At most {MAX_TICKETS} tickets per request")
+    if min_matches not in LEVELS:
+        raise ValueError(f"min_matches must be between {LEVELS[0]} and {LEVELS[-1]}")
+    ticket_index = ticket_indexes.get(index, game_type)
+    return dict(ticket_index.check(tickets, min_matches, max_dates), draws_checked=len(ticket_index.days))